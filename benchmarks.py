@@ -0,0 +1,241 @@
+"""
+Benchmarks for the database layer.
+
+Every benchmark builds its own database in a temporary directory, so the
+application's hr_system.db is never touched:
+
+    python benchmarks.py            # run every benchmark
+    python benchmarks.py search     # run one benchmark
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import database
+
+FIRST_NAMES = ["Ahmed", "Mohammed", "Sara", "Fatima", "Omar", "Layla", "Khalid", "Noura", "Yousef", "Huda",
+               "أحمد", "محمد", "سارة", "فاطمة", "عمر", "ليلى", "خالد", "نورة", "يوسف", "هدى"]
+LAST_NAMES = ["Salem", "Haddad", "Nasser", "Qasim", "Rahman", "Saleh", "Mansour", "Zaid",
+              "سالم", "حداد", "ناصر", "قاسم", "الرحمن", "صالح", "منصور", "زيد"]
+POSITIONS = ["Engineer", "Accountant", "Driver", "Clerk", "Manager", "Technician", "مهندس", "محاسب", "سائق"]
+DEPARTMENTS = ["Finance", "Operations", "IT", "Sales", "HR", "المالية", "العمليات", "المبيعات"]
+
+
+def _scratch_database(directory):
+    """Point the database module at a new file in directory and return its manager."""
+    database.close_connections()
+    database.DB_NAME = os.path.join(directory, "benchmark.db")
+    database.init_db()
+    return database.get_manager()
+
+
+def _timed(fn, repeat):
+    """Run fn repeat times and return (milliseconds per call, last result)."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) * 1000 / repeat, result
+
+
+def _fill_employees(manager, count, rng):
+    rows = []
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        rows.append((f"{first} {rng.choice(FIRST_NAMES)} {last}", rng.choice(POSITIONS),
+                     f"{first.lower()}.{i}@example.com", f"05{rng.randrange(10 ** 8):08d}",
+                     f"E{i:06d}", rng.choice(DEPARTMENTS)))
+    manager.executemany(
+        "INSERT INTO employees (full_name, position, email, phone, employee_code, department) "
+        "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def bench_search(employees=50000, repeat=20):
+    """FTS5 prefix search against the LIKE scan it replaced."""
+    terms = ["ahm", "sara nas", "engineer", "E01234", "0555", "محمد", "مهندس"]
+    with tempfile.TemporaryDirectory() as directory:
+        manager = _scratch_database(directory)
+        _fill_employees(manager, employees, random.Random(12))
+        print(f"\nEmployee search, {employees} employees, {repeat} runs per term")
+        if not database.has_employee_search_index(manager):
+            print("  FTS5 is not available in this SQLite build; only LIKE can be measured")
+        print(f"  {'term':<12}{'LIKE ms':>10}{'rows':>8}{'FTS5 ms':>10}{'rows':>8}")
+        for term in terms:
+            like_ms, like_rows = _timed(lambda: database.search_employees(term, manager, use_index=False), repeat)
+            line = f"  {term:<12}{like_ms:>10.2f}{len(like_rows):>8}"
+            if database.has_employee_search_index(manager):
+                fts_ms, fts_rows = _timed(lambda: database.search_employees(term, manager, use_index=True), repeat)
+                line += f"{fts_ms:>10.2f}{len(fts_rows):>8}"
+            print(line)
+        database.close_connections()
+
+
+def _legacy_hours_and_status(check_in, check_out):
+    """Per-row strptime parsing that attendance screens did before the minute columns."""
+    hours, status = "غير محدد", "غائب"
+    if check_in and check_out:
+        try:
+            in_time = datetime.strptime(check_in, "%H:%M")
+            out_time = datetime.strptime(check_out, "%H:%M")
+            if out_time < in_time:
+                out_time += timedelta(days=1)
+            hours = f"{(out_time - in_time).total_seconds() / 3600:.2f} ساعة"
+        except ValueError:
+            hours = "خطأ في الحساب"
+    if check_in:
+        try:
+            late = datetime.strptime(check_in, "%H:%M") > datetime.strptime("08:00", "%H:%M")
+            status = "متأخر" if late else ("حاضر" if check_out else "لم ينصرف")
+        except ValueError:
+            status = "خطأ"
+    return hours, status
+
+
+def _fill_attendance(manager, rows, employees, rng):
+    """Insert rows attendance records spread over employees; returns (first date, last date)."""
+    days = -(-rows // employees)
+    first = date(2020, 1, 1)
+
+    def records():
+        written = 0
+        for day in range(days):
+            day_text = (first + timedelta(days=day)).isoformat()
+            for employee_id in range(1, employees + 1):
+                if written == rows:
+                    return
+                written += 1
+                check_in = 7 * 60 + 30 + rng.randrange(60)
+                check_out = check_in + 8 * 60 + rng.randrange(-30, 90)
+                yield (employee_id, day_text, f"{check_in // 60:02d}:{check_in % 60:02d}",
+                       None if rng.random() < 0.05 else f"{check_out // 60 % 24:02d}:{check_out % 60:02d}")
+
+    manager.executemany("INSERT INTO attendance (employee_id, date, check_in, check_out) VALUES (?, ?, ?, ?)",
+                        records())
+    return first.isoformat(), (first + timedelta(days=days - 1)).isoformat()
+
+
+def bench_attendance(rows=1000000, employees=2000, repeat=3):
+    """Work hours and lateness from stored minute columns against per-row Python parsing."""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = _scratch_database(directory)
+        rng = random.Random(18)
+        _fill_employees(manager, employees, rng)
+        started = time.perf_counter()
+        first, last = _fill_attendance(manager, rows, employees, rng)
+        seconds = time.perf_counter() - started
+        print(f"\nAttendance hours and status, {rows} rows ({employees} employees, {first} to {last})")
+        print(f"  insert: {seconds:.1f} s ({rows / seconds:.0f} rows/s)")
+
+        def legacy_rows():
+            return [_legacy_hours_and_status(check_in, check_out) for check_in, check_out
+                    in manager.execute("SELECT check_in, check_out FROM attendance", fetch=True)]
+
+        def minute_rows():
+            return [(f"{work / 60:.2f}" if work is not None else None, late > 0 if late is not None else None)
+                    for work, late in manager.execute("SELECT work_minutes, late_minutes FROM attendance", fetch=True)]
+
+        def legacy_day():
+            present = late = 0
+            hours = 0.0
+            for check_in, check_out in manager.execute(
+                    "SELECT check_in, check_out FROM attendance WHERE date = ?", (last,), fetch=True):
+                legacy_hours, status = _legacy_hours_and_status(check_in, check_out)
+                present += bool(check_in)
+                late += status == "متأخر"
+                hours += float(legacy_hours.split()[0]) if check_out else 0
+            return present, late, hours
+
+        def minute_day():
+            return manager.execute(
+                "SELECT COUNT(check_in), COUNT(CASE WHEN late_minutes > 0 THEN 1 END), TOTAL(work_minutes) / 60 "
+                "FROM attendance WHERE date = ?", (last,), fetch=True)[0]
+
+        def legacy_totals():
+            totals = {}
+            for employee_id, check_in, check_out in manager.execute(
+                    "SELECT employee_id, check_in, check_out FROM attendance", fetch=True):
+                legacy_hours, _ = _legacy_hours_and_status(check_in, check_out)
+                if check_out:
+                    totals[employee_id] = totals.get(employee_id, 0) + float(legacy_hours.split()[0])
+            return totals
+
+        def minute_totals():
+            return manager.execute("SELECT employee_id, TOTAL(work_minutes) / 60 FROM attendance GROUP BY employee_id",
+                                   fetch=True)
+
+        print(f"  {'task':<28}{'Python ms':>12}{'SQL ms':>10}")
+        for task, legacy, minutes, runs in (("format every row", legacy_rows, minute_rows, 1),
+                                            ("today's stats", legacy_day, minute_day, repeat * 10),
+                                            ("hours per employee", legacy_totals, minute_totals, 1)):
+            legacy_ms, _ = _timed(legacy, runs)
+            minutes_ms, _ = _timed(minutes, runs)
+            print(f"  {task:<28}{legacy_ms:>12.1f}{minutes_ms:>10.1f}")
+        database.close_connections()
+
+
+def bench_payroll(employees=10000, days=31, repeat=3):
+    """Month payroll for every employee: NumPy and pure-Python engines against one query per employee."""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = _scratch_database(directory)
+        rng = random.Random(25)
+        _fill_employees(manager, employees, rng)
+        manager.execute("UPDATE employees SET salary = 3000 + abs(random()) % 7000, hire_date = '2019-01-01'")
+        manager.execute("UPDATE employees SET payment_type = 'hourly', salary = 25 WHERE id % 10 = 0")
+        first, last = _fill_attendance(manager, employees * days, employees, rng)
+        manager.execute("DELETE FROM attendance WHERE abs(random()) % 12 = 0")
+        month, year = int(first[5:7]), int(first[:4])
+        manager.executemany(
+            "INSERT INTO leaves (employee_id, type, start_date, end_date, days, status, request_date) "
+            "VALUES (?, 'إجازة سنوية', ?, ?, 3, 'معتمد', ?)",
+            [(employee_id, f"{first[:8]}{day:02d}", f"{first[:8]}{day + 2:02d}", first)
+             for employee_id, day in ((rng.randrange(1, employees + 1), rng.randrange(1, days - 2))
+                                      for _ in range(employees // 5))])
+        print(f"\nPayroll for {employees} employees x {days} days ({first} to {last})")
+        settings = database.load_payroll_settings()
+        conn = manager.connection()
+
+        def per_employee():
+            # What the salary form did: one employee at a time, aggregates per query
+            rows = []
+            for employee_id, salary in conn.execute("SELECT id, COALESCE(salary, 0) FROM employees").fetchall():
+                rows.append((employee_id, salary, *conn.execute(
+                    "SELECT COUNT(check_in), TOTAL(late_minutes), TOTAL(overtime_minutes) FROM attendance "
+                    "WHERE employee_id = ? AND date BETWEEN ? AND ?", (employee_id, first, last)).fetchone()))
+            return rows
+
+        load_ms, inputs = _timed(lambda: database.load_payroll_inputs(conn, month, year, settings), repeat)
+        print(f"  load inputs (4 queries): {load_ms:.1f} ms")
+        print(f"  {'engine':<28}{'ms':>10}")
+        per_employee_ms, _ = _timed(per_employee, 1)
+        print(f"  {'one query per employee':<28}{per_employee_ms:>10.1f}  (attendance totals only)")
+        python_ms, python_rows = _timed(lambda: database._payroll_python(inputs, settings), repeat)
+        print(f"  {'pure Python':<28}{python_ms:>10.1f}")
+        if database.np is None:
+            print("  NumPy is not installed; only the pure-Python engine was measured")
+        else:
+            numpy_ms, numpy_rows = _timed(lambda: database._payroll_numpy(inputs, settings), repeat)
+            print(f"  {'NumPy':<28}{numpy_ms:>10.1f}")
+            print(f"  engines agree: {numpy_rows == python_rows}")
+        run_ms, (_, rows, _) = _timed(lambda: database.run_payroll(month, year, dry_run=True, manager=manager), 1)
+        print(f"  dry run ({database.payroll_engine(settings)} engine): {run_ms:.1f} ms for {len(rows)} salaries")
+        database.close_connections()
+
+
+BENCHMARKS = {
+    "search": bench_search,
+    "attendance": bench_attendance,
+    "payroll": bench_payroll,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,223 +1,2059 @@
 import sqlite3
 import os
 import hashlib  # For hashing the default admin password
+import threading
+import contextlib
+import queue
+from concurrent.futures import Future
+import time
+import glob
+import re
+import pathlib
+import configparser
+import csv
+import bisect
+import calendar
+import heapq
+import itertools
+import sys
+import logging
+from logging.handlers import RotatingFileHandler
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # optional: payroll falls back to the pure-Python engine
+    np = None
 
 DB_NAME = "hr_system.db"
+CONFIG_FILE = "hr_system.ini"
+
+# Number of prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+# Connection settings applied to every pooled connection. WAL lets the
+# readers keep working while a check-in is being written; the presets differ
+# in how much durability and memory they trade for speed:
+#   safe      - fsync on every commit, modest cache, no memory mapping
+#   balanced  - fsync at WAL checkpoints only (survives app crashes)
+#   fast      - no fsync; a power cut may lose the latest transactions
+PERFORMANCE_PROFILES = {
+    "safe": {
+        "busy_timeout": 10000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,          # KiB when negative
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    "balanced": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32000,
+        "mmap_size": 128 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+    "fast": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -128000,
+        "mmap_size": 512 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+DEFAULT_PROFILE = "balanced"
+
+_PRAGMA_CHOICES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+_PRAGMA_INTEGERS = {"busy_timeout", "cache_size", "mmap_size"}
+
+def load_performance_profile(config_file=None):
+    """
+    Return (profile_name, pragmas) selected by the [database] section of
+    the config file. Individual pragmas may be overridden in the same
+    section; unknown profiles and invalid values fall back to the preset.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file or CONFIG_FILE, encoding="utf-8")
+    section = config["database"] if config.has_section("database") else {}
+
+    name = section.get("profile", DEFAULT_PROFILE).strip().lower()
+    if name not in PERFORMANCE_PROFILES:
+        print(f"Unknown performance profile '{name}', using '{DEFAULT_PROFILE}'")
+        name = DEFAULT_PROFILE
+    pragmas = dict(PERFORMANCE_PROFILES[name])
+
+    for key in pragmas:
+        if key not in section:
+            continue
+        value = section[key].strip()
+        if key in _PRAGMA_INTEGERS:
+            try:
+                pragmas[key] = int(value)
+            except ValueError:
+                print(f"Invalid value for {key} in {config_file or CONFIG_FILE}: {value}")
+        elif value.upper() in _PRAGMA_CHOICES[key]:
+            pragmas[key] = value.upper()
+        else:
+            print(f"Invalid value for {key} in {config_file or CONFIG_FILE}: {value}")
+    return name, pragmas
+
+def save_performance_profile(name, config_file=None):
+    """Select a preset in the config file, keeping any other settings."""
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown performance profile: {name}")
+    path = config_file or CONFIG_FILE
+    config = configparser.ConfigParser()
+    config.read(path, encoding="utf-8")
+    if not config.has_section("database"):
+        config.add_section("database")
+    config["database"]["profile"] = name
+    with open(path, "w", encoding="utf-8") as f:
+        config.write(f)
+
+def apply_performance_profile(conn, pragmas):
+    """
+    Apply the pragmas to conn and return the values SQLite reports back
+    (journal_mode may stay unchanged, e.g. on network drives).
+    """
+    effective = {}
+    for key in ("busy_timeout", "journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store"):
+        if key not in pragmas:
+            continue
+        try:
+            row = conn.execute(f"PRAGMA {key} = {pragmas[key]}").fetchone()
+            if row is None:
+                row = conn.execute(f"PRAGMA {key}").fetchone()
+            effective[key] = row[0] if row else pragmas[key]
+        except sqlite3.Error as e:
+            print(f"Could not apply PRAGMA {key}: {e}")
+    return effective
 
-def safe_connect():
-    """Return a SQLite connection, recreating the DB if corrupted."""
+# How often the application runs a full integrity check in the background
+INTEGRITY_CHECK_INTERVAL_HOURS = 24
+
+# Tables copied out of a damaged file, parents before children. Tables that
+# triggers maintain from these are rebuilt by the inserts and not copied.
+# leave_ledger goes before leaves so approved leaves do not post usage twice.
+SALVAGE_TABLES = ("admin", "employees", "shifts", "employee_shifts", "attendance", "leave_ledger", "leaves",
+                  "payroll_runs", "salaries", "integrity_checks")
+SALVAGE_BATCH_ROWS = 2000
+SALVAGE_COMMIT_ROWS = 50000
+
+def safe_connect(**connect_kwargs):
+    """
+    Return a SQLite connection, salvaging the DB if it cannot be read.
+
+    Only the schema is read here; integrity verification is done by
+    run_integrity_check() so that opening a connection stays cheap.
+    """
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cur = conn.cursor()
-        cur.execute("PRAGMA integrity_check")
-        if cur.fetchone()[0] != "ok":
-            raise sqlite3.DatabaseError("Integrity check failed")
+        conn = sqlite3.connect(DB_NAME, **connect_kwargs)
+        conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
         return conn
     except sqlite3.DatabaseError:
         if conn:
             conn.close()
-        if os.path.exists(DB_NAME):
-            backup = DB_NAME + ".corrupt"
-            os.replace(DB_NAME, backup)
-            print(f"Corrupt database moved to {backup}. Creating new database...")
-        init_db()
-        return sqlite3.connect(DB_NAME)
+        handle_corrupt_db()
+        return sqlite3.connect(DB_NAME, **connect_kwargs)
 
-def init_db():
+def handle_corrupt_db():
     """
-    Initializes the SQLite database by creating necessary tables
-    if they don't already exist and inserts a default admin user.
+    Move a damaged database file aside, create a new one and copy every
+    readable row from the damaged file into it.
+
+    The damaged file is kept under a timestamped .corrupt name next to a
+    .recovery.txt report. Returns the salvage report (None if there was no
+    file to recover).
+    """
+    report = None
+    if os.path.exists(DB_NAME):
+        backup = f"{DB_NAME}.corrupt-{datetime.now():%Y%m%d-%H%M%S}"
+        os.replace(DB_NAME, backup)
+        # WAL side files belong to the damaged file, not to the new one
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(DB_NAME + suffix):
+                os.replace(DB_NAME + suffix, backup + suffix)
+        print(f"Corrupt database moved to {backup}. Recovering readable rows...")
+
+        conn = sqlite3.connect(DB_NAME, isolation_level=None)
+        try:
+            migrate(conn)
+            report = salvage_database(backup, conn)
+        finally:
+            conn.close()
+        write_salvage_report(report, backup + ".recovery.txt")
+        print(f"Recovered {report['recovered']} rows; report written to {backup}.recovery.txt")
+    # init_db() only adds the default admin if no admin row was recovered
+    init_db()
+    return report
+
+def _salvage_range(source, select, low, high, lost):
+    """
+    Yield the readable rows with rowid in [low, high], halving the range
+    around unreadable pages. Ranges that fail down to a single rowid are
+    appended to lost.
     """
-    conn = None # Initialize conn to None
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+        rows = source.execute(select + " WHERE rowid BETWEEN ? AND ? ORDER BY rowid", (low, high)).fetchall()
+    except sqlite3.DatabaseError:
+        if low == high:
+            if lost and lost[-1][1] == low - 1:
+                lost[-1] = (lost[-1][0], low)
+            else:
+                lost.append((low, low))
+            return
+        middle = (low + high) // 2
+        yield from _salvage_range(source, select, low, middle, lost)
+        yield from _salvage_range(source, select, middle + 1, high, lost)
+        return
+    yield from rows
 
-        # Create 'employees' table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                position TEXT,
-                salary REAL,
-                hire_date TEXT,
-                email TEXT UNIQUE,
-                phone TEXT,
-                address TEXT,
-                employee_code TEXT UNIQUE,
-                birth_date TEXT,
-                gender TEXT,
-                status TEXT,
-                department TEXT,
-                location TEXT,
-                profession TEXT,
-                nationality TEXT,
-                religion TEXT,
-                marital_status TEXT,
-                emp_type TEXT,
-                code_number TEXT,
-                old_file_number TEXT,
-                working_hours TEXT,
-                payment_type TEXT,
-                contract_entity TEXT
-            )
-        ''')
-
-        # Create 'attendance' table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL, -- Changed to NOT NULL
-                date TEXT NOT NULL,           -- Changed to NOT NULL
-                check_in TEXT,
-                check_out TEXT,
-                FOREIGN KEY(employee_id) REFERENCES employees(id) ON DELETE CASCADE -- Added ON DELETE CASCADE
-            )
-        ''')
-
-        # Create 'leaves' table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leaves (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL, -- Changed to NOT NULL
-                type TEXT NOT NULL,           -- Changed to NOT NULL
-                start_date TEXT NOT NULL,     -- Changed to NOT NULL
-                end_date TEXT NOT NULL,       -- Changed to NOT NULL
-                days INTEGER NOT NULL,        -- Added days column and NOT NULL
-                reason TEXT,
-                status TEXT NOT NULL DEFAULT 'معلق', -- Added status and default value
-                request_date TEXT NOT NULL,      -- Added request_date
-                FOREIGN KEY(employee_id) REFERENCES employees(id) ON DELETE CASCADE -- Added ON DELETE CASCADE
-            )
-        ''')
-
-        # Create 'salaries' table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS salaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL, -- Changed to NOT NULL
-                month TEXT NOT NULL,          -- Changed to NOT NULL
-                year INTEGER NOT NULL,        -- Added year and NOT NULL
-                basic_salary REAL NOT NULL,   -- Renamed from base_salary and NOT NULL
-                bonuses REAL DEFAULT 0,       -- Renamed from allowances, added DEFAULT
-                deductions REAL DEFAULT 0,    -- Added DEFAULT
-                net_salary REAL NOT NULL,     -- Added net_salary and NOT NULL
-                payment_date TEXT NOT NULL,   -- Added payment_date
-                FOREIGN KEY(employee_id) REFERENCES employees(id) ON DELETE CASCADE, -- Added ON DELETE CASCADE
-                UNIQUE(employee_id, month, year) -- Ensures only one salary record per employee per month/year
-            )
-        ''')
-
-        # Create 'admin' table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS admin (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, -- Added id for better management
-                username TEXT UNIQUE NOT NULL,        -- Added UNIQUE and NOT NULL
-                password TEXT NOT NULL                -- Changed to NOT NULL
-            )
-        ''')
+def _salvage_rows(source, table, columns, lost):
+    """
+    Stream (rowid, *columns) rows of table in rowid order, SALVAGE_BATCH_ROWS
+    at a time, stepping around pages that cannot be read.
+    """
+    select = f"SELECT rowid, {', '.join(columns)} FROM {table}"
+    high = source.execute(f"SELECT max(rowid) FROM {table}").fetchone()[0]
+    if high is None:
+        return
+    last = source.execute(f"SELECT min(rowid) FROM {table}").fetchone()[0] - 1
+    while last < high:
+        try:
+            rows = source.execute(select + " WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                  (last, SALVAGE_BATCH_ROWS)).fetchall()
+        except sqlite3.DatabaseError:
+            # A bad page follows `last`; recover what is readable around it
+            window_end = min(last + SALVAGE_BATCH_ROWS, high)
+            yield from _salvage_range(source, select, last + 1, window_end, lost)
+            last = window_end
+            continue
+        if not rows:
+            break
+        yield from rows
+        last = rows[-1][0]
 
-        # Insert default admin user if no admin users exist
-        cursor.execute("SELECT COUNT(*) FROM admin")
-        if cursor.fetchone()[0] == 0:
-            # Hash the default password for security
-            default_password_hash = hashlib.sha256("admin".encode()).hexdigest()
-            cursor.execute(
-                "INSERT INTO admin (username, password) VALUES (?, ?)",
-                ("admin", default_password_hash)
-            )
-            print("Default admin user 'admin' created with password 'admin'.")
+def salvage_database(source_path, target):
+    """
+    Copy the readable rows of SALVAGE_TABLES from the damaged file at
+    source_path into the migrated connection target.
 
-        conn.commit()
-        print("Database initialized successfully.")
+    Rows are streamed in batches and inserted in transactions of
+    SALVAGE_COMMIT_ROWS, so memory stays bounded for any table size.
+    Columns are matched by name, which also upgrades files written by older
+    schema versions. Returns a report dict with per-table counts and the
+    rowid ranges that could not be read.
+    """
+    started = time.perf_counter()
+    report = {"source": source_path, "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              "tables": {}, "recovered": 0, "error": None}
+    source = None
+    try:
+        source = sqlite3.connect(pathlib.Path(source_path).resolve().as_uri() + "?mode=ro", uri=True)
+        source_tables = {row[0] for row in source.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    except sqlite3.DatabaseError as e:
+        # Without a readable schema there is nothing to locate rows with
+        report["error"] = f"schema unreadable: {e}"
+        report["duration_s"] = round(time.perf_counter() - started, 2)
+        if source:
+            source.close()
+        return report
+
+    try:
+        for table in SALVAGE_TABLES:
+            entry = {"recovered": 0, "duplicates": 0, "lost_ranges": [], "error": None}
+            report["tables"][table] = entry
+            if table not in source_tables:
+                entry["error"] = "table missing"
+                continue
+            try:
+                source_columns = _table_columns(source.cursor(), table)
+            except sqlite3.DatabaseError as e:
+                entry["error"] = str(e)
+                continue
+            columns = [c for c in _table_columns(target.cursor(), table) if c in source_columns]
+            insert = (f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                      f"VALUES ({', '.join('?' * len(columns))})")
+
+            pending = 0
+            target.execute("BEGIN")
+            try:
+                for row in _salvage_rows(source, table, columns, entry["lost_ranges"]):
+                    if target.execute(insert, row[1:]).rowcount:
+                        entry["recovered"] += 1
+                    else:
+                        entry["duplicates"] += 1
+                    pending += 1
+                    if pending >= SALVAGE_COMMIT_ROWS:
+                        target.execute("COMMIT")
+                        target.execute("BEGIN")
+                        pending = 0
+            except sqlite3.DatabaseError as e:
+                # e.g. max(rowid) unreadable: keep what was copied so far
+                entry["error"] = str(e)
+            target.execute("COMMIT")
+            report["recovered"] += entry["recovered"]
+    finally:
+        source.close()
+
+    report["duration_s"] = round(time.perf_counter() - started, 2)
+    return report
 
+def write_salvage_report(report, path):
+    """Write a plain-text summary of a salvage report."""
+    lines = [
+        f"Recovery of {DB_NAME} started {report['started_at']}",
+        f"Damaged file: {report['source']}",
+        f"Rows recovered: {report['recovered']} in {report['duration_s']} s",
+    ]
+    if report["error"]:
+        lines.append(f"Nothing recovered: {report['error']}")
+    for table, entry in report["tables"].items():
+        line = f"{table}: {entry['recovered']} rows recovered"
+        if entry["duplicates"]:
+            line += f", {entry['duplicates']} duplicate rows skipped"
+        if entry["lost_ranges"]:
+            ranges = ", ".join(f"{low}" if low == high else f"{low}-{high}" for low, high in entry["lost_ranges"])
+            line += f", unreadable rowids: {ranges}"
+        if entry["error"]:
+            line += f" (stopped: {entry['error']})"
+        lines.append(line)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def run_integrity_check(full=False):
+    """
+    Check the database file and record the outcome in integrity_checks.
+
+    A quick check (PRAGMA quick_check) skips index verification and is
+    cheap enough for startup; full=True runs PRAGMA integrity_check.
+    The check uses its own connection so it can run on a background thread
+    without touching the connections used for regular queries.
+    Returns a dict with checked_at, mode, ok, result and duration_ms.
+    """
+    mode = "full" if full else "quick"
+    checked_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        conn.execute(f"PRAGMA busy_timeout = {load_performance_profile()[1]['busy_timeout']}")
+        rows = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+        messages = [row[0] for row in rows]
+    except sqlite3.DatabaseError as e:
+        messages = [str(e)]
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    ok = messages == ["ok"]
+    result = {
+        "checked_at": checked_at,
+        "mode": mode,
+        "ok": ok,
+        "result": "\n".join(messages),
+        "duration_ms": duration_ms,
+    }
+    # A damaged file is never written to; failures go to a plain text log
+    if not ok:
+        print(f"Integrity check ({mode}) failed: {result['result']}")
+        try:
+            with open(DB_NAME + ".integrity.log", "a", encoding="utf-8") as log:
+                log.write(f"{checked_at}\t{mode}\t{duration_ms}ms\t{result['result']}\n")
+        except OSError:
+            pass
+    try:
+        if conn is not None and ok:
+            migrate(conn)
+            conn.execute(
+                "INSERT INTO integrity_checks (checked_at, mode, ok, result, duration_ms) VALUES (?, ?, ?, ?, ?)",
+                (checked_at, mode, int(ok), result["result"], duration_ms)
+            )
+            conn.commit()
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Could not record integrity check: {e}")
     finally:
         if conn:
             conn.close()
+    return result
 
-def upgrade_db():
-    """Upgrade existing database schema and recover if corrupted."""
-    conn = None
+def startup_check():
+    """
+    Run a quick check when the application starts.
+
+    A damaged file is salvaged into a new one, as safe_connect() does for
+    files that cannot be opened at all; the salvage report is returned
+    under "recovery".
+    """
+    result = run_integrity_check(full=False)
+    if not result["ok"]:
+        close_connections()
+        result["recovery"] = handle_corrupt_db()
+    return result
+
+def integrity_history(limit=10):
+    """Return the most recent recorded integrity checks, newest first."""
     try:
-        conn = sqlite3.connect(DB_NAME)
+        return get_manager().execute(
+            "SELECT checked_at, mode, ok, result, duration_ms FROM integrity_checks ORDER BY id DESC LIMIT ?",
+            (limit,), fetch=True
+        )
+    except sqlite3.OperationalError:
+        return []
+
+
+class BackgroundJob(threading.Thread):
+    """
+    Runs fn(*args, **kwargs) on a daemon thread for long maintenance tasks
+    that should not hold up the database worker queue; poll is_alive(),
+    then read result or error.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+
+
+class IntegrityCheckJob(BackgroundJob):
+    """Runs run_integrity_check() on a daemon thread; poll is_alive()/result."""
+
+    def __init__(self, full=True):
+        super().__init__(run_integrity_check, full=full)
+        self.full = full
+
+
+# Defaults for the [backup] section of the config file
+BACKUP_DEFAULTS = {
+    "directory": "backups",
+    "keep": 7,                 # number of backups kept per database
+    "interval_hours": 6,       # automatic backups while the app is open
+    "pages_per_step": 256,     # pages copied before other connections get a turn
+    "max_seconds": 120,        # after this the rest is copied in a single step
+}
+
+class _BackupDeadline(Exception):
+    pass
+
+def load_backup_settings(config_file=None):
+    """Return the [backup] settings from the config file merged with the defaults."""
+    config = configparser.ConfigParser()
+    config.read(config_file or CONFIG_FILE, encoding="utf-8")
+    settings = dict(BACKUP_DEFAULTS)
+    if config.has_section("backup"):
+        for key, default in BACKUP_DEFAULTS.items():
+            value = config["backup"].get(key)
+            if value is None:
+                continue
+            try:
+                settings[key] = type(default)(value)
+            except ValueError:
+                print(f"Invalid value for backup {key}: {value}")
+    return settings
+
+def _backup_prefix():
+    return os.path.splitext(os.path.basename(DB_NAME))[0] + "-"
+
+def list_backups(directory=None):
+    """Return (path, size_bytes, modified) tuples for existing backups, newest first."""
+    directory = directory or load_backup_settings()["directory"]
+    paths = glob.glob(os.path.join(directory, _backup_prefix() + "*.db"))
+    backups = [(p, os.path.getsize(p), datetime.fromtimestamp(os.path.getmtime(p))) for p in paths]
+    return sorted(backups, key=lambda b: os.path.basename(b[0]), reverse=True)
+
+def _quick_check_file(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+
+def backup_database(directory=None, label=None, progress=None):
+    """
+    Copy the live database into a timestamped file using the online backup API.
+
+    The copy advances pages_per_step pages at a time, so writers are only
+    held up between steps. Because a write from another connection makes an
+    incremental backup start over, the copy switches to a single final step
+    once max_seconds have passed; that step cannot be restarted, which keeps
+    the total time bounded on large files. The result is verified with
+    quick_check before it replaces older backups, of which only `keep` are
+    retained. progress(copied_pages, total_pages) is called after each step.
+    Returns the path of the new backup.
+    """
+    settings = load_backup_settings()
+    directory = directory or settings["directory"]
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    suffix = f"-{label}" if label else ""
+    path = os.path.join(directory, f"{_backup_prefix()}{stamp}{suffix}.db")
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    deadline = time.monotonic() + settings["max_seconds"]
+
+    def on_step(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+        if remaining and time.monotonic() > deadline:
+            raise _BackupDeadline()
+
+    source = sqlite3.connect(DB_NAME)
+    target = sqlite3.connect(partial)
+    try:
+        source.execute(f"PRAGMA busy_timeout = {load_performance_profile()[1]['busy_timeout']}")
+        try:
+            source.backup(target, pages=max(1, settings["pages_per_step"]), progress=on_step)
+        except _BackupDeadline:
+            print("Backup did not settle in time; copying the remaining pages in one step")
+            source.backup(target, pages=-1)
+        # Backups are standalone files; do not leave them in WAL mode
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+
+    if not _quick_check_file(partial):
+        os.remove(partial)
+        raise sqlite3.DatabaseError("Backup verification (quick_check) failed")
+    os.replace(partial, path)
+
+    # Only unlabeled (scheduled/manual) backups rotate; labeled ones such as
+    # pre-restore copies are kept until removed by hand
+    rotating = [b for b in list_backups(directory)
+                if re.fullmatch(r"\d{8}-\d{6}", os.path.basename(b[0])[len(_backup_prefix()):-3])]
+    for old_path, _, _ in rotating[max(1, settings["keep"]):]:
+        try:
+            os.remove(old_path)
+        except OSError as e:
+            print(f"Could not remove old backup {old_path}: {e}")
+    return path
+
+def restore_database(backup_path):
+    """
+    Replace the contents of the live database with a verified backup.
+
+    All pooled connections must be closed first (close_connections()).
+    The current database is backed up with the label 'pre-restore' so a
+    restore can itself be undone, and pending migrations are applied to
+    the restored copy afterwards.
+    """
+    if not os.path.isfile(backup_path) or not _quick_check_file(backup_path):
+        raise sqlite3.DatabaseError("The selected backup failed quick_check")
+    if os.path.exists(DB_NAME):
+        try:
+            backup_database(label="pre-restore")
+        except sqlite3.DatabaseError as e:
+            print(f"Could not back up the current database before restoring: {e}")
+    source = sqlite3.connect(pathlib.Path(os.path.abspath(backup_path)).as_uri() + "?mode=ro", uri=True)
+    target = sqlite3.connect(DB_NAME)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    init_db()
+
+
+QUERY_STATS_DEFAULTS = {
+    "slow_query_ms": 200.0,    # statements slower than this go to the slow-query log
+    "explain": False,          # add EXPLAIN QUERY PLAN output for slow statements
+    "log_file": "hr_system.slow.log",
+    "max_bytes": 1048576,      # rotate the log at this size
+    "backup_count": 3,         # rotated logs kept
+}
+
+# Helpers that only pass a query through; query_source() looks past them
+_QUERY_SOURCE_SKIP = {"execute_db", "query_in_background", "run_in_background", "<lambda>"}
+
+def load_query_stats_settings(config_file=None):
+    """Return the [profiling] settings from the config file merged with the defaults."""
+    config = configparser.ConfigParser()
+    config.read(config_file or CONFIG_FILE, encoding="utf-8")
+    settings = dict(QUERY_STATS_DEFAULTS)
+    if config.has_section("profiling"):
+        section = config["profiling"]
+        for key, default in QUERY_STATS_DEFAULTS.items():
+            if key not in section:
+                continue
+            try:
+                settings[key] = section.getboolean(key) if isinstance(default, bool) else type(default)(section[key])
+            except ValueError:
+                print(f"Invalid value for profiling {key}: {section[key]}")
+    return settings
+
+def query_source():
+    """
+    Name of the application method that issued the current query, e.g.
+    refresh_attendance. Frames in this module and pass-through helpers are
+    skipped; nested functions report the method they are defined in.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        # co_qualname is Python 3.11+; older versions only have the bare name
+        name = getattr(code, "co_qualname", code.co_name).split(".<locals>")[0].rsplit(".", 1)[-1]
+        if code.co_filename != __file__ and name not in _QUERY_SOURCE_SKIP:
+            return name
+        frame = frame.f_back
+    return "?"
+
+
+class QueryStats:
+    """
+    Aggregates wall time and row counts per (source, statement) for every
+    query run through ConnectionManager.execute()/executemany().
+
+    Statements slower than slow_query_ms are written to a rotating log,
+    with their query plan when explain is enabled.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or load_query_stats_settings()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._logger = None
+
+    def _slow_log(self):
+        if self._logger is None:
+            logger = logging.getLogger("hr_system.slow_queries")
+            if not logger.handlers:
+                handler = RotatingFileHandler(self.settings["log_file"], maxBytes=self.settings["max_bytes"],
+                                              backupCount=self.settings["backup_count"], encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+            self._logger = logger
+        return self._logger
+
+    def record(self, conn, query, params, source, duration_ms, rows):
+        """Add one execution; conn is used for EXPLAIN QUERY PLAN of slow statements."""
+        statement = " ".join(query.split())
+        key = (source, statement)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "plan": None}
+            entry["calls"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["rows"] += rows
+
+        if duration_ms < self.settings["slow_query_ms"]:
+            return
+        message = f"{duration_ms:.1f} ms {rows} rows [{source}] {statement}"
+        if self.settings["explain"] and isinstance(params, (tuple, list, dict)):
+            try:
+                plan = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+                entry["plan"] = "; ".join(row[-1] for row in plan)
+                message += f" | plan: {entry['plan']}"
+            except sqlite3.Error:
+                pass
+        self._slow_log().info(message)
+
+    def top(self, limit=10):
+        """Return (source, statement, calls, total_ms, max_ms, rows, plan) sorted by total time."""
+        with self._lock:
+            items = [(source, statement, e["calls"], e["total_ms"], e["max_ms"], e["rows"], e["plan"])
+                     for (source, statement), e in self._stats.items()]
+        items.sort(key=lambda item: item[3], reverse=True)
+        return items[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+_query_stats = None
+_query_stats_lock = threading.Lock()
+
+def get_query_stats():
+    """Return the process-wide QueryStats; it outlives connection managers."""
+    global _query_stats
+    with _query_stats_lock:
+        if _query_stats is None:
+            _query_stats = QueryStats()
+        return _query_stats
+
+
+class ConnectionManager:
+    """
+    Hands out long-lived SQLite connections instead of opening one per query.
+
+    Each thread gets its own connection, opened on first use and kept until
+    close_all() is called (on logout or when the main window closes).
+    Connections run in autocommit mode; use transaction() to group several
+    statements into one explicit transaction.
+    """
+
+    def __init__(self, db_name=None, cached_statements=STATEMENT_CACHE_SIZE):
+        self.db_name = db_name or DB_NAME
+        self.cached_statements = cached_statements
+        self.profile_name, self.pragmas = load_performance_profile()
+        self.effective_pragmas = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self.stats = get_query_stats()
+
+    def connection(self):
+        """Return the calling thread's connection, opening it if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = safe_connect(isolation_level=None,
+                                cached_statements=self.cached_statements,
+                                check_same_thread=False)
+            self.effective_pragmas = apply_performance_profile(conn, self.pragmas)
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self, immediate=True):
+        """
+        Run the enclosed statements in one transaction.
+
+        Nested scopes become savepoints, so a helper that opens its own
+        transaction can be called from inside a larger one.
+        """
+        conn = self.connection()
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            before = _read_table_versions(conn)
+        else:
+            conn.execute(f"SAVEPOINT sp_{depth}")
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0:
+                conn.execute("ROLLBACK")
+            else:
+                conn.execute(f"ROLLBACK TO sp_{depth}")
+                conn.execute(f"RELEASE sp_{depth}")
+            raise
+        else:
+            self._local.depth = depth
+            if depth == 0:
+                after = _read_table_versions(conn)
+                conn.execute("COMMIT")
+                _record_own_changes(before, after)
+            else:
+                conn.execute(f"RELEASE sp_{depth}")
+
+    def execute(self, query, params=(), fetch=False, source=None):
+        """
+        Execute a single statement.
+
+        Returns the fetched rows when fetch is True, otherwise the number of
+        rows affected by the statement. The timing is recorded in
+        self.stats under source (by default the calling method).
+        Writes outside a transaction get one of their own, so the version
+        bumps they make are recorded as this process's own changes.
+        """
+        conn = self.connection()
+        if self._local.depth == 0 and _WRITE_STATEMENT.match(query):
+            with self.transaction():
+                return self.execute(query, params, fetch, source=source or query_source())
         cur = conn.cursor()
+        started = time.perf_counter()
+        try:
+            cur.execute(query, params)
+            result = cur.fetchall() if fetch else cur.rowcount
+        finally:
+            cur.close()
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.stats.record(conn, query, params, source or query_source(), duration_ms,
+                          len(result) if fetch else max(result, 0))
+        return result
+
+    def executemany(self, query, seq_of_params, source=None):
+        """Execute a statement for every parameter set in one transaction."""
+        started = time.perf_counter()
+        with self.transaction() as conn:
+            rowcount = conn.executemany(query, seq_of_params).rowcount
+        self.stats.record(conn, query, None, source or query_source(),
+                          (time.perf_counter() - started) * 1000, max(rowcount, 0))
+        return rowcount
+
+    def close_all(self):
+        """Close every connection handed out by this manager."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+class DatabaseWorker:
+    """
+    Runs database jobs on one background thread so the UI thread never
+    waits on SQLite.
+
+    submit() returns a concurrent.futures.Future. Jobs submitted with the
+    same key replace each other: a queued job that has been superseded is
+    cancelled before it runs, and is_current() lets the caller drop the
+    result of one that was already running (e.g. an older search after a
+    newer keystroke). The worker uses its own pooled connection from the
+    connection manager.
+    """
 
-        # Check database integrity first
-        cur.execute("PRAGMA integrity_check")
-        result = cur.fetchone()
-        if result[0] != "ok":
-            raise sqlite3.DatabaseError("Integrity check failed")
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._thread = threading.Thread(target=self._run, name="db-worker", daemon=True)
+        self._thread.start()
 
-        # --- Upgrade employees table ---
-        cur.execute("PRAGMA table_info(employees)")
-        columns = [row[1] for row in cur.fetchall()]
+    def submit(self, fn, *args, key=None, **kwargs):
+        """Queue fn(*args, **kwargs) and return its Future."""
+        future = Future()
+        if key is not None:
+            with self._lock:
+                previous = self._latest.get(key)
+                self._latest[key] = future
+            if previous is not None:
+                previous.cancel()
+        self._queue.put((future, fn, args, kwargs))
+        return future
 
-        if "full_name" not in columns:
-            if "name" in columns:
-                cur.execute("ALTER TABLE employees RENAME COLUMN name TO full_name")
+    def is_current(self, future, key):
+        """True unless a newer job has been submitted under the same key."""
+        if key is None:
+            return True
+        with self._lock:
+            return self._latest.get(key) is future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
             else:
-                cur.execute("ALTER TABLE employees ADD COLUMN full_name TEXT")
-
-        # New columns added in later versions
-        for col_def in [
-            ("email", "TEXT UNIQUE"),
-            ("phone", "TEXT"),
-            ("address", "TEXT"),
-            ("employee_code", "TEXT UNIQUE"),
-            ("birth_date", "TEXT"),
-            ("gender", "TEXT"),
-            ("status", "TEXT"),
-            ("department", "TEXT"),
-            ("location", "TEXT"),
-            ("profession", "TEXT"),
-            ("nationality", "TEXT"),
-            ("religion", "TEXT"),
-            ("marital_status", "TEXT"),
-            ("emp_type", "TEXT"),
-            ("code_number", "TEXT"),
-            ("old_file_number", "TEXT"),
-            ("working_hours", "TEXT"),
-            ("payment_type", "TEXT"),
-            ("contract_entity", "TEXT")
-        ]:
-            if col_def[0] not in columns:
-                cur.execute(f"ALTER TABLE employees ADD COLUMN {col_def[0]} {col_def[1]}")
+                future.set_result(result)
 
-        conn.commit()
+    def stop(self, timeout=5):
+        """Cancel queued jobs, let the running one finish and end the thread."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].cancel()
+        self._queue.put(None)
+        self._thread.join(timeout)
 
-    except sqlite3.DatabaseError as e:
-        print(f"Database upgrade error: {e}")
-        if conn:
-            conn.close()
-        # If the database is malformed, recreate it
-        if os.path.exists(DB_NAME):
-            backup = DB_NAME + ".corrupt"
-            os.replace(DB_NAME, backup)
-            print(f"Corrupt database moved to {backup}. Creating new database...")
-        init_db()
-        return
-    finally:
-        if conn:
-            conn.close()
-def upgrade_db():
-    """Ensure existing databases have required columns"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
 
-    # Upgrade employees table
-    cur.execute("PRAGMA table_info(employees)")
-    cols = [c[1] for c in cur.fetchall()]
-    if 'full_name' not in cols:
-        if 'name' in cols:
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """Return the process-wide connection manager, creating it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager()
+        return _manager
+
+def close_connections():
+    """Close all pooled connections; the next get_manager() starts afresh."""
+    global _manager
+    with _manager_lock:
+        manager, _manager = _manager, None
+    if manager is not None:
+        manager.close_all()
+
+
+# Distinct (employee, date) pairs held in memory before they are written
+PUNCH_IMPORT_BATCH_DAYS = 5000
+
+# Merges a day's first and last punch into the stored row. Punch times only
+# ever widen the stored check_in/check_out range, so importing the same or
+# an overlapping log again leaves the rows unchanged. A single punch is a
+# check-in until a later punch for the same day arrives.
+_PUNCH_UPSERT = """
+    INSERT INTO attendance (employee_id, date, check_in, check_out) VALUES (?, ?, ?, ?)
+    ON CONFLICT(employee_id, date) DO UPDATE SET
+        check_in = min(coalesce(attendance.check_in, excluded.check_in), excluded.check_in),
+        check_out = nullif(
+            max(coalesce(attendance.check_out, attendance.check_in, excluded.check_out, excluded.check_in),
+                coalesce(excluded.check_out, excluded.check_in)),
+            min(coalesce(attendance.check_in, excluded.check_in), excluded.check_in))
+"""
+
+def read_punch_log(path):
+    """
+    Yield (line_no, employee_code, date, time) for each punch in a terminal
+    log with one "employee_code,timestamp" line per punch.
+
+    Comma, semicolon and tab separated files are accepted, and a header line
+    is skipped. Timestamps are ISO-8601 ("2024-05-01 07:58:12"); lines that
+    cannot be parsed are yielded with date and time set to None.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for line_no, row in enumerate(csv.reader(f, dialect), start=1):
+            if len(row) < 2:
+                if any(cell.strip() for cell in row):
+                    yield line_no, None, None, None
+                continue
+            code = row[0].strip()
             try:
-                cur.execute("ALTER TABLE employees RENAME COLUMN name TO full_name")
+                stamp = datetime.fromisoformat(row[1].strip())
+            except ValueError:
+                if line_no > 1:
+                    yield line_no, code, None, None
+                continue
+            yield line_no, code, stamp.strftime("%Y-%m-%d"), stamp.strftime("%H:%M")
+
+def import_punch_log(path, manager=None):
+    """
+    Reduce a punch log to first-in/last-out per employee and day and upsert
+    the result into attendance.
+
+    Employee codes are resolved through an in-memory dict, and at most
+    PUNCH_IMPORT_BATCH_DAYS days are held before they are written in one
+    transaction, so memory does not grow with the log size. Returns a
+    dict with lines, punches, days, unknown_codes, invalid_lines, seconds
+    and rows_per_second.
+    """
+    manager = manager or get_manager()
+    started = time.perf_counter()
+    code_to_id = dict(manager.execute(
+        "SELECT employee_code, id FROM employees WHERE employee_code IS NOT NULL AND employee_code != ''",
+        fetch=True))
+    stats = {"lines": 0, "punches": 0, "days": 0, "unknown_codes": set(), "invalid_lines": []}
+    days = {}
+
+    def flush():
+        rows = [(emp_id, date, first, last if last != first else None)
+                for (emp_id, date), (first, last) in days.items()]
+        manager.executemany(_PUNCH_UPSERT, rows, source="import_punch_log")
+        stats["days"] += len(rows)
+        days.clear()
+
+    for line_no, code, date, punch_time in read_punch_log(path):
+        stats["lines"] = line_no
+        if date is None:
+            stats["invalid_lines"].append(line_no)
+            continue
+        emp_id = code_to_id.get(code)
+        if emp_id is None:
+            stats["unknown_codes"].add(code)
+            continue
+        stats["punches"] += 1
+        key = (emp_id, date)
+        span = days.get(key)
+        if span is None:
+            days[key] = [punch_time, punch_time]
+        elif punch_time < span[0]:
+            span[0] = punch_time
+        elif punch_time > span[1]:
+            span[1] = punch_time
+        if len(days) >= PUNCH_IMPORT_BATCH_DAYS:
+            flush()
+    if days:
+        flush()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["rows_per_second"] = stats["lines"] / stats["seconds"] if stats["seconds"] else 0
+    return stats
+
+
+def has_employee_search_index(manager=None):
+    """True if the FTS5 employee index exists (see _migration_employee_search)."""
+    manager = manager or get_manager()
+    return bool(manager.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='employees_fts'", fetch=True))
+
+def employee_match_query(term):
+    """
+    Turn free text into an FTS5 query where every word is a prefix match,
+    e.g. "ahm sal" -> '"ahm"* "sal"*'. Returns None if term has no words.
+    """
+    words = re.findall(r"\w+", term.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_employees(term, manager=None, use_index=None):
+    """
+    Return the employees rows matching term, best matches first.
+
+    Uses the FTS5 index with bm25 ranking when it exists, otherwise (or for
+    terms without any word characters) a LIKE scan over the same columns.
+    An empty term returns every employee ordered by name.
+    """
+    manager = manager or get_manager()
+    term = term.strip()
+    if not term:
+        return manager.execute("SELECT * FROM employees ORDER BY full_name", fetch=True)
+
+    match = employee_match_query(term)
+    if use_index is None:
+        use_index = has_employee_search_index(manager)
+    if use_index and match:
+        weights = ", ".join(str(weight) for _, weight in EMPLOYEE_SEARCH_COLUMNS)
+        return manager.execute(f"""
+            SELECT e.* FROM employees_fts
+            JOIN employees e ON e.id = employees_fts.rowid
+            WHERE employees_fts MATCH ?
+            ORDER BY bm25(employees_fts, {weights}), e.full_name
+        """, (match,), fetch=True)
+
+    conditions = " OR ".join(f"LOWER({name}) LIKE ?" for name, _ in EMPLOYEE_SEARCH_COLUMNS)
+    return manager.execute(f"SELECT * FROM employees WHERE {conditions} ORDER BY full_name",
+                           [f"%{term.lower()}%"] * len(EMPLOYEE_SEARCH_COLUMNS), fetch=True)
+
+def narrow_employee_search(rows, term, manager=None):
+    """
+    Filter rows returned by search_employees() for an earlier term down to
+    the rows matching term, keeping their order.
+
+    Only valid when term extends the earlier term: both the prefix match
+    and the LIKE fallback can then only drop rows, never add them. The
+    rules mirror search_employees(), approximating the FTS5 tokenizer with
+    lower-cased word characters.
+    """
+    manager = manager or get_manager()
+    searched = dict(EMPLOYEE_SEARCH_COLUMNS)
+    positions = [i for i, name in enumerate(_table_columns(manager.connection().cursor(), "employees"))
+                 if name in searched]
+    words = re.findall(r"\w+", term.lower())
+
+    if words and has_employee_search_index(manager):
+        def matches(row):
+            tokens = [token for i in positions if row[i] is not None
+                      for token in re.findall(r"\w+", str(row[i]).lower())]
+            return all(any(token.startswith(word) for token in tokens) for word in words)
+    else:
+        needle = term.strip().lower()
+
+        def matches(row):
+            return any(needle in str(row[i]).lower() for i in positions if row[i] is not None)
+    return [row for row in rows if matches(row)]
+
+
+# Changelog entries kept for workstations that reload incrementally; one
+# that falls further behind does a full reload instead
+EMPLOYEE_CHANGELOG_KEEP = 5000
+
+# Letter variants that people type interchangeably, folded to one form
+_ARABIC_FOLDING = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    "ـ": None,  # tatweel
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic-Indic digits
+})
+_ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+
+def normalize_name(text):
+    """
+    Fold text for name matching: lower case, no Arabic diacritics or
+    tatweel, and one form for alef, yaa, taa marbuta and hamza carriers,
+    so that "أحمد" and "احمد" compare equal.
+    """
+    text = text.strip().lower()
+    if not text.isascii():
+        text = _ARABIC_DIACRITICS.sub("", text).translate(_ARABIC_FOLDING)
+    return " ".join(text.split())
+
+
+class EmployeeRecord:
+    """The employee fields the screens look up, without the rest of the row."""
+
+    __slots__ = ("id", "full_name", "employee_code", "position", "department", "salary", "status")
+
+    def __init__(self, id, full_name, employee_code, position, department, salary, status):
+        self.id = id
+        self.full_name = full_name
+        self.employee_code = employee_code
+        self.position = position
+        self.department = department
+        self.salary = salary
+        self.status = status
+
+    def __repr__(self):
+        return f"EmployeeRecord({self.id}, {self.full_name!r}, {self.employee_code!r})"
+
+
+class EmployeeDirectory:
+    """
+    In-memory employee lookups by id, name and employee_code.
+
+    The directory keeps its own connection, so PRAGMA data_version changes
+    whenever any other connection commits, whether on this workstation or
+    another. Only then is the employee_changes log read, and only the
+    employees changed since the last sync are fetched again. Every lookup
+    syncs first, so callers never see stale data. A lock serializes syncs
+    and lookups, so a background thread may refresh() while the UI thread
+    reads.
+    """
+
+    _select = f"SELECT {', '.join(EmployeeRecord.__slots__)} FROM employees"
+
+    def __init__(self, db_name=None):
+        self.db_name = db_name or DB_NAME
+        self._conn = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._by_id = {}
+        self._by_name = {}
+        self._by_code = {}
+        self._sorted_names = None
+        self._prefix_keys = None
+        self._prefix_ids = None
+        self._data_version = None
+        self._schema_version = None
+        self._last_change = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = safe_connect(isolation_level=None, check_same_thread=False)
+            apply_performance_profile(self._conn, load_performance_profile()[1])
+        return self._conn
+
+    def close(self):
+        """Close the connection; the next lookup reconnects and reloads."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._reset()
+
+    def stale(self):
+        """True if any connection has committed since the last sync (one PRAGMA, no reads)."""
+        with self._lock:
+            return self._connection().execute("PRAGMA data_version").fetchone()[0] != self._data_version
+
+    def refresh(self):
+        """Bring the cache up to date. Returns True if anything changed."""
+        with self._lock:
+            return self._sync()
+
+    def _sync(self):
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return False
+
+        # data_version is recorded only once the sync succeeds, so a failed one is retried
+        conn.execute("BEGIN")  # one snapshot for the log and the rows
+        try:
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            first, last = conn.execute("SELECT min(seq), max(seq) FROM employee_changes").fetchone()
+            first, last = first or 0, last or 0
+            if (self._last_change is None or schema_version != self._schema_version
+                    or last < self._last_change or first > self._last_change + 1):
+                self._load_all(conn)
+            elif last > self._last_change:
+                changed = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT employee_id FROM employee_changes WHERE seq > ?", (self._last_change,))]
+                self._load_changed(conn, changed)
+            else:
+                conn.execute("COMMIT")
+                self._data_version = data_version
+                return False
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._data_version = data_version
+        self._schema_version = schema_version
+        self._last_change = last
+        if last - first > 2 * EMPLOYEE_CHANGELOG_KEEP:
+            try:
+                conn.execute("DELETE FROM employee_changes WHERE seq <= ?", (last - EMPLOYEE_CHANGELOG_KEEP,))
             except sqlite3.OperationalError:
-                pass
+                pass  # busy; pruning can wait for the next sync
+        return True
+
+    def _load_all(self, conn):
+        by_id = {}
+        for row in conn.execute(self._select):
+            by_id[row[0]] = EmployeeRecord(*row)
+        self._by_id = by_id
+        self._by_name = {}
+        self._by_code = {}
+        for record in by_id.values():
+            self._index(record)
+        self._sorted_names = None
+        self._prefix_keys = None
+
+    def _load_changed(self, conn, employee_ids):
+        for start in range(0, len(employee_ids), 500):
+            chunk = employee_ids[start:start + 500]
+            for employee_id in chunk:
+                record = self._by_id.pop(employee_id, None)
+                if record is not None:
+                    self._unindex(record)
+            rows = conn.execute(f"{self._select} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            for row in rows:
+                record = EmployeeRecord(*row)
+                self._by_id[record.id] = record
+                self._index(record)
+        self._sorted_names = None
+        self._prefix_keys = None
+
+    def _index(self, record):
+        self._by_name.setdefault(record.full_name, []).append(record)
+        if record.employee_code:
+            self._by_code[record.employee_code] = record
+
+    def _unindex(self, record):
+        same_name = self._by_name.get(record.full_name, [])
+        same_name[:] = [r for r in same_name if r.id != record.id]
+        if not same_name:
+            self._by_name.pop(record.full_name, None)
+        if record.employee_code and self._by_code.get(record.employee_code) is record:
+            del self._by_code[record.employee_code]
+
+    def get(self, employee_id):
+        """Return the record with this id, or None."""
+        with self._lock:
+            self.refresh()
+            return self._by_id.get(employee_id)
+
+    def by_name(self, full_name):
+        """Return the first record with this exact name, or None."""
+        with self._lock:
+            self.refresh()
+            records = self._by_name.get(full_name)
+            return records[0] if records else None
+
+    def named(self, full_name):
+        """Return every record with this exact name."""
+        with self._lock:
+            self.refresh()
+            return list(self._by_name.get(full_name, ()))
+
+    def by_code(self, employee_code):
+        """Return the record with this employee_code, or None."""
+        with self._lock:
+            self.refresh()
+            return self._by_code.get(employee_code)
+
+    def _build_prefix_index(self):
+        # Every record is reachable from its normalized full name, from each
+        # later word of the name onwards ("محمد علي" in "احمد محمد علي") and
+        # from its employee_code
+        entries = []
+        normalized = {}
+        for record in self._by_id.values():
+            name = record.full_name or ""
+            if name not in normalized:
+                normalized[name] = normalize_name(name)
+            words = normalized[name].split()
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), record.id))
+            if record.employee_code:
+                entries.append((normalize_name(record.employee_code), record.id))
+        entries.sort()
+        self._prefix_keys = [key for key, _ in entries]
+        self._prefix_ids = [employee_id for _, employee_id in entries]
+
+    def search(self, text, limit=20):
+        """
+        Return up to limit records whose name, a word of the name or
+        employee_code starts with text, compared with normalize_name().
+        An exact employee_code comes first; an empty text returns the
+        first records by name.
+        """
+        with self._lock:
+            self.refresh()
+            key = normalize_name(text)
+            if not key:
+                records = []
+                for name in self.names():
+                    records.extend(self._by_name[name])
+                    if len(records) >= limit:
+                        break
+                return records[:limit]
+
+            if self._prefix_keys is None:
+                self._build_prefix_index()
+            results = []
+            exact = self._by_code.get(text.strip())
+            if exact is not None:
+                results.append(exact)
+            seen = {record.id for record in results}
+            position = bisect.bisect_left(self._prefix_keys, key)
+            while (len(results) < limit and position < len(self._prefix_keys)
+                   and self._prefix_keys[position].startswith(key)):
+                employee_id = self._prefix_ids[position]
+                if employee_id not in seen:
+                    seen.add(employee_id)
+                    results.append(self._by_id[employee_id])
+                position += 1
+            return results
+
+    def label(self, record):
+        """Display name for record; names shared by several employees get the code appended."""
+        with self._lock:
+            self.refresh()
+            if len(self._by_name.get(record.full_name, ())) > 1:
+                return f"{record.full_name} ({record.employee_code or '#' + str(record.id)})"
+            return record.full_name
+
+    def names(self):
+        """Return the distinct employee names, sorted."""
+        with self._lock:
+            self.refresh()
+            if self._sorted_names is None:
+                self._sorted_names = sorted(self._by_name)
+            return self._sorted_names
+
+    def __len__(self):
+        with self._lock:
+            self.refresh()
+            return len(self._by_id)
+
+    def __iter__(self):
+        with self._lock:
+            self.refresh()
+            return iter(list(self._by_id.values()))
+
+# ---------------- Table change counters ----------------
+# Tables shown in the UI grids; every committed write bumps the table's
+# counter, so a client can tell its own row-level edits from other writers.
+# The same triggers keep each table's row_count, e.g. the employee headcount.
+VERSIONED_TABLES = ("employees", "attendance", "leaves", "salaries")
+
+# Statements that write, for ConnectionManager.execute's implicit transaction
+_WRITE_STATEMENT = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+# Counter bumps made by this process's committed transactions, per table.
+# Subtracting them from table_versions leaves the changes other
+# workstations made, whichever thread or background job wrote ours.
+_own_versions = {}
+_own_versions_lock = threading.Lock()
+
+def _read_table_versions(conn):
+    try:
+        return dict(conn.execute("SELECT name, version FROM table_versions"))
+    except sqlite3.OperationalError:  # before the migration that creates it
+        return {}
+
+def _record_own_changes(before, after):
+    """Add the counter bumps of one committed transaction to _own_versions."""
+    with _own_versions_lock:
+        for table, version in after.items():
+            if table in before and version != before[table]:
+                _own_versions[table] = _own_versions.get(table, 0) + version - before[table]
+
+def table_versions(manager=None):
+    """Return {table: change counter} for VERSIONED_TABLES (see _migration_table_versions)."""
+    manager = manager or get_manager()
+    return dict(manager.execute("SELECT name, version FROM table_versions", fetch=True))
+
+def external_table_versions(manager=None):
+    """
+    Return {table: change counter less this process's own changes}. The
+    value moves only when another workstation writes the table.
+    """
+    with _own_versions_lock:
+        own = dict(_own_versions)
+    return {table: version - own.get(table, 0) for table, version in table_versions(manager).items()}
+
+def attendance_day_stats(day, manager=None):
+    """
+    Return (present, late, work_minutes, headcount) for day in one single-row
+    read of the trigger-maintained daily_attendance_summary and row counts.
+    """
+    manager = manager or get_manager()
+    return manager.execute("""
+        SELECT COALESCE(s.present, 0), COALESCE(s.late, 0), COALESCE(s.total_minutes, 0),
+               (SELECT row_count FROM table_versions WHERE name = 'employees')
+        FROM (SELECT ? AS date) d
+        LEFT JOIN daily_attendance_summary s ON s.date = d.date
+    """, (day,), fetch=True)[0]
+
+# ---------------- Leave counters ----------------
+# Dimensions of leave_counters and the SQL value of each for a leaves row;
+# every (dimension, value, status) cell holds a request count and a day total.
+LEAVE_COUNTER_DIMENSIONS = {
+    "all": "''",
+    "type": "{row}.type",
+    "month": "substr({row}.start_date, 1, 7)",
+    "department": "COALESCE((SELECT department FROM employees WHERE id = {row}.employee_id), '')",
+}
+
+def _leave_counter_rows_sql(row, source=""):
+    """SELECT yielding (dimension, value, status, days) once per dimension for the leaves row alias row."""
+    return " UNION ALL ".join(
+        f"SELECT '{dimension}' AS dimension, {value.format(row=row)} AS value, {row}.status AS status, "
+        f"{row}.days AS days {source}"
+        for dimension, value in LEAVE_COUNTER_DIMENSIONS.items())
+
+def _leave_counters_fill_sql():
+    """INSERT filling leave_counters from scratch with one grouped pass over leaves."""
+    return f"""
+        INSERT INTO leave_counters (dimension, value, status, requests, days)
+        SELECT dimension, value, status, COUNT(*), COALESCE(SUM(days), 0)
+        FROM ({_leave_counter_rows_sql("l", "FROM leaves l")})
+        GROUP BY dimension, value, status
+    """
+
+def leave_counters(dimensions=None, manager=None):
+    """
+    Return [(dimension, value, status, requests, days)] from leave_counters
+    in one query, optionally limited to the given dimensions.
+    """
+    manager = manager or get_manager()
+    query = "SELECT dimension, value, status, requests, days FROM leave_counters WHERE requests != 0"
+    params = ()
+    if dimensions:
+        query += f" AND dimension IN ({', '.join('?' * len(dimensions))})"
+        params = tuple(dimensions)
+    return manager.execute(query + " ORDER BY dimension, value, status", params, fetch=True)
+
+def rebuild_leave_counters(manager=None):
+    """Recompute leave_counters from the leaves table; returns the number of counter rows."""
+    manager = manager or get_manager()
+    with manager.transaction() as conn:
+        conn.execute("DELETE FROM leave_counters")
+        conn.execute(_leave_counters_fill_sql())
+        return conn.execute("SELECT COUNT(*) FROM leave_counters").fetchone()[0]
+
+# ---------------- Leave overlaps ----------------
+# Leave requests that still hold their dates: pending and approved
+ACTIVE_LEAVE_STATUSES = ("معلق", "معتمد")
+
+def find_leave_conflicts(employee_id, start_date, end_date, exclude_id=None, statuses=ACTIVE_LEAVE_STATUSES,
+                         manager=None):
+    """
+    Return (leaves, attendance) overlapping start_date..end_date for one
+    employee: leave rows (id, type, start_date, end_date, status) in
+    statuses, and attendance rows (date, check_in, check_out) with a
+    check-in. Both are range scans on (employee_id, date) indexes.
+    """
+    manager = manager or get_manager()
+    params = [employee_id, end_date, start_date, *statuses]
+    query = f"""
+        SELECT id, type, start_date, end_date, status FROM leaves
+        WHERE employee_id = ? AND start_date <= ? AND end_date >= ?
+          AND status IN ({', '.join('?' * len(statuses))})
+    """
+    if exclude_id is not None:
+        query += " AND id != ?"
+        params.append(exclude_id)
+    leaves = manager.execute(query + " ORDER BY start_date", params, fetch=True)
+    attendance = manager.execute("""
+        SELECT date, check_in, check_out FROM attendance
+        WHERE employee_id = ? AND date BETWEEN ? AND ? AND check_in IS NOT NULL
+        ORDER BY date
+    """, (employee_id, start_date, end_date), fetch=True)
+    return leaves, attendance
+
+def audit_leave_overlaps(statuses=ACTIVE_LEAVE_STATUSES, manager=None):
+    """
+    Return every pair of overlapping leaves of the same employee as
+    (employee_id, first_id, second_id, overlap_start, overlap_end).
+
+    One sweep over the leaves sorted by (employee_id, start_date) from the
+    overlap index: each leave is compared only with the earlier leaves of
+    the same employee that have not ended before it starts.
+    """
+    manager = manager or get_manager()
+    rows = manager.execute(f"""
+        SELECT employee_id, start_date, end_date, id FROM leaves
+        WHERE status IN ({', '.join('?' * len(statuses))})
+        ORDER BY employee_id, start_date, end_date
+    """, statuses, fetch=True)
+    pairs = []
+    current_employee = None
+    active = []  # heap of (end_date, id) for the current employee
+    for employee_id, start_date, end_date, leave_id in rows:
+        if employee_id != current_employee:
+            current_employee = employee_id
+            active = []
+        while active and active[0][0] < start_date:
+            heapq.heappop(active)
+        for other_end, other_id in active:
+            pairs.append((employee_id, other_id, leave_id, start_date, min(end_date, other_end)))
+        heapq.heappush(active, (end_date, leave_id))
+    return pairs
+
+# ---------------- Leave ledger ----------------
+# Status of a leave request whose days are taken from the balance
+APPROVED_LEAVE_STATUS = "معتمد"
+
+# The one leave type with an entitlement: it accrues monthly and its
+# approved days are debited. Other types are not tracked in the ledger.
+ANNUAL_LEAVE_TYPE = "إجازة سنوية"
+
+# Employee statuses that count as inactive: no leave accrual and no
+# payroll run. Any other status, or none, is active.
+INACTIVE_EMPLOYEE_STATUSES = ("مستقيل", "منتهي الخدمة", "موقوف", "غير نشط", "inactive", "resigned", "terminated")
+
+# Defaults for the [leave] section of the config file
+LEAVE_DEFAULTS = {
+    "annual_days": 30.0,             # yearly entitlement, posted as annual_days / 12 per month
+    "carry_forward_max": 15.0,       # unused days moved into the next year
+}
+
+# leave_ledger entry types and the leave_balances column each one adds to
+LEDGER_ENTRY_COLUMNS = {
+    "accrual": "accrued",
+    "adjustment": "accrued",
+    "carry_forward": "carried",
+    "usage": "used",
+}
+
+def load_leave_settings(config_file=None):
+    """Return the [leave] settings from the config file merged with the defaults."""
+    config = configparser.ConfigParser()
+    config.read(config_file or CONFIG_FILE, encoding="utf-8")
+    settings = dict(LEAVE_DEFAULTS)
+    if config.has_section("leave"):
+        for key, default in LEAVE_DEFAULTS.items():
+            value = config["leave"].get(key)
+            if value is None:
+                continue
+            try:
+                settings[key] = type(default)(value)
+            except ValueError:
+                print(f"Invalid value for leave {key}: {value}")
+    return settings
+
+def post_leave_accruals(through=None, settings=None, manager=None):
+    """
+    Post the monthly annual leave accrual for every active employee hired
+    by the end of each month, from January of the earliest year on the
+    ledger up to through's month (default: today), so past years with
+    leave taken get their entitlement too. Months already posted are
+    skipped by the ledger's unique period key, so this is safe to run at
+    every start. Returns the number of entries posted.
+    """
+    manager = manager or get_manager()
+    settings = settings or load_leave_settings()
+    through = through or datetime.now().date()
+    monthly = round(settings["annual_days"] / 12, 4)
+    posted = 0
+    with manager.transaction() as conn:
+        first_year = conn.execute("SELECT MIN(year) FROM leave_ledger").fetchone()[0] or through.year
+        for year in range(min(first_year, through.year), through.year + 1):
+            for month in range(1, (through.month if year == through.year else 12) + 1):
+                period = f"{year}-{month:02d}"
+                posted += conn.execute(f"""
+                    INSERT OR IGNORE INTO leave_ledger
+                        (employee_id, year, type, entry_type, days, period, entry_date)
+                    SELECT id, ?, ?, 'accrual', ?, ?, ? FROM employees
+                    WHERE COALESCE(hire_date, '') <= ?
+                      AND COALESCE(status, '') NOT IN ({', '.join('?' * len(INACTIVE_EMPLOYEE_STATUSES))})
+                """, (year, ANNUAL_LEAVE_TYPE, monthly, period, through.isoformat(), f"{period}-31",
+                      *INACTIVE_EMPLOYEE_STATUSES)).rowcount
+    return posted
+
+def carry_forward_leave(year, settings=None, manager=None):
+    """
+    Move each employee's unused annual leave balance in year, up to
+    carry_forward_max days, into year + 1. Already carried balances are
+    skipped. Returns the number of entries posted.
+    """
+    manager = manager or get_manager()
+    settings = settings or load_leave_settings()
+    with manager.transaction() as conn:
+        return conn.execute("""
+            INSERT OR IGNORE INTO leave_ledger
+                (employee_id, year, type, entry_type, days, period, entry_date, note)
+            SELECT employee_id, year + 1, type, 'carry_forward', MIN(balance, ?), ?, ?, ?
+            FROM leave_balances WHERE year = ? AND type = ? AND balance > 0
+        """, (settings["carry_forward_max"], str(year), datetime.now().strftime("%Y-%m-%d"), f"رصيد {year}",
+              year, ANNUAL_LEAVE_TYPE)).rowcount
+
+def leave_balances(employee_id=None, year=None, manager=None):
+    """
+    Return [(employee_id, full_name, year, type, accrued, carried, used,
+    balance)] from the trigger-maintained leave_balances, optionally for
+    one employee and/or one year.
+    """
+    manager = manager or get_manager()
+    conditions, params = [], []
+    if employee_id is not None:
+        conditions.append("b.employee_id = ?")
+        params.append(employee_id)
+    if year is not None:
+        conditions.append("b.year = ?")
+        params.append(year)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return manager.execute(f"""
+        SELECT b.employee_id, COALESCE(e.full_name, ''), b.year, b.type,
+               b.accrued, b.carried, b.used, b.balance
+        FROM leave_balances b LEFT JOIN employees e ON e.id = b.employee_id
+        {where}
+        ORDER BY b.year DESC, e.full_name, b.employee_id, b.type
+    """, params, fetch=True)
+
+def _ledger_balance_upsert(row, sign):
+    """INSERT adding sign * the ledger row's days to its leave_balances cell."""
+    values = ", ".join(
+        f"CASE WHEN {row}.entry_type IN ({', '.join(repr(t) for t, c in LEDGER_ENTRY_COLUMNS.items() if c == column)}) "
+        f"THEN {sign}{row}.days ELSE 0 END"
+        for column in ("accrued", "carried", "used"))
+    return f"""
+        INSERT INTO leave_balances (employee_id, year, type, accrued, carried, used)
+        VALUES ({row}.employee_id, {row}.year, {row}.type, {values})
+        ON CONFLICT(employee_id, year, type) DO UPDATE SET
+            accrued = accrued + excluded.accrued,
+            carried = carried + excluded.carried,
+            used = used + excluded.used;
+    """
+
+def _leave_usage_insert(row, sign, note, leave_type=None):
+    """INSERT posting sign * the leaves row's days as a usage entry when it is approved (and of leave_type)."""
+    type_filter = f" AND {row}.type = '{leave_type}'" if leave_type else ""
+    return f"""
+        INSERT INTO leave_ledger (employee_id, year, type, entry_type, days, leave_id, entry_date, note)
+        SELECT {row}.employee_id, CAST(substr({row}.start_date, 1, 4) AS INTEGER), {row}.type, 'usage',
+               {sign}{row}.days, {row}.id, date('now', 'localtime'), {note}
+        WHERE {row}.status = '{APPROVED_LEAVE_STATUS}'{type_filter};
+    """
+
+# ---------------- Payroll runs ----------------
+
+def _payroll_month(month):
+    """Month as stored in salaries.month ("01".."12")."""
+    return f"{int(month):02d}"
+
+# Defaults for the [payroll] section of the config file
+PAYROLL_DEFAULTS = {
+    "weekend": "fri,sat",                            # days off that are never counted as absences
+    "daily_hours": 8.0,                              # when employees.working_hours is not a number
+    "overtime_rate": 1.5,                            # overtime minutes are paid at this multiple
+    "late_rate": 1.0,                                # late minutes are deducted at this multiple
+    "hourly_payment_types": "ساعة,بالساعة,hourly",   # payment_type values paid by hours worked
+    "unpaid_leave_types": "إجازة بدون راتب",         # approved leaves that do not excuse an absence
+    "engine": "auto",                                # auto, numpy or python
+}
+
+_WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+def load_payroll_settings(config_file=None):
+    """Return the [payroll] settings from the config file merged with the defaults."""
+    config = configparser.ConfigParser()
+    config.read(config_file or CONFIG_FILE, encoding="utf-8")
+    settings = dict(PAYROLL_DEFAULTS)
+    if config.has_section("payroll"):
+        for key, default in PAYROLL_DEFAULTS.items():
+            value = config["payroll"].get(key)
+            if value is None:
+                continue
+            try:
+                settings[key] = type(default)(value)
+            except ValueError:
+                print(f"Invalid value for payroll {key}: {value}")
+    return settings
+
+def _setting_list(settings, key):
+    return [item.strip() for item in settings[key].split(",") if item.strip()]
+
+def _payroll_number(text, default):
+    """A positive number from a free-text column, or default."""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+def load_payroll_inputs(conn, month, year, settings=None, today=None):
+    """
+    Read everything one month's payroll needs in four queries and return a
+    dict of plain lists, one entry per employee due a salary row:
+
+      ids, names, salaries, hourly, daily_minutes, first_day - per employee
+      working     - per day of the month: True on working days
+      cutoff      - days before this index have passed (later days are never absences)
+      attendance  - (employee_id, day, checked_in, late minutes, overtime minutes)
+      hourly_work - (employee_id, worked minutes) of the hourly staff
+      leaves      - (employee_id, first day, last day) of approved paid leaves
+      skipped     - active employees that already have a row for the month
+
+    Days are 0-based indexes into the month. Worked minutes are a generated
+    column that parses both times on every read, so they are summed only
+    for the hourly staff, whose pay depends on them.
+    """
+    settings = settings or load_payroll_settings()
+    month = _payroll_month(month)
+    days = calendar.monthrange(year, int(month))[1]
+    first, last = f"{year}-{month}-01", f"{year}-{month}-{days:02d}"
+    today = (today or datetime.now()).strftime("%Y-%m-%d")
+    rows = conn.execute(f"""
+        SELECT e.id, e.full_name, COALESCE(e.salary, 0), COALESCE(e.payment_type, ''), e.working_hours,
+               COALESCE(e.hire_date, ''),
+               EXISTS (SELECT 1 FROM salaries s WHERE s.employee_id = e.id AND s.month = ? AND s.year = ?)
+        FROM employees e
+        WHERE COALESCE(e.status, '') NOT IN ({', '.join('?' * len(INACTIVE_EMPLOYEE_STATUSES))})
+          AND COALESCE(e.hire_date, '') <= ?
+        ORDER BY e.id
+    """, (month, year, *INACTIVE_EMPLOYEE_STATUSES, last)).fetchall()
+    due = [row for row in rows if not row[6]]
+    hourly_types = _setting_list(settings, "hourly_payment_types")
+    weekend = {_WEEKDAYS[day[:3].lower()] for day in _setting_list(settings, "weekend") if day[:3].lower() in _WEEKDAYS}
+    first_weekday = calendar.weekday(year, int(month), 1)
+    unpaid = _setting_list(settings, "unpaid_leave_types")
+    if today > last:
+        cutoff = days
+    elif today >= first:
+        cutoff = int(today[8:10]) - 1
+    else:
+        cutoff = 0
+    return {
+        "ids": [row[0] for row in due],
+        "names": [row[1] for row in due],
+        "salaries": [float(row[2]) for row in due],
+        "hourly": [row[3].strip() in hourly_types for row in due],
+        "daily_minutes": [_payroll_number(row[4], settings["daily_hours"]) * 60 for row in due],
+        # Employees hired during the month are not paid for the days before
+        "first_day": [int(row[5][8:10]) - 1 if row[5][:8] == first[:8] and row[5][8:10].isdigit() else 0
+                      for row in due],
+        "working": [(first_weekday + day) % 7 not in weekend for day in range(days)],
+        "cutoff": cutoff,
+        "attendance": conn.execute("""
+            SELECT employee_id, CAST(substr(date, 9, 2) AS INTEGER) - 1, check_in IS NOT NULL,
+                   COALESCE(late_minutes, 0), COALESCE(overtime_minutes, 0)
+            FROM attendance WHERE date BETWEEN ? AND ?
+        """, (first, last)).fetchall(),
+        # CROSS JOIN keeps employees outermost, so only the hourly staff's rows are read
+        "hourly_work": conn.execute(f"""
+            SELECT e.id, CAST(TOTAL(a.work_minutes) AS INTEGER)
+            FROM employees e CROSS JOIN attendance a ON a.employee_id = e.id AND a.date BETWEEN ? AND ?
+            WHERE TRIM(COALESCE(e.payment_type, '')) IN ({', '.join('?' * len(hourly_types))})
+            GROUP BY e.id
+        """, (first, last, *hourly_types)).fetchall(),
+        "leaves": conn.execute(f"""
+            SELECT employee_id,
+                   CASE WHEN start_date < ? THEN 0 ELSE CAST(substr(start_date, 9, 2) AS INTEGER) - 1 END,
+                   CASE WHEN end_date > ? THEN ? ELSE CAST(substr(end_date, 9, 2) AS INTEGER) - 1 END
+            FROM leaves
+            WHERE status = '{APPROVED_LEAVE_STATUS}' AND start_date <= ? AND end_date >= ?
+              AND type NOT IN ({', '.join('?' * len(unpaid))})
+        """, (first, last, days - 1, last, first, *unpaid)).fetchall(),
+        "skipped": len(rows) - len(due),
+    }
+
+def _payroll_amounts(salary, hourly, daily_minutes, working_days, unpaid_days, late, overtime, work, settings,
+                     where):
+    """
+    Return (basic, bonuses, deductions) from per-employee totals. The same
+    arithmetic serves scalars and NumPy arrays; where(condition, a, b) picks
+    between the hourly and the monthly rule.
+
+    Monthly staff are paid their salary less unpaid working days at the
+    daily rate and late minutes at the minute rate; overtime is the bonus.
+    Hourly staff (salary is the hourly rate) are paid the hours worked and
+    the overtime premium on top.
+    """
+    daily_rate = salary / working_days if working_days else salary * 0
+    minute_rate = daily_rate / daily_minutes
+    monthly_bonus = overtime * minute_rate * settings["overtime_rate"]
+    monthly_deductions = unpaid_days * daily_rate + late * minute_rate * settings["late_rate"]
+    basic = where(hourly, work / 60 * salary, salary)
+    bonuses = where(hourly, overtime / 60 * salary * (settings["overtime_rate"] - 1), monthly_bonus)
+    deductions = where(hourly, salary * 0, monthly_deductions)
+    # Deductions never take the net salary below zero
+    deductions = where(deductions > basic + bonuses, basic + bonuses, deductions)
+    return basic, bonuses, deductions
+
+def _payroll_rows(inputs, basic, bonuses, deductions, absent, late, overtime, work):
+    rows = []
+    for i, employee_id in enumerate(inputs["ids"]):
+        b, plus, minus = round(float(basic[i]), 2), round(float(bonuses[i]), 2), round(float(deductions[i]), 2)
+        rows.append((employee_id, inputs["names"][i], b, plus, minus, round(b + plus - minus, 2),
+                     int(absent[i]), int(late[i]), int(overtime[i]),
+                     round(float(work[i]) / 60, 2) if inputs["hourly"][i] else None))
+    return rows
+
+def _payroll_python(inputs, settings):
+    """Pure-Python payroll engine: one pass over the attendance and leave rows."""
+    index = {employee_id: i for i, employee_id in enumerate(inputs["ids"])}
+    count = len(index)
+    covered = [set() for _ in range(count)]
+    late, overtime, work = [0] * count, [0] * count, [0] * count
+    for employee_id, day, checked_in, late_minutes, overtime_minutes in inputs["attendance"]:
+        i = index.get(employee_id)
+        if i is None:
+            continue
+        if checked_in:
+            covered[i].add(day)
+        late[i] += late_minutes
+        overtime[i] += overtime_minutes
+    for employee_id, minutes in inputs["hourly_work"]:
+        i = index.get(employee_id)
+        if i is not None:
+            work[i] = minutes
+    for employee_id, first_day, last_day in inputs["leaves"]:
+        i = index.get(employee_id)
+        if i is not None:
+            covered[i].update(range(first_day, last_day + 1))
+
+    working = inputs["working"]
+    counted = [day for day in range(inputs["cutoff"]) if working[day]]
+    working_days = sum(working)
+    absent, rows = [], []
+    for i in range(count):
+        start = inputs["first_day"][i]
+        absent.append(sum(1 for day in counted if day >= start and day not in covered[i]))
+        amounts = _payroll_amounts(inputs["salaries"][i], inputs["hourly"][i], inputs["daily_minutes"][i],
+                                   working_days, absent[i] + sum(working[:start]), late[i], overtime[i], work[i],
+                                   settings, lambda condition, a, b: a if condition else b)
+        rows.append(amounts)
+    basic, bonuses, deductions = zip(*rows) if rows else ((), (), ())
+    return _payroll_rows(inputs, basic, bonuses, deductions, absent, late, overtime, work)
+
+def _payroll_numpy(inputs, settings):
+    """NumPy payroll engine: an employees x days matrix of covered days and per-employee sums."""
+    ids = np.array(inputs["ids"], dtype=np.int64)
+    count, days = len(ids), len(inputs["working"])
+    if not count:
+        return []
+    day = np.arange(days)
+    covered = np.zeros((count, days), dtype=bool)
+
+    def rows_of(employee_ids):
+        """Row index of each employee id and a mask of the ids that are in the run."""
+        position = np.minimum(np.searchsorted(ids, employee_ids), count - 1)
+        return position, ids[position] == employee_ids
+
+    attendance = np.fromiter(itertools.chain.from_iterable(inputs["attendance"]), dtype=np.int64,
+                             count=len(inputs["attendance"]) * 5).reshape(-1, 5)
+    position, known = rows_of(attendance[:, 0])
+    attendance, position = attendance[known], position[known]
+    checked_in = attendance[:, 2] == 1
+    covered[position[checked_in], attendance[checked_in, 1]] = True
+    late = np.bincount(position, weights=attendance[:, 3], minlength=count)
+    overtime = np.bincount(position, weights=attendance[:, 4], minlength=count)
+
+    hourly_work = np.array(inputs["hourly_work"], dtype=np.int64).reshape(-1, 2)
+    position, known = rows_of(hourly_work[:, 0])
+    work = np.zeros(count)
+    work[position[known]] = hourly_work[known, 1]
+
+    leaves = np.array(inputs["leaves"], dtype=np.int64).reshape(-1, 3)
+    position, known = rows_of(leaves[:, 0])
+    leaves, position = leaves[known], position[known]
+    # +1 on a leave's first day and -1 after its last; a running sum > 0 marks the days on leave
+    edges = np.zeros((count, days + 1), dtype=np.int64)
+    np.add.at(edges, (position, leaves[:, 1]), 1)
+    np.add.at(edges, (position, leaves[:, 2] + 1), -1)
+    covered |= np.cumsum(edges, axis=1)[:, :days] > 0
+
+    working = np.array(inputs["working"], dtype=bool)
+    first_day = np.array(inputs["first_day"], dtype=np.int64)
+    employed = day[None, :] >= first_day[:, None]
+    counted = working & (day < inputs["cutoff"])
+    absent = (counted & employed & ~covered).sum(axis=1)
+    before_hire = (working & ~employed).sum(axis=1)
+    basic, bonuses, deductions = _payroll_amounts(
+        np.array(inputs["salaries"], dtype=float), np.array(inputs["hourly"], dtype=bool),
+        np.array(inputs["daily_minutes"], dtype=float), int(working.sum()), absent + before_hire,
+        late, overtime, work, settings, np.where)
+    return _payroll_rows(inputs, basic, bonuses, deductions, absent, late, overtime, work)
+
+def payroll_engine(settings=None):
+    """Name of the engine compute_payroll uses: numpy when installed (or forced), else python."""
+    engine = (settings or load_payroll_settings())["engine"]
+    if engine == "python" or np is None:
+        return "python"
+    return "numpy"
+
+def compute_payroll(conn, month, year, settings=None, engine=None):
+    """
+    Return ([(employee_id, full_name, basic_salary, bonuses, deductions,
+    net_salary, absent_days, late_minutes, overtime_minutes, worked_hours)]
+    for every employee due a salary row, number skipped because their row
+    already exists). Absences, lateness and overtime come from the month's
+    attendance; approved paid leaves excuse absences.
+    """
+    settings = settings or load_payroll_settings()
+    inputs = load_payroll_inputs(conn, month, year, settings)
+    engine = engine or payroll_engine(settings)
+    rows = (_payroll_numpy if engine == "numpy" else _payroll_python)(inputs, settings)
+    return rows, inputs["skipped"]
+
+def run_payroll(month, year, dry_run=False, manager=None):
+    """
+    Generate the salary rows of every active employee for month/year in one
+    transaction and return (run_id, rows, skipped) with rows as returned by
+    compute_payroll. Employees that already have a row for the month are
+    skipped, so a run never overwrites manual entries or an earlier run.
+    With dry_run nothing is written and run_id is None.
+    """
+    manager = manager or get_manager()
+    month = _payroll_month(month)
+    # A preview only reads: a deferred transaction gives it a consistent
+    # snapshot without holding the write lock other workstations wait on
+    with manager.transaction(immediate=not dry_run) as conn:
+        rows, skipped = compute_payroll(conn, month, year)
+        if dry_run or not rows:
+            return None, rows, skipped
+        today = datetime.now().strftime("%Y-%m-%d")
+        run_id = conn.execute(
+            "INSERT INTO payroll_runs (month, year, run_date, employees, total_net) VALUES (?, ?, ?, ?, ?) RETURNING id",
+            (month, year, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(rows),
+             sum(row[5] for row in rows))).fetchone()[0]
+        conn.executemany("""
+            INSERT INTO salaries (employee_id, month, year, basic_salary, bonuses, deductions, net_salary,
+                                  payment_date, payroll_run_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(employee_id, month, year) DO NOTHING
+        """, ((employee_id, month, year, basic, bonuses, deductions, net, today, run_id)
+              for employee_id, _, basic, bonuses, deductions, net, *_ in rows))
+    return run_id, rows, skipped
+
+def rollback_payroll_run(run_id, manager=None):
+    """Delete the salary rows a payroll run created and mark it rolled back; returns the rows deleted."""
+    manager = manager or get_manager()
+    with manager.transaction() as conn:
+        deleted = conn.execute("DELETE FROM salaries WHERE payroll_run_id = ?", (run_id,)).rowcount
+        conn.execute("UPDATE payroll_runs SET rolled_back_at = ? WHERE id = ? AND rolled_back_at IS NULL",
+                     (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), run_id))
+        return deleted
+
+def payroll_runs(limit=50, manager=None):
+    """Return the latest payroll runs as (id, month, year, run_date, employees, total_net, rolled_back_at)."""
+    manager = manager or get_manager()
+    return manager.execute("""
+        SELECT id, month, year, run_date, employees, total_net, rolled_back_at
+        FROM payroll_runs ORDER BY id DESC LIMIT ?
+    """, (limit,), fetch=True)
+
+def _table_columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+def _migration_base_schema(cur):
+    """Create the core tables and bring older layouts up to date."""
+    # Create 'employees' table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            position TEXT,
+            salary REAL,
+            hire_date TEXT,
+            email TEXT UNIQUE,
+            phone TEXT,
+            address TEXT,
+            employee_code TEXT UNIQUE,
+            birth_date TEXT,
+            gender TEXT,
+            status TEXT,
+            department TEXT,
+            location TEXT,
+            profession TEXT,
+            nationality TEXT,
+            religion TEXT,
+            marital_status TEXT,
+            emp_type TEXT,
+            code_number TEXT,
+            old_file_number TEXT,
+            working_hours TEXT,
+            payment_type TEXT,
+            contract_entity TEXT
+        )
+    """)
+
+    # Create 'attendance' table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            check_in TEXT,
+            check_out TEXT,
+            FOREIGN KEY(employee_id) REFERENCES employees(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Create 'leaves' table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS leaves (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            reason TEXT,
+            status TEXT NOT NULL DEFAULT 'معلق',
+            request_date TEXT NOT NULL,
+            FOREIGN KEY(employee_id) REFERENCES employees(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Create 'salaries' table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS salaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            basic_salary REAL NOT NULL,
+            bonuses REAL DEFAULT 0,
+            deductions REAL DEFAULT 0,
+            net_salary REAL NOT NULL,
+            payment_date TEXT NOT NULL,
+            FOREIGN KEY(employee_id) REFERENCES employees(id) ON DELETE CASCADE,
+            UNIQUE(employee_id, month, year) -- Ensures only one salary record per employee per month/year
+        )
+    """)
+
+    # Create 'admin' table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS admin (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+    """)
+
+    # --- Upgrade employees table from older layouts ---
+    cols = _table_columns(cur, "employees")
+    if 'full_name' not in cols:
+        if 'name' in cols:
+            cur.execute("ALTER TABLE employees RENAME COLUMN name TO full_name")
         else:
             cur.execute("ALTER TABLE employees ADD COLUMN full_name TEXT")
+    # SQLite cannot add UNIQUE columns, so late additions are plain TEXT
     for col in [
         'email', 'phone', 'address', 'employee_code',
         'birth_date', 'gender', 'status', 'department', 'location',
@@ -227,44 +2063,726 @@ def upgrade_db():
         if col not in cols:
             cur.execute(f"ALTER TABLE employees ADD COLUMN {col} TEXT")
 
-    # Upgrade leaves table
-    cur.execute("PRAGMA table_info(leaves)")
-    cols = [c[1] for c in cur.fetchall()]
+    # --- Upgrade leaves table ---
+    cols = _table_columns(cur, "leaves")
     if 'days' not in cols:
         cur.execute("ALTER TABLE leaves ADD COLUMN days INTEGER")
     if 'request_date' not in cols:
         cur.execute("ALTER TABLE leaves ADD COLUMN request_date TEXT")
 
-    # Upgrade salaries table
-    cur.execute("PRAGMA table_info(salaries)")
-    cols = [c[1] for c in cur.fetchall()]
+    # --- Upgrade salaries table ---
+    cols = _table_columns(cur, "salaries")
     if 'year' not in cols:
         cur.execute("ALTER TABLE salaries ADD COLUMN year INTEGER")
-    if 'basic_salary' not in cols:
-        if 'base_salary' in cols:
-            try:
-                cur.execute("ALTER TABLE salaries RENAME COLUMN base_salary TO basic_salary")
-            except sqlite3.OperationalError:
-                pass
-        else:
-            cur.execute("ALTER TABLE salaries ADD COLUMN basic_salary REAL")
-    if 'bonuses' not in cols:
-        if 'allowances' in cols:
-            try:
-                cur.execute("ALTER TABLE salaries RENAME COLUMN allowances TO bonuses")
-            except sqlite3.OperationalError:
-                pass
-        else:
-            cur.execute("ALTER TABLE salaries ADD COLUMN bonuses REAL")
-    if 'deductions' not in cols:
-        cur.execute("ALTER TABLE salaries ADD COLUMN deductions REAL")
-    if 'net_salary' not in cols:
-        cur.execute("ALTER TABLE salaries ADD COLUMN net_salary REAL")
-    if 'payment_date' not in cols:
-        cur.execute("ALTER TABLE salaries ADD COLUMN payment_date TEXT")
+    for new_name, old_name, col_type in [
+        ('basic_salary', 'base_salary', 'REAL'),
+        ('bonuses', 'allowances', 'REAL')]:
+        if new_name not in cols:
+            if old_name in cols:
+                cur.execute(f"ALTER TABLE salaries RENAME COLUMN {old_name} TO {new_name}")
+            else:
+                cur.execute(f"ALTER TABLE salaries ADD COLUMN {new_name} {col_type}")
+    for col, col_type in [('deductions', 'REAL'), ('net_salary', 'REAL'), ('payment_date', 'TEXT')]:
+        if col not in cols:
+            cur.execute(f"ALTER TABLE salaries ADD COLUMN {col} {col_type}")
+
+def _migration_hot_query_indexes(cur):
+    """Secondary indexes for the attendance, leave and salary screens."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attendance_employee_date ON attendance(employee_id, date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leaves_status ON leaves(status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leaves_request_date ON leaves(request_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_salaries_year_month ON salaries(year, month)")
+
+def _migration_integrity_checks(cur):
+    """History table for run_integrity_check()."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS integrity_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            checked_at TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            ok INTEGER NOT NULL,
+            result TEXT,
+            duration_ms INTEGER
+        )
+    """)
+
+def _migration_unique_attendance_day(cur):
+    """Merge duplicate attendance rows, then allow one row per employee per day."""
+    # Keep the oldest row of each group with the earliest check-in and the
+    # latest check-out seen across the duplicates
+    cur.execute("""
+        UPDATE attendance SET
+            check_in = (SELECT MIN(a2.check_in) FROM attendance a2
+                        WHERE a2.employee_id = attendance.employee_id AND a2.date = attendance.date),
+            check_out = (SELECT MAX(a2.check_out) FROM attendance a2
+                         WHERE a2.employee_id = attendance.employee_id AND a2.date = attendance.date)
+        WHERE id IN (SELECT MIN(id) FROM attendance
+                     GROUP BY employee_id, date HAVING COUNT(*) > 1)
+    """)
+    cur.execute("""
+        DELETE FROM attendance
+        WHERE id NOT IN (SELECT MIN(id) FROM attendance GROUP BY employee_id, date)
+    """)
+    if cur.rowcount:
+        print(f"Merged {cur.rowcount} duplicate attendance rows")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_employee_date ON attendance(employee_id, date)")
+    # The unique index serves the same lookups as the plain one
+    cur.execute("DROP INDEX IF EXISTS idx_attendance_employee_date")
+
+# Columns indexed for employee search and their bm25 weights: a hit in the
+# name or code ranks above one in the department
+EMPLOYEE_SEARCH_COLUMNS = (
+    ("full_name", 10.0),
+    ("employee_code", 8.0),
+    ("email", 4.0),
+    ("phone", 4.0),
+    ("position", 2.0),
+    ("department", 2.0),
+)
+
+def _migration_employee_search(cur):
+    """
+    Full-text index over the searchable employee columns, kept in sync by
+    triggers. SQLite builds without FTS5 skip this step and
+    search_employees() falls back to LIKE.
+    """
+    columns = ", ".join(name for name, _ in EMPLOYEE_SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{name}" for name, _ in EMPLOYEE_SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{name}" for name, _ in EMPLOYEE_SEARCH_COLUMNS)
+    try:
+        cur.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5(
+                {columns}, content='employees', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search not available, using LIKE search: {e}")
+        return
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS employees_fts_insert AFTER INSERT ON employees BEGIN
+            INSERT INTO employees_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS employees_fts_delete AFTER DELETE ON employees BEGIN
+            INSERT INTO employees_fts(employees_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS employees_fts_update AFTER UPDATE OF {columns} ON employees BEGIN
+            INSERT INTO employees_fts(employees_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO employees_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    cur.execute("INSERT INTO employees_fts(employees_fts) VALUES ('rebuild')")
+
+def _migration_employee_changes(cur):
+    """Log of changed employee ids read by EmployeeDirectory for incremental reloads."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS employee_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS employee_changes_insert AFTER INSERT ON employees BEGIN
+            INSERT INTO employee_changes (employee_id) VALUES (new.id);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS employee_changes_update AFTER UPDATE ON employees BEGIN
+            INSERT INTO employee_changes (employee_id) SELECT old.id WHERE old.id != new.id;
+            INSERT INTO employee_changes (employee_id) VALUES (new.id);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS employee_changes_delete AFTER DELETE ON employees BEGIN
+            INSERT INTO employee_changes (employee_id) VALUES (old.id);
+        END
+    """)
+
+def _migration_employee_name_index(cur):
+    """Keyset pages of the employee list are read in (full_name, id) order."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_full_name ON employees(full_name)")
+
+def _migration_table_versions(cur):
+    """Per-table change counters bumped by triggers, read by table_versions()."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in VERSIONED_TABLES:
+        cur.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            """)
+
+# Start of the working day in minutes after midnight; check-ins after it are late
+WORK_START_MINUTES = 8 * 60
+
+def _time_minutes_sql(column):
+    """SQL expression for the minutes after midnight of an "HH:MM" column; NULL if empty or malformed."""
+    return (f"CASE WHEN {column} GLOB '[01][0-9]:[0-5][0-9]' OR {column} GLOB '2[0-3]:[0-5][0-9]' "
+            f"THEN substr({column}, 1, 2) * 60 + substr({column}, 4, 2) "
+            f"WHEN {column} GLOB '[0-9]:[0-5][0-9]' THEN substr({column}, 1, 1) * 60 + substr({column}, 3, 2) END")
+
+def _migration_attendance_minutes(cur):
+    """
+    Minute columns for attendance computed by SQLite from check_in/check_out.
+
+    VIRTUAL generated columns cost nothing on write and are evaluated in C
+    when a query reads them, so screens and reports can aggregate hours and
+    lateness set-wise instead of parsing times row by row in Python.
+    """
+    check_in = _time_minutes_sql("check_in")
+    check_out = _time_minutes_sql("check_out")
+    columns = {
+        "check_in_minutes": check_in,
+        "check_out_minutes": check_out,
+        # A check-out earlier than the check-in belongs to the next day (night work)
+        "work_minutes": f"(({check_out}) - ({check_in}) + 1440) % 1440",
+        "late_minutes": f"max(({check_in}) - {WORK_START_MINUTES}, 0)",
+    }
+    cur.execute("PRAGMA table_xinfo(attendance)")
+    existing = {row[1] for row in cur.fetchall()}
+    for column, expression in columns.items():
+        if column not in existing:
+            cur.execute(f"ALTER TABLE attendance ADD COLUMN {column} INTEGER GENERATED ALWAYS AS ({expression}) VIRTUAL")
+
+def _migration_daily_attendance_summary(cur):
+    """
+    Per-day attendance totals and per-table row counts kept current by
+    triggers, so the stats bar and day-by-day trends never rescan attendance.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_attendance_summary (
+            date TEXT PRIMARY KEY,
+            present INTEGER NOT NULL DEFAULT 0,
+            late INTEGER NOT NULL DEFAULT 0,
+            total_minutes INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    cur.execute("DELETE FROM daily_attendance_summary")
+    cur.execute("""
+        INSERT INTO daily_attendance_summary (date, present, late, total_minutes)
+        SELECT date, COUNT(NULLIF(check_in, '')), COUNT(CASE WHEN late_minutes > 0 THEN 1 END),
+               COALESCE(SUM(work_minutes), 0)
+        FROM attendance GROUP BY date
+    """)
+
+    def add(row, sign):
+        """Statement adding (sign=+) or removing (sign=-) one attendance row from its day."""
+        return f"""
+            INSERT INTO daily_attendance_summary (date, present, late, total_minutes)
+            VALUES ({row}.date, {sign}(NULLIF({row}.check_in, '') IS NOT NULL),
+                    {sign}COALESCE({row}.late_minutes > 0, 0), {sign}COALESCE({row}.work_minutes, 0))
+            ON CONFLICT(date) DO UPDATE SET
+                present = present + excluded.present,
+                late = late + excluded.late,
+                total_minutes = total_minutes + excluded.total_minutes;
+        """
+
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_insert AFTER INSERT ON attendance BEGIN
+            {add("new", "+")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_update
+        AFTER UPDATE OF date, check_in, check_out ON attendance BEGIN
+            {add("old", "-")}
+            {add("new", "+")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_delete AFTER DELETE ON attendance BEGIN
+            {add("old", "-")}
+        END
+    """)
+
+    # Row counts ride on the change-counter triggers (one UPDATE per written row)
+    if "row_count" not in _table_columns(cur, "table_versions"):
+        cur.execute("ALTER TABLE table_versions ADD COLUMN row_count INTEGER NOT NULL DEFAULT 0")
+    for table in VERSIONED_TABLES:
+        cur.execute(f"UPDATE table_versions SET row_count = (SELECT COUNT(*) FROM {table}) WHERE name = ?", (table,))
+        for event, change in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+            cur.execute(f"DROP TRIGGER IF EXISTS {table}_version_{event.lower()}")
+            cur.execute(f"""
+                CREATE TRIGGER {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1, row_count = row_count {change}
+                    WHERE name = '{table}';
+                END
+            """)
+
+# Shift used for employees with no assignment in employee_shifts; cannot be deleted
+DEFAULT_SHIFT_ID = 1
+
+# Sets shift_id and the shift-relative minutes of the attendance row being
+# updated. Times are compared on a 24-hour circle centred on the shift start
+# (or end), so night shifts work: a check-in up to 12 hours after the start
+# is late, one before it is early.
+_ATTENDANCE_SHIFT_UPDATE = f"""
+    UPDATE attendance SET (shift_id, late_minutes, early_leave_minutes, overtime_minutes) = (
+        SELECT s.id,
+               CASE WHEN attendance.check_in_minutes IS NULL THEN NULL
+                    WHEN (attendance.check_in_minutes - s.start_minutes + 2160) % 1440 - 720 > s.grace_minutes
+                    THEN (attendance.check_in_minutes - s.start_minutes + 2160) % 1440 - 720
+                    ELSE 0 END,
+               max(720 - (attendance.check_out_minutes - s.end_minutes + 2160) % 1440, 0),
+               max((attendance.check_out_minutes - s.end_minutes + 2160) % 1440 - 720, 0)
+        FROM shifts s
+        WHERE s.id = COALESCE((SELECT es.shift_id FROM employee_shifts es
+                               WHERE es.employee_id = attendance.employee_id AND es.effective_from <= attendance.date
+                               ORDER BY es.effective_from DESC LIMIT 1), {DEFAULT_SHIFT_ID})
+    )
+"""
+
+def _migration_shifts(cur):
+    """
+    Shifts, effective-dated employee assignments, and lateness, early-leave
+    and overtime minutes computed once per attendance write by triggers.
+    """
+    time_minutes = _time_minutes_sql
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS shifts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            grace_minutes INTEGER NOT NULL DEFAULT 0,
+            start_minutes INTEGER GENERATED ALWAYS AS ({time_minutes("start_time")}) VIRTUAL,
+            end_minutes INTEGER GENERATED ALWAYS AS ({time_minutes("end_time")}) VIRTUAL
+        )
+    """)
+    # The former fixed 08:00 start becomes the default shift
+    start = f"{WORK_START_MINUTES // 60:02d}:{WORK_START_MINUTES % 60:02d}"
+    cur.execute("INSERT OR IGNORE INTO shifts (id, name, start_time, end_time) VALUES (?, ?, ?, ?)",
+                (DEFAULT_SHIFT_ID, "الوردية الصباحية", start, "16:00"))
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS employee_shifts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            shift_id INTEGER NOT NULL,
+            effective_from TEXT NOT NULL,
+            UNIQUE (employee_id, effective_from),
+            FOREIGN KEY (employee_id) REFERENCES employees(id),
+            FOREIGN KEY (shift_id) REFERENCES shifts(id)
+        )
+    """)
+
+    # late_minutes was a generated column against the fixed start; the
+    # summary triggers read it, so they go first and come back combined
+    # with the shift computation below
+    for event in ("insert", "update", "delete"):
+        cur.execute(f"DROP TRIGGER IF EXISTS attendance_summary_{event}")
+    cur.execute("PRAGMA table_xinfo(attendance)")
+    columns = {row[1]: row[6] for row in cur.fetchall()}  # name -> hidden (2/3 = generated)
+    if columns.get("late_minutes") in (2, 3):
+        cur.execute("ALTER TABLE attendance DROP COLUMN late_minutes")
+        del columns["late_minutes"]
+    for column in ("shift_id", "late_minutes", "early_leave_minutes", "overtime_minutes"):
+        if column not in columns:
+            cur.execute(f"ALTER TABLE attendance ADD COLUMN {column} INTEGER")
+    cur.execute(_ATTENDANCE_SHIFT_UPDATE)
+    cur.execute("DELETE FROM daily_attendance_summary")
+    cur.execute("""
+        INSERT INTO daily_attendance_summary (date, present, late, total_minutes)
+        SELECT date, COUNT(NULLIF(check_in, '')), COUNT(CASE WHEN late_minutes > 0 THEN 1 END),
+               COALESCE(SUM(work_minutes), 0)
+        FROM attendance GROUP BY date
+    """)
+
+    def summary(row, sign, source):
+        """Statement adding (sign=+) or removing (sign=-) one attendance row from its day."""
+        return f"""
+            INSERT INTO daily_attendance_summary (date, present, late, total_minutes)
+            SELECT {row}.date, {sign}(NULLIF({row}.check_in, '') IS NOT NULL),
+                   {sign}COALESCE({row}.late_minutes > 0, 0), {sign}COALESCE({row}.work_minutes, 0)
+            {source}
+            ON CONFLICT(date) DO UPDATE SET
+                present = present + excluded.present,
+                late = late + excluded.late,
+                total_minutes = total_minutes + excluded.total_minutes;
+        """
+
+    current = "FROM attendance a WHERE a.id = new.id"
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_shift_insert AFTER INSERT ON attendance BEGIN
+            {_ATTENDANCE_SHIFT_UPDATE} WHERE id = new.id;
+            {summary("a", "+", current)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_shift_update
+        AFTER UPDATE OF employee_id, date, check_in, check_out ON attendance BEGIN
+            {summary("old", "-", "WHERE true")}
+            {_ATTENDANCE_SHIFT_UPDATE} WHERE id = new.id;
+            {summary("a", "+", current)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_shift_delete AFTER DELETE ON attendance BEGIN
+            {summary("old", "-", "WHERE true")}
+        END
+    """)
+
+    # Rewriting check_in unchanged re-runs the attendance triggers above for
+    # the rows a shift or assignment change affects
+    def recompute(row):
+        return (f"UPDATE attendance SET check_in = check_in "
+                f"WHERE employee_id = {row}.employee_id AND date >= {row}.effective_from;")
+
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS employee_shifts_insert AFTER INSERT ON employee_shifts BEGIN
+            {recompute("new")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS employee_shifts_update AFTER UPDATE ON employee_shifts BEGIN
+            {recompute("old")}
+            {recompute("new")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS employee_shifts_delete AFTER DELETE ON employee_shifts BEGIN
+            {recompute("old")}
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS shifts_update AFTER UPDATE OF start_time, end_time, grace_minutes ON shifts BEGIN
+            UPDATE attendance SET check_in = check_in WHERE shift_id = new.id;
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS shifts_delete_default BEFORE DELETE ON shifts
+        WHEN old.id = {DEFAULT_SHIFT_ID} BEGIN
+            SELECT RAISE(ABORT, 'the default shift cannot be deleted');
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS shifts_delete AFTER DELETE ON shifts BEGIN
+            DELETE FROM employee_shifts WHERE shift_id = old.id;
+        END
+    """)
+
+def _migration_leave_counters(cur):
+    """leave_counters cells kept current by triggers on leaves (and on employee departments)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS leave_counters (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            status TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value, status)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("DELETE FROM leave_counters")
+    cur.execute(_leave_counters_fill_sql())
+
+    def add(select, requests, days):
+        return f"""
+            INSERT INTO leave_counters (dimension, value, status, requests, days)
+            SELECT dimension, value, status, {requests}, {days} FROM ({select}) WHERE true
+            ON CONFLICT(dimension, value, status) DO UPDATE SET
+                requests = requests + excluded.requests,
+                days = days + excluded.days;
+        """
+
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_counters_insert AFTER INSERT ON leaves BEGIN
+            {add(_leave_counter_rows_sql("new"), "1", "days")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_counters_update
+        AFTER UPDATE OF employee_id, type, start_date, days, status ON leaves BEGIN
+            {add(_leave_counter_rows_sql("old"), "-1", "-days")}
+            {add(_leave_counter_rows_sql("new"), "1", "days")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_counters_delete AFTER DELETE ON leaves BEGIN
+            {add(_leave_counter_rows_sql("old"), "-1", "-days")}
+        END
+    """)
+    # Leaves count under the employee's current department
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS leave_counters_department AFTER UPDATE OF department ON employees
+        WHEN COALESCE(old.department, '') != COALESCE(new.department, '') BEGIN
+            INSERT INTO leave_counters (dimension, value, status, requests, days)
+            SELECT 'department', COALESCE(old.department, ''), status, -COUNT(*), -COALESCE(SUM(days), 0)
+            FROM leaves WHERE employee_id = new.id GROUP BY status
+            ON CONFLICT(dimension, value, status) DO UPDATE SET
+                requests = requests + excluded.requests, days = days + excluded.days;
+            INSERT INTO leave_counters (dimension, value, status, requests, days)
+            SELECT 'department', COALESCE(new.department, ''), status, COUNT(*), COALESCE(SUM(days), 0)
+            FROM leaves WHERE employee_id = new.id GROUP BY status
+            ON CONFLICT(dimension, value, status) DO UPDATE SET
+                requests = requests + excluded.requests, days = days + excluded.days;
+        END
+    """)
+
+def _migration_leave_overlap_index(cur):
+    """Overlap checks and audits read one employee's leaves in start_date order."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leaves_employee_dates ON leaves(employee_id, start_date, end_date)")
+
+def _migration_leave_ledger(cur):
+    """leave_ledger entries and the per (employee, year, type) leave_balances the triggers keep from them."""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS leave_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            entry_type TEXT NOT NULL CHECK (entry_type IN ({', '.join(repr(t) for t in LEDGER_ENTRY_COLUMNS)})),
+            days REAL NOT NULL,
+            leave_id INTEGER,
+            period TEXT,
+            entry_date TEXT NOT NULL,
+            note TEXT
+        )
+    """)
+    # One accrual per month and one carry-forward per year; usage rows have no period
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_leave_ledger_period
+        ON leave_ledger(employee_id, year, type, entry_type, period)
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leave_ledger_leave ON leave_ledger(leave_id)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS leave_balances (
+            employee_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            accrued REAL NOT NULL DEFAULT 0,
+            carried REAL NOT NULL DEFAULT 0,
+            used REAL NOT NULL DEFAULT 0,
+            balance REAL GENERATED ALWAYS AS (accrued + carried - used) VIRTUAL,
+            PRIMARY KEY (employee_id, year, type)
+        ) WITHOUT ROWID
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_balances_insert AFTER INSERT ON leave_ledger BEGIN
+            {_ledger_balance_upsert("new", "")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_balances_delete AFTER DELETE ON leave_ledger BEGIN
+            {_ledger_balance_upsert("old", "-")}
+        END
+    """)
+    # Approving a leave posts its days as usage; any later change to an
+    # approved leave posts the reversal first. A leave inserted already
+    # approved (imports, salvage) is skipped when its usage is on the ledger.
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_ledger_leave_insert AFTER INSERT ON leaves
+        WHEN NOT EXISTS (SELECT 1 FROM leave_ledger WHERE leave_id = new.id) BEGIN
+            {_leave_usage_insert("new", "", "NULL")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_ledger_leave_update
+        AFTER UPDATE OF employee_id, type, start_date, days, status ON leaves
+        WHEN (old.status = '{APPROVED_LEAVE_STATUS}') != (new.status = '{APPROVED_LEAVE_STATUS}')
+          OR (new.status = '{APPROVED_LEAVE_STATUS}'
+              AND (old.employee_id, old.type, old.start_date, old.days)
+                  IS NOT (new.employee_id, new.type, new.start_date, new.days)) BEGIN
+            {_leave_usage_insert("old", "-", "'عكس'")}
+            {_leave_usage_insert("new", "", "NULL")}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS leave_ledger_leave_delete AFTER DELETE ON leaves
+        WHEN EXISTS (SELECT 1 FROM employees WHERE id = old.employee_id) BEGIN
+            {_leave_usage_insert("old", "-", "'عكس'")}
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS leave_ledger_employee_delete AFTER DELETE ON employees BEGIN
+            DELETE FROM leave_ledger WHERE employee_id = old.id;
+            DELETE FROM leave_balances WHERE employee_id = old.id;
+        END
+    """)
+    # Usage of the leaves approved before the ledger existed
+    cur.execute(f"""
+        INSERT INTO leave_ledger (employee_id, year, type, entry_type, days, leave_id, entry_date)
+        SELECT l.employee_id, CAST(substr(l.start_date, 1, 4) AS INTEGER), l.type, 'usage', l.days, l.id, l.start_date
+        FROM leaves l
+        WHERE l.status = '{APPROVED_LEAVE_STATUS}' AND l.employee_id IN (SELECT id FROM employees)
+          AND NOT EXISTS (SELECT 1 FROM leave_ledger g WHERE g.leave_id = l.id)
+    """)
+
+def _migration_payroll_runs(cur):
+    """payroll_runs and the run each generated salary row belongs to, so a run can be rolled back."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            month TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            run_date TEXT NOT NULL,
+            employees INTEGER NOT NULL DEFAULT 0,
+            total_net REAL NOT NULL DEFAULT 0,
+            rolled_back_at TEXT
+        )
+    """)
+    if "payroll_run_id" not in _table_columns(cur, "salaries"):
+        cur.execute("ALTER TABLE salaries ADD COLUMN payroll_run_id INTEGER REFERENCES payroll_runs(id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_salaries_payroll_run ON salaries(payroll_run_id)")
+
+def _migration_attendance_version_columns(cur):
+    """Bump the attendance counter only for edits of the columns users write, not trigger-filled minutes."""
+    cur.execute("DROP TRIGGER IF EXISTS attendance_version_update")
+    cur.execute("""
+        CREATE TRIGGER attendance_version_update
+        AFTER UPDATE OF employee_id, date, check_in, check_out ON attendance BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'attendance';
+        END
+    """)
+
+def _migration_annual_leave_ledger(cur):
+    """Keep only annual leave on the ledger; other types have no entitlement to debit."""
+    for name in ("leave_ledger_leave_insert", "leave_ledger_leave_update", "leave_ledger_leave_delete"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cur.execute(f"""
+        CREATE TRIGGER leave_ledger_leave_insert AFTER INSERT ON leaves
+        WHEN NOT EXISTS (SELECT 1 FROM leave_ledger WHERE leave_id = new.id) BEGIN
+            {_leave_usage_insert("new", "", "NULL", ANNUAL_LEAVE_TYPE)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER leave_ledger_leave_update
+        AFTER UPDATE OF employee_id, type, start_date, days, status ON leaves
+        WHEN (old.status = '{APPROVED_LEAVE_STATUS}') != (new.status = '{APPROVED_LEAVE_STATUS}')
+          OR (new.status = '{APPROVED_LEAVE_STATUS}'
+              AND (old.employee_id, old.type, old.start_date, old.days)
+                  IS NOT (new.employee_id, new.type, new.start_date, new.days)) BEGIN
+            {_leave_usage_insert("old", "-", "'عكس'", ANNUAL_LEAVE_TYPE)}
+            {_leave_usage_insert("new", "", "NULL", ANNUAL_LEAVE_TYPE)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER leave_ledger_leave_delete AFTER DELETE ON leaves
+        WHEN EXISTS (SELECT 1 FROM employees WHERE id = old.employee_id) BEGIN
+            {_leave_usage_insert("old", "-", "'عكس'", ANNUAL_LEAVE_TYPE)}
+        END
+    """)
+    # The delete trigger takes the removed usage back out of leave_balances
+    cur.execute("DELETE FROM leave_ledger WHERE entry_type = 'usage' AND type != ?", (ANNUAL_LEAVE_TYPE,))
+    cur.execute("DELETE FROM leave_balances WHERE type != ? AND accrued = 0 AND carried = 0 AND used = 0",
+                (ANNUAL_LEAVE_TYPE,))
+
+# Ordered schema migrations: (user_version after the step, description, step).
+# Steps must be idempotent so they are safe on databases created by older
+# releases that never recorded a user_version. Append new steps; never
+# renumber or edit steps that have shipped.
+MIGRATIONS = [
+    (1, "Base schema and legacy column upgrades", _migration_base_schema),
+    (2, "Indexes for hot attendance, leave and salary queries", _migration_hot_query_indexes),
+    (3, "Integrity check history", _migration_integrity_checks),
+    (4, "One attendance row per employee per day", _migration_unique_attendance_day),
+    (5, "Full-text index for employee search", _migration_employee_search),
+    (6, "Employee change log for directory caches", _migration_employee_changes),
+    (7, "Index for paging employees by name", _migration_employee_name_index),
+    (8, "Change counters for the UI tables", _migration_table_versions),
+    (9, "Work and late minutes computed for attendance rows", _migration_attendance_minutes),
+    (10, "Daily attendance summary and table row counts", _migration_daily_attendance_summary),
+    (11, "Shifts with lateness, early leave and overtime stored per attendance row", _migration_shifts),
+    (12, "Leave counters by status, type, month and department", _migration_leave_counters),
+    (13, "Index for leave overlap checks", _migration_leave_overlap_index),
+    (14, "Leave ledger with per employee, year and type balances", _migration_leave_ledger),
+    (15, "Payroll runs that generate and roll back a month of salaries", _migration_payroll_runs),
+    (16, "Attendance change counter limited to user-edited columns", _migration_attendance_version_columns),
+    (17, "Leave ledger limited to annual leave", _migration_annual_leave_ledger),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    """Return the schema version stored in PRAGMA user_version."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """
+    Apply all pending migrations to conn in a single transaction.
+
+    Returns a list of (version, description, seconds) for the steps that
+    were applied; an up-to-date database returns an empty list without
+    taking a write lock.
+    """
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+
+    applied = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another connection may have migrated while we waited for the lock
+        current = schema_version(conn)
+        cur = conn.cursor()
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            started = time.perf_counter()
+            step(cur)
+            cur.execute(f"PRAGMA user_version = {int(version)}")
+            applied.append((version, description, time.perf_counter() - started))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    for version, description, seconds in applied:
+        print(f"Migration {version} ({description}) applied in {seconds * 1000:.1f} ms")
+    return applied
+
+def init_db():
+    """
+    Initializes the SQLite database by applying pending schema migrations
+    and inserts a default admin user.
+    """
+    conn = None # Initialize conn to None
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        migrate(conn)
+        cursor = conn.cursor()
+
+        # Insert default admin user if no admin users exist
+        cursor.execute("SELECT COUNT(*) FROM admin")
+        if cursor.fetchone()[0] == 0:
+            # Hash the default password for security
+            default_password_hash = hashlib.sha256("admin".encode()).hexdigest()
+            cursor.execute(
+                "INSERT INTO admin (username, password) VALUES (?, ?)",
+                ("admin", default_password_hash)
+            )
+            print("Default admin user 'admin' created with password 'admin'.")
+
+        conn.commit()
+        print("Database initialized successfully.")
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        if conn:
+            conn.close()
 
-    conn.commit()
-    conn.close()
+def upgrade_db():
+    """Upgrade an existing database to the latest schema version."""
+    init_db()
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create or upgrade the HR database.")
+    parser.add_argument("--rebuild-leave-counters", action="store_true",
+                        help="recompute the leave_counters table from the leaves table")
+    args = parser.parse_args()
+    init_db()
+    if args.rebuild_leave_counters:
+        print(f"Rebuilt leave counters: {rebuild_leave_counters()} rows")
\ No newline at end of file
@@ -19,6 +19,50 @@ try:
 except ImportError:
     DB_NAME = "hr_system.db"  # تعريف افتراضي إذا لم يتم العثور على database.py
 
+# الفاصل الزمني (ms) لتسليم نتائج عامل قاعدة البيانات إلى الواجهة
+DB_POLL_INTERVAL_MS = 30
+
+# حقول الموظف بترتيب أعمدة جدول employees (بعد المعرف)
+EMPLOYEE_FIELDS = [
+    "full_name", "position", "salary", "hire_date",
+    "email", "phone", "address", "employee_code",
+    "birth_date", "gender", "status", "department",
+    "location", "profession", "nationality", "religion",
+    "marital_status", "emp_type", "code_number",
+    "old_file_number", "working_hours", "payment_type",
+    "contract_entity"
+]
+
+# أعمدة تقرير الموظفين، وهي أيضاً ترتيب أعمدة ملف الاستيراد
+EMPLOYEE_REPORT_HEADERS = [
+    "المعرف", "الاسم الكامل", "الوظيفة", "الراتب", "تاريخ التعيين",
+    "البريد الإلكتروني", "الهاتف", "العنوان", "الرقم الوظيفي",
+    "تاريخ الميلاد", "الجنس", "الحالة", "الإدارة", "الموقع",
+    "المهنة", "الجنسية", "الديانة", "الحالة الاجتماعية", "النوع",
+    "الرقم الكودي", "رقم الملف القديم", "ساعات العمل", "نوع الصرف",
+    "جهة التعاقد"
+]
+
+# مهلة (ms) بعد آخر ضغطة مفتاح قبل تنفيذ البحث عن الموظفين
+EMPLOYEE_SEARCH_DELAY_MS = 200
+
+# عدد الصفوف في كل صفحة من الجداول، وأقصى عدد يبقى معروضاً منها أثناء التمرير
+TABLE_PAGE_SIZE = 200
+TABLE_MAX_ROWS = 1000
+
+# أقصى عدد من الموظفين يُعرض في قائمة اختيار الموظف أثناء الكتابة
+EMPLOYEE_PICKER_LIMIT = 30
+
+# عدد الصفوف التي يتم التحقق منها وإدراجها في كل معاملة أثناء الاستيراد
+EMPLOYEE_IMPORT_BATCH_SIZE = 500
+
+# أعمدة تقارير الحضور
+# حالات طلب الإجازة بترتيب العرض
+LEAVE_STATUSES = ("معلق", "معتمد", "مرفوض")
+
+ATTENDANCE_REPORT_HEADERS = ["اسم الموظف", "التاريخ", "وقت الحضور", "وقت الانصراف", "ساعات العمل", "الحالة",
+                             "الوردية", "التأخير (دقيقة)", "الانصراف المبكر (دقيقة)", "العمل الإضافي (دقيقة)"]
+
 # إضافة متغيرات عامة للتحكم في الواجهة
 COLORS = {
     'primary': '#2E4057',
@@ -246,30 +290,21 @@ class LoginWindow(tk.Tk):
     def create_default_admin(self):
         """إنشاء حساب مدير افتراضي"""
         try:
-            conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-            c = conn.cursor()
             # تشفير كلمة المرور
             password_hash = hashlib.sha256("admin".encode()).hexdigest()
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS admin (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL
-                )
-            """)
-            # تحقق مما إذا كان الحساب موجوداً مسبقاً
-            c.execute("SELECT password FROM admin WHERE username=?", ("admin",))
-            row = c.fetchone()
-            if row:
-                # إذا كانت كلمة المرور غير مشفرة (مثل الإصدارات القديمة)
-                if len(row[0]) != 64:
-                    c.execute("UPDATE admin SET password=? WHERE username=?",
-                              (password_hash, "admin"))
-            else:
-                c.execute("INSERT INTO admin (username, password) VALUES (?, ?)",
-                          ("admin", password_hash))
-            conn.commit()
-            conn.close()
+            with database.get_manager().transaction() as conn:
+                c = conn.cursor()
+                # تحقق مما إذا كان الحساب موجوداً مسبقاً
+                c.execute("SELECT password FROM admin WHERE username=?", ("admin",))
+                row = c.fetchone()
+                if row:
+                    # إذا كانت كلمة المرور غير مشفرة (مثل الإصدارات القديمة)
+                    if len(row[0]) != 64:
+                        c.execute("UPDATE admin SET password=? WHERE username=?",
+                                  (password_hash, "admin"))
+                else:
+                    c.execute("INSERT INTO admin (username, password) VALUES (?, ?)",
+                              ("admin", password_hash))
         except Exception as e:
             print(f"خطأ في إنشاء المدير الافتراضي: {e}")
 
@@ -284,21 +319,20 @@ class LoginWindow(tk.Tk):
         # تشفير كلمة المرور
         password_hash = hashlib.sha256(pw.encode()).hexdigest()
 
-        conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT * FROM admin WHERE username=? AND password=?", (user, password_hash))
-        row = c.fetchone()
+        manager = database.get_manager()
+        rows = manager.execute("SELECT * FROM admin WHERE username=? AND password=?",
+                               (user, password_hash), fetch=True)
+        row = rows[0] if rows else None
         if not row:
             # التوافق مع قواعد البيانات القديمة حيث كانت كلمة المرور غير مشفرة
-            c.execute("SELECT * FROM admin WHERE username=? AND password=?", (user, pw))
-            row = c.fetchone()
+            rows = manager.execute("SELECT * FROM admin WHERE username=? AND password=?",
+                                   (user, pw), fetch=True)
+            row = rows[0] if rows else None
             if row:
                 try:
-                    c.execute("UPDATE admin SET password=? WHERE username=?", (password_hash, user))
-                    conn.commit()
+                    manager.execute("UPDATE admin SET password=? WHERE username=?", (password_hash, user))
                 except Exception as e:
                     print(f"خطأ في ترقية كلمة المرور: {e}")
-        conn.close()
 
         if row:
             self.destroy()
@@ -351,6 +385,358 @@ class LoginWindow(tk.Tk):
                 self.password_entry.config(show='*')
 
 
+class EmployeePicker(ttk.Combobox):
+    """قائمة اختيار موظف تبحث أثناء الكتابة بالاسم أو الرقم الوظيفي
+
+    تعرض أفضل EMPLOYEE_PICKER_LIMIT نتيجة فقط من فهرس البادئات في دليل الموظفين،
+    والأسماء المكررة تظهر مع الرقم الوظيفي للتمييز بينها.
+    """
+
+    def __init__(self, master, directory, limit=EMPLOYEE_PICKER_LIMIT, **kwargs):
+        super().__init__(master, **kwargs)
+        self.directory = directory
+        self.limit = limit
+        self._choices = {}
+        self.bind('<KeyRelease>', self._on_key)
+
+    def _on_key(self, event):
+        if event.keysym in ('Up', 'Down', 'Return', 'KP_Enter', 'Escape', 'Tab'):
+            return
+        self.update_choices()
+
+    def update_choices(self):
+        """تحديث القائمة المنسدلة بالموظفين المطابقين للنص المكتوب"""
+        matches = self.directory.search(self.get(), self.limit)
+        self._choices = {self.directory.label(record): record.id for record in matches}
+        self['values'] = list(self._choices)
+
+    def selected_employee(self):
+        """سجل الموظف المختار: من القائمة، أو بالرقم الوظيفي، أو باسم غير مكرر"""
+        text = self.get().strip()
+        if not text:
+            return None
+        if text in self._choices:
+            return self.directory.get(self._choices[text])
+        record = self.directory.by_code(text)
+        if record is not None:
+            return record
+        named = self.directory.named(text)
+        return named[0] if len(named) == 1 else None
+
+    def select(self, employee_id):
+        """اختيار موظف بمعرفه، مع الرقم الوظيفي إذا كان اسمه مكرراً"""
+        record = self.directory.get(employee_id)
+        if record is None:
+            self.set('')
+            return None
+        text = self.directory.label(record)
+        self._choices = {text: record.id}
+        self['values'] = [text]
+        self.set(text)
+        return record
+
+
+class PagedTable:
+    """عرض جدول كبير في Treeview صفحة بصفحة أثناء التمرير
+
+    الصفحات تُقرأ بترقيم keyset: ‎WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?‎
+    فتكلفة كل صفحة ثابتة مهما كان موضعها. لا يبقى في الجدول أكثر من max_rows صف،
+    والصفوف البعيدة عن موضع التمرير تُحذف وتُقرأ من جديد عند الرجوع إليها، فتبقى الذاكرة ثابتة.
+    يمكن أيضاً عرض قائمة صفوف جاهزة (مثل نتائج البحث) بالطريقة نفسها عبر show_rows.
+    بعد تعديل محلي يُحدَّث عنصر واحد فقط عبر refresh_row أو remove_row بدل إعادة التحميل.
+    معرف كل عنصر في الجدول هو قيمة العمود الأول (المعرف) في الصف.
+    """
+
+    def __init__(self, app, tree, scrollbar, key, select, keyset, key_of, count_sql,
+                 descending=True, format_row=None, page_size=TABLE_PAGE_SIZE, max_rows=TABLE_MAX_ROWS):
+        self.app = app
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.key = key                    # مفتاح مهام العامل: الطلب الأحدث يلغي الأقدم
+        self.select = select              # SELECT ... FROM ... [WHERE ...] بدون ORDER BY
+        self.keyset = keyset              # أعمدة الترتيب، وآخرها عمود فريد
+        self.key_of = key_of              # قيم keyset من صف الاستعلام
+        self.count_sql = count_sql
+        self.descending = descending
+        self.format_row = format_row      # تحويل صف الاستعلام إلى صف العرض (في العامل)
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.total = 0
+        self.label = tk.Label(tree.master, font=('Arial', 9), anchor='e')
+        self._rows = None                 # قائمة الصفوف في وضع show_rows
+        self._keys = {}                   # المعرف -> قيم keyset (أو الموضع في القائمة)
+        self._values = {}                 # المعرف -> الصف المعروض
+        self._has_before = False
+        self._has_after = False
+        self._loading = False
+        self._generation = 0
+        tree.configure(yscrollcommand=self._on_scroll)
+
+    # ---------- التحميل ----------
+    def reload(self, on_loaded=None):
+        """إعادة التحميل من أول الجدول مع العدد الإجمالي، ثم استدعاء on_loaded(total)"""
+        self._reset()
+        generation = self._generation
+        self._loading = True
+        self.app.run_in_background(self._fetch_first, lambda page: self._show_first(page, generation, on_loaded),
+                                   key=self.key, on_error=self._on_error)
+
+    def show_rows(self, rows):
+        """عرض قائمة صفوف جاهزة مع تعديل الصفوف التي دخلت أو خرجت أو تغيرت فقط"""
+        was_list = self._rows is not None and not self._has_before
+        self._generation += 1
+        self._loading = False
+        self._rows = rows
+        self.total = len(rows)
+        if not was_list:
+            self._clear()
+        count = min(max(self.page_size, len(self.tree.get_children())), self.max_rows, len(rows))
+        self._apply(rows[:count])
+        self._keys = {str(row[0]): index for index, row in enumerate(rows[:count])}
+        self._has_before = False
+        self._has_after = count < len(rows)
+        self._update_label()
+
+    # ---------- تحديث صف واحد ----------
+    def refresh_row(self, row_id, inserted=False):
+        """قراءة صف واحد بعد تعديل محلي ووضعه في الجدول دون إعادة التحميل
+
+        يُحدَّث العنصر إن كان معروضاً، أو يُدرج في موضعه إن وقع داخل الصفحات المحملة،
+        أو يُحذف إن لم يعد موجوداً. inserted=True للصفوف الجديدة حتى يزيد العدد الإجمالي.
+        """
+        generation = self._generation
+        self.app.run_in_background(lambda: self._fetch_row(row_id),
+                                   lambda item: self._place_row(row_id, item, inserted, generation),
+                                   key=f"{self.key}_row_{row_id}", on_error=self._on_error)
+
+    def remove_row(self, row_id):
+        """حذف صف محذوف محلياً من الجدول"""
+        iid = str(row_id)
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            self._keys.pop(iid, None)
+            self._values.pop(iid, None)
+        self.total = max(self.total - 1, 0)
+        self._update_label()
+
+    def _fetch_row(self, row_id):
+        """قراءة صف بمعرفه (يعمل في عامل الخلفية)؛ تعيد (قيم keyset، صف العرض) أو None"""
+        joiner = " AND " if " WHERE " in self.select.upper() else " WHERE "
+        rows = database.get_manager().execute(f"{self.select}{joiner}{self.keyset[-1]} = ?", (row_id,),
+                                              fetch=True, source=self.key)
+        if not rows:
+            return None
+        return self.key_of(rows[0]), (self.format_row or tuple)(rows[0])
+
+    def _place_row(self, row_id, item, inserted, generation):
+        if generation != self._generation:
+            return  # أعيد تحميل الجدول بعد الطلب، والتحميل الجديد يتضمن الصف
+        iid = str(row_id)
+        if item is None:
+            if not inserted:
+                self.remove_row(row_id)  # حُذف الصف قبل قراءته
+            return
+        key_values, row = item
+        if inserted:
+            self.total += 1
+        if self._rows is not None:
+            # وضع القائمة الجاهزة (نتائج بحث): يحدَّث الصف إن كان ظاهراً فقط
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=row)
+                self._values[iid] = row
+            self._update_label()
+            return
+        if self.tree.exists(iid):
+            if self._keys.get(iid) == key_values:
+                self.tree.item(iid, values=row)
+                self._values[iid] = row
+                self._update_label()
+                return
+            # تغير مفتاح الترتيب: ينقل الصف إلى موضعه الجديد مع الحفاظ على تحديده
+            selected = iid in self.tree.selection()
+            self.tree.delete(iid)
+            self._keys.pop(iid, None)
+            self._values.pop(iid, None)
+            if self._insert_sorted(iid, key_values, row) and selected:
+                self.tree.selection_add(iid)
+        else:
+            self._insert_sorted(iid, key_values, row)
+        self._update_label()
+
+    def _insert_sorted(self, iid, key_values, row):
+        """إدراج صف في موضعه حسب keyset إن وقع داخل النافذة المحملة، مع تثبيت موضع التمرير"""
+        children = self.tree.get_children()
+        lo, hi = 0, len(children)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            other = self._keys[children[middle]]
+            if (other > key_values) if self.descending else (other < key_values):
+                lo = middle + 1
+            else:
+                hi = middle
+        if (lo == 0 and self._has_before) or (lo == len(children) and self._has_after):
+            return False  # خارج الصفحات المحملة؛ سيظهر عند التمرير إليه
+        first_visible = int(self.tree.yview()[0] * len(children) + 0.5) if children else 0
+        self.tree.insert("", lo, iid=iid, values=row)
+        self._keys[iid] = key_values
+        self._values[iid] = row
+        if 0 < first_visible and lo <= first_visible:
+            # الصف أُدرج فوق أول صف ظاهر: التمرير سطراً حتى لا يتحرك ما يراه المستخدم
+            self.tree.yview_scroll(1, "units")
+        return True
+
+    def _reset(self):
+        self._generation += 1
+        self._rows = None
+        self._clear()
+
+    def _clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self._keys = {}
+        self._values = {}
+        self._has_before = self._has_after = False
+        self._loading = False
+
+    def _page_sql(self, forward=True, anchor=None):
+        """استعلام صفحة بعد (forward) أو قبل قيم keyset المعطاة"""
+        columns = ", ".join(self.keyset)
+        # الاتجاه الفعلي للقراءة: صفحة تالية في جدول تنازلي تُقرأ تنازلياً
+        reading_down = forward == self.descending
+        direction = "DESC" if reading_down else "ASC"
+        order = ", ".join(f"{column} {direction}" for column in self.keyset)
+        sql = self.select
+        params = []
+        if anchor is not None:
+            joiner = " AND " if " WHERE " in self.select.upper() else " WHERE "
+            sql += f"{joiner}({columns}) {'<' if reading_down else '>'} ({', '.join('?' * len(anchor))})"
+            params.extend(anchor)
+        return f"{sql} ORDER BY {order} LIMIT ?", params + [self.page_size]
+
+    def _fetch(self, forward, anchor):
+        """قراءة صفحة (يعمل في عامل الخلفية)؛ تعيد [(قيم keyset، صف العرض)] بترتيب العرض"""
+        sql, params = self._page_sql(forward, anchor)
+        rows = database.get_manager().execute(sql, params, fetch=True, source=self.key)
+        if not forward:
+            rows.reverse()
+        format_row = self.format_row or tuple
+        return [(self.key_of(row), format_row(row)) for row in rows]
+
+    def _fetch_first(self):
+        total = database.get_manager().execute(self.count_sql, fetch=True, source=self.key)[0][0]
+        return total, self._fetch(True, None)
+
+    def _show_first(self, page, generation, on_loaded):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self.total, items = page
+        self._add(items, forward=True)
+        self._has_after = len(items) == self.page_size
+        self._update_label()
+        if on_loaded:
+            on_loaded(self.total)
+
+    def _load_more(self, forward):
+        children = self.tree.get_children()
+        if not children:
+            return
+        anchor = self._keys[children[-1] if forward else children[0]]
+        if self._rows is not None:
+            # وضع القائمة الجاهزة: القراءة من الذاكرة مباشرة
+            start = anchor + 1 if forward else max(anchor - self.page_size, 0)
+            stop = start + self.page_size if forward else anchor
+            self._add_page([(index, self._rows[index]) for index in range(start, min(stop, len(self._rows)))],
+                           forward, self._generation)
+            return
+        generation = self._generation
+        self._loading = True
+        self.app.run_in_background(lambda: self._fetch(forward, anchor),
+                                   lambda items: self._add_page(items, forward, generation),
+                                   key=f"{self.key}_page", on_error=self._on_error)
+
+    def _add_page(self, items, forward, generation):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._add(items, forward)
+        full = len(items) == self.page_size if self._rows is None else (
+            items and (items[-1][0] < len(self._rows) - 1 if forward else items[0][0] > 0))
+        if forward:
+            self._has_after = bool(full)
+        else:
+            self._has_before = bool(full)
+        self._trim(keep_end=forward)
+        self._update_label()
+
+    def _add(self, items, forward):
+        index = "end" if forward else 0
+        for key_values, row in (items if forward else reversed(items)):
+            iid = str(row[0])
+            if self.tree.exists(iid):
+                continue  # صف أضيف من جهة أخرى بين قراءة صفحتين
+            self.tree.insert("", index, iid=iid, values=row)
+            self._keys[iid] = key_values
+            self._values[iid] = row
+
+    def _trim(self, keep_end):
+        """حذف الصفوف الزائدة عن max_rows من الطرف البعيد عن موضع التمرير"""
+        children = self.tree.get_children()
+        extra = len(children) - self.max_rows
+        if extra <= 0:
+            return
+        removed = children[:extra] if keep_end else children[-extra:]
+        visible = self.tree.identify_row(self.tree.winfo_height() // 2)
+        self.tree.delete(*removed)
+        for iid in removed:
+            self._keys.pop(iid, None)
+            self._values.pop(iid, None)
+        if keep_end:
+            self._has_before = True
+        else:
+            self._has_after = True
+        if visible and self.tree.exists(visible):
+            self.tree.see(visible)
+
+    def _apply(self, rows):
+        """مطابقة الجدول مع rows بأقل عدد من العمليات على عناصر Treeview"""
+        new_rows = {str(row[0]): row for row in rows}
+        removed = [iid for iid in self._values if iid not in new_rows]
+        if removed:
+            self.tree.delete(*removed)
+        # إذا تغير ترتيب الصفوف الباقية (ترتيب صلة مختلف) يعاد بناء الجدول
+        kept_order = [str(row[0]) for row in rows if str(row[0]) in self._values]
+        if list(self.tree.get_children()) != kept_order:
+            self.tree.delete(*self.tree.get_children())
+            self._values = {}
+
+        for index, row in enumerate(rows):
+            iid = str(row[0])
+            old_row = self._values.get(iid)
+            if old_row is None:
+                self.tree.insert("", index, iid=iid, values=row)
+            elif old_row != row:
+                self.tree.item(iid, values=row)
+        self._values = new_rows
+
+    # ---------- التمرير والعرض ----------
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading:
+            return
+        if float(last) > 0.95 and self._has_after:
+            self._load_more(forward=True)
+        elif float(first) < 0.05 and self._has_before:
+            self._load_more(forward=False)
+
+    def _update_label(self):
+        shown = len(self.tree.get_children())
+        self.label.config(text=f"المعروض {shown} من {self.total}" if shown < self.total else f"الإجمالي {self.total}")
+
+    def _on_error(self, error):
+        self._loading = False
+        messagebox.showerror("خطأ في قاعدة البيانات", str(error))
+
+
 class HRApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -360,80 +746,56 @@ class HRApp(tk.Tk):
         self.configure(bg=COLORS['light'])
         enable_rtl(self)
 
+        # إغلاق اتصالات قاعدة البيانات عند إغلاق النافذة
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # إنشاء شريط الحالة
         self.create_status_bar()
 
+        # عامل قاعدة البيانات في الخلفية حتى لا تتجمد الواجهة أثناء الاستعلامات
+        self.db_worker = database.DatabaseWorker()
+        self._pending_jobs = []
+        self._db_poll_scheduled = False
+
         # إنشاء شريط الأدوات
         self.create_toolbar()
 
         # تهيئة قاعدة البيانات (نقلها إلى هنا لضمان وجود الجداول قبل استخدامها)
         self.init_database()
 
+        # دليل الموظفين في الذاكرة: تقرأ منه جميع التبويبات بدل الاستعلام كل مرة
+        self.employee_directory = database.EmployeeDirectory()
+
+        # عدادات التغيير التي عرضتها الجداول؛ أي زيادة لم نحدثها نحن تعني تعديلاً من جهاز آخر
+        self._seen_versions = {}
+        self._leave_balance_employee = None
+
         # إنشاء الواجهة الرئيسية
         self.create_main_interface()
 
         # تحديث الوقت
         self.update_time()
 
+        # جدولة فحص السلامة الكامل في الخلفية
+        self.integrity_job = None
+        self.schedule_integrity_check()
+
+        # جدولة النسخ الاحتياطي الدوري
+        self.backup_job = None
+        self.backup_progress = (0, 0)
+        self.schedule_backup()
+
+        # ترحيل استحقاقات الإجازات الشهرية حتى اليوم (الأشهر المرحّلة سابقاً تُتجاوز)
+        self.run_in_background(database.post_leave_accruals, self._on_leave_accruals_posted,
+                               on_error=lambda e: self.update_status(f"تعذر ترحيل استحقاقات الإجازات: {e}"))
+
     def init_database(self):
-        """تهيئة جداول قاعدة البيانات إذا لم تكن موجودة"""
+        """تطبيق ترقيات مخطط قاعدة البيانات المعلقة"""
         try:
-            conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS employees (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    full_name TEXT NOT NULL,
-                    position TEXT,
-                    salary REAL,
-                    hire_date TEXT,
-                    email TEXT UNIQUE,
-                    phone TEXT,
-                    address TEXT,
-                    employee_code TEXT UNIQUE
-                )
-            """)
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS attendance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    employee_id INTEGER NOT NULL,
-                    date TEXT NOT NULL,
-                    check_in TEXT,
-                    check_out TEXT,
-                    FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
-                )
-            """)
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS leaves (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    employee_id INTEGER NOT NULL,
-                    type TEXT NOT NULL,
-                    start_date TEXT NOT NULL,
-                    end_date TEXT NOT NULL,
-                    days INTEGER NOT NULL,
-                    reason TEXT,
-                    status TEXT NOT NULL DEFAULT 'معلق',
-                    request_date TEXT NOT NULL,
-                    FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
-                )
-            """)
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS salaries (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    employee_id INTEGER NOT NULL,
-                    month TEXT NOT NULL,
-                    year INTEGER NOT NULL,
-                    basic_salary REAL NOT NULL,
-                    bonuses REAL DEFAULT 0,
-                    deductions REAL DEFAULT 0,
-                    net_salary REAL NOT NULL,
-                    payment_date TEXT NOT NULL,
-                    FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE,
-                    UNIQUE(employee_id, month, year)
-                )
-            """)
-            conn.commit()
-            conn.close()
+            applied = database.migrate(database.get_manager().connection())
+            if applied:
+                total_ms = sum(seconds for _, _, seconds in applied) * 1000
+                self.update_status(f"تم تطبيق {len(applied)} ترقية لقاعدة البيانات ({total_ms:.0f} ms)")
         except Exception as e:
             messagebox.showerror("خطأ في تهيئة قاعدة البيانات", str(e))
 
@@ -447,6 +809,12 @@ class HRApp(tk.Tk):
                                      font=('Arial', 10))
         self.status_label.pack(side='right', padx=10, pady=5)
 
+        # مؤشر الانشغال أثناء تنفيذ استعلامات الخلفية
+        self.busy_label = tk.Label(self.status_frame, text="",
+                                   bg=COLORS['primary'], fg=COLORS['warning'],
+                                   font=('Arial', 10, 'bold'))
+        self.busy_label.pack(side='right', padx=10, pady=5)
+
         self.time_label = tk.Label(self.status_frame, text="",
                                    bg=COLORS['primary'], fg='white',
                                    font=('Arial', 10))
@@ -500,16 +868,60 @@ class HRApp(tk.Tk):
         for tab in self.notebook.tabs():
             self.notebook.insert(0, tab)
 
-        # إنشاء قاموس البيانات
-        self.emp_dict = {}
         self.refresh_employees_combobox()
 
     def update_time(self):
         """تحديث الوقت في شريط الحالة"""
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.time_label.config(text=current_time)
+        # التقاط تعديلات الموظفين من الأجهزة الأخرى: فحص PRAGMA data_version فقط هنا،
+        # والمزامنة نفسها (وقد تكون إعادة تحميل كاملة) في عامل الخلفية.
+        # فشل المزامنة (قاعدة مشغولة) يُتجاهل، فتُعاد المحاولة في الثانية التالية
+        if self.employee_directory.stale():
+            self.run_in_background(self.employee_directory.refresh, self._on_employee_directory_refreshed,
+                                   key="employee_directory", on_error=lambda error: None)
+        self.check_external_changes()
         self.after(1000, self.update_time)
 
+    def _on_employee_directory_refreshed(self, changed):
+        """تحديث قوائم اختيار الموظف بعد مزامنة الدليل في الخلفية"""
+        if changed:
+            self.refresh_employees_combobox()
+
+    def _mark_tables_seen(self, *tables):
+        """تسجيل عدادات تغييرات الأجهزة الأخرى للجداول عند إعادة تحميلها
+
+        تعديلاتنا (من الواجهة أو من مهام الخلفية) لا تحرك هذه العدادات، فلا حاجة لتسجيلها بعد كل كتابة.
+        """
+        versions = database.external_table_versions()
+        for table in tables:
+            self._seen_versions[table] = versions.get(table)
+
+    def check_external_changes(self):
+        """إعادة تحميل الجداول التي عدلها جهاز آخر فقط؛ تعديلاتنا تُعرض صفاً بصف"""
+        try:
+            versions = database.external_table_versions()
+        except Exception:
+            return  # قاعدة البيانات مشغولة أو تعاد تهيئتها؛ المحاولة في الثانية التالية
+        changed = {table for table, version in versions.items() if self._seen_versions.get(table) != version}
+        if not changed:
+            return
+        if "employees" in changed:
+            if self.search_var.get().strip():
+                # إعادة البحث الحالي بدل العودة إلى القائمة الكاملة
+                self._seen_versions["employees"] = versions["employees"]
+                self._employee_results = ("", [])
+                self._run_employee_search()
+            else:
+                self.refresh_employees()
+        # أسماء الموظفين تظهر في بقية الجداول
+        if changed & {"employees", "attendance"}:
+            self.refresh_attendance()
+        if changed & {"employees", "leaves"}:
+            self.refresh_leaves()
+        if changed & {"employees", "salaries"}:
+            self.refresh_salaries()
+
     def update_status(self, message):
         """تحديث رسالة الحالة"""
         self.status_label.config(text=message)
@@ -522,23 +934,87 @@ class HRApp(tk.Tk):
     def logout(self):
         """تسجيل الخروج"""
         if messagebox.askyesno("تأكيد", "هل تريد تسجيل الخروج؟"):
+            self.shutdown_database()
             self.destroy()
             LoginWindow().mainloop()
 
+    def on_close(self):
+        """إغلاق التطبيق مع إغلاق اتصالات قاعدة البيانات"""
+        self.shutdown_database()
+        self.destroy()
+
+    def shutdown_database(self):
+        """إيقاف عامل الخلفية ثم إغلاق جميع الاتصالات"""
+        self.db_worker.stop()
+        self._pending_jobs = []
+        self.employee_directory.close()
+        database.close_connections()
+
     def execute_db(self, query, params=(), fetch=False):
-        """تنفيذ استعلام قاعدة البيانات مع معالجة الأخطاء"""
+        """تنفيذ استعلام قاعدة البيانات مع معالجة الأخطاء
+
+        يعيد الصفوف عند fetch=True، وإلا عدد الصفوف المتأثرة، و None عند الخطأ.
+        """
         try:
-            conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute(query, params)
-            data = c.fetchall() if fetch else None
-            conn.commit()
-            conn.close()
-            return data
+            return database.get_manager().execute(query, params, fetch)
         except Exception as e:
             messagebox.showerror("خطأ في قاعدة البيانات", str(e))
             return None
 
+    def run_in_background(self, fn, on_done, key=None, on_error=None):
+        """تنفيذ دالة قاعدة بيانات في الخلفية وتسليم نتيجتها لحلقة الواجهة
+
+        المهام التي تحمل نفس المفتاح تلغي بعضها، فلا تُعرض إلا نتيجة أحدث طلب.
+        لا يجوز للدالة استخدام عناصر الواجهة أو execute_db.
+        """
+        future = self.db_worker.submit(fn, key=key)
+        self._pending_jobs.append((future, key, on_done, on_error))
+        self._update_busy_indicator()
+        if not self._db_poll_scheduled:
+            self._db_poll_scheduled = True
+            self.after(DB_POLL_INTERVAL_MS, self._deliver_db_results)
+        return future
+
+    def query_in_background(self, query, params, on_done, key=None):
+        """تنفيذ استعلام قراءة في الخلفية وتمرير الصفوف إلى on_done"""
+        # اسم الدالة المستدعية يُحدد هنا لأن الاستعلام سيُنفذ على خيط آخر
+        source = database.query_source()
+        return self.run_in_background(
+            lambda: database.get_manager().execute(query, params, fetch=True, source=source), on_done, key=key)
+
+    def _deliver_db_results(self):
+        """تسليم نتائج المهام المنتهية عبر after() مع تجاهل الطلبات القديمة"""
+        finished = [job for job in self._pending_jobs if job[0].done()]
+        self._pending_jobs = [job for job in self._pending_jobs if not job[0].done()]
+        self._update_busy_indicator()
+
+        # جدولة الدورة التالية أولاً حتى لا يوقفها خطأ في إحدى دوال الاستلام
+        self._db_poll_scheduled = bool(self._pending_jobs)
+        if self._db_poll_scheduled:
+            self.after(DB_POLL_INTERVAL_MS, self._deliver_db_results)
+
+        for future, key, on_done, on_error in finished:
+            if future.cancelled() or not self.db_worker.is_current(future, key):
+                continue
+            error = future.exception()
+            if error is None:
+                on_done(future.result())
+            elif on_error is not None:
+                on_error(error)
+            else:
+                messagebox.showerror("خطأ في قاعدة البيانات", str(error))
+
+    def _update_busy_indicator(self):
+        """إظهار مؤشر الانشغال ما دامت هناك مهام قيد التنفيذ"""
+        self.busy_label.config(text="⏳ جاري التحميل..." if self._pending_jobs else "")
+
+    def write_csv(self, file_path, headers, rows):
+        """كتابة صفوف إلى ملف CSV (آمنة للاستدعاء من عامل الخلفية)"""
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+
     def validate_email(self, email):
         """التحقق من صحة البريد الإلكتروني"""
         pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -549,19 +1025,38 @@ class HRApp(tk.Tk):
         pattern = r'^[0-9+\-\s()]{10,15}$'
         return re.match(pattern, phone) is not None
 
-    def refresh_employees_combobox(self):
-        """تحديث قائمة الموظفين في مربعات الاختيار"""
-        employees = self.execute_db("SELECT id, full_name FROM employees", fetch=True)
-        self.emp_dict = {name: eid for eid, name in (employees or [])}
+    def validate_employee(self, record):
+        """التحقق من بيانات موظف (قاموس حقول) وإرجاع (الحقل، رسالة الخطأ) أو None
+
+        لا تستخدم عناصر الواجهة، لذا يمكن استدعاؤها من عامل الخلفية أثناء الاستيراد.
+        """
+        for field in ("full_name", "position", "salary", "hire_date"):
+            if not record.get(field):
+                return field, f"الحقل '{field}' مطلوب"
+
+        if record.get("email") and not self.validate_email(record["email"]):
+            return "email", "البريد الإلكتروني غير صحيح"
+
+        if record.get("phone") and not self.validate_phone(record["phone"]):
+            return "phone", "رقم الهاتف غير صحيح"
+
+        try:
+            if float(record["salary"]) < 0:
+                raise ValueError()
+        except ValueError:
+            return "salary", "الراتب يجب أن يكون رقماً موجباً"
 
-        employee_names = sorted(list(self.emp_dict.keys()))
+        try:
+            datetime.strptime(record["hire_date"], "%Y-%m-%d")
+        except ValueError:
+            return "hire_date", "تاريخ التعيين يجب أن يكون بالشكل YYYY-MM-DD"
+        return None
 
-        if hasattr(self, 'atten_emp'):
-            self.atten_emp['values'] = employee_names
-        if hasattr(self, 'leave_emp'):
-            self.leave_emp['values'] = employee_names
-        if hasattr(self, 'salary_emp'):
-            self.salary_emp['values'] = employee_names
+    def refresh_employees_combobox(self):
+        """تحديث قوائم اختيار الموظف بعد تغير بيانات الموظفين"""
+        for picker in ('atten_emp', 'leave_emp', 'salary_emp'):
+            if hasattr(self, picker):
+                getattr(self, picker).update_choices()
 
     # ---------------- تبويب الموظفون المحسن -----------------
     def create_employee_tab(self):
@@ -580,6 +1075,9 @@ class HRApp(tk.Tk):
                                      justify='right')
         self.search_entry.pack(side='right', padx=5, pady=5)
         self.search_var.trace('w', self.search_employees)
+        self._search_after_id = None
+        # آخر نتيجة بحث (المصطلح، الصفوف)
+        self._employee_results = ("", [])
 
         # إطار الإدخال
         input_frame = tk.Frame(frame, bg='white', relief='raised', bd=1)
@@ -649,7 +1147,8 @@ class HRApp(tk.Tk):
             ("✏️ تعديل", COLORS['warning'], self.edit_employee_load),  # Changed command
             ("🗑️ حذف", COLORS['danger'], self.delete_employee),
             ("🔄 تحديث", COLORS['secondary'], self.refresh_employees),
-            ("📄 طباعة", COLORS['primary'], self.print_employee_report)
+            ("📄 طباعة", COLORS['primary'], self.print_employee_report),
+            ("📥 استيراد", COLORS['primary'], self.import_employees_csv)
         ]
 
         self.employee_action_buttons = {}  # Store buttons to change command for update
@@ -691,13 +1190,20 @@ class HRApp(tk.Tk):
         # أشرطة التمرير
         v_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.emp_tree.yview)
         h_scrollbar = ttk.Scrollbar(table_frame, orient="horizontal", command=self.emp_tree.xview)
-        self.emp_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.emp_tree.configure(xscrollcommand=h_scrollbar.set)
 
         # تخطيط الجدول
         self.emp_tree.grid(row=0, column=0, sticky="nsew")
         v_scrollbar.grid(row=0, column=1, sticky="ns")
         h_scrollbar.grid(row=1, column=0, sticky="ew")
 
+        # تحميل الجدول صفحة بصفحة بترتيب الاسم
+        self.emp_pages = PagedTable(self, self.emp_tree, v_scrollbar, "emp_tree",
+                                    "SELECT * FROM employees", ("full_name", "id"),
+                                    key_of=lambda row: (row[1], row[0]),
+                                    count_sql="SELECT COUNT(*) FROM employees", descending=False)
+        self.emp_pages.label.grid(row=2, column=0, sticky="e")
+
         table_frame.grid_rowconfigure(0, weight=1)
         table_frame.grid_columnconfigure(0, weight=1)
 
@@ -707,89 +1213,58 @@ class HRApp(tk.Tk):
         self.refresh_employees()
 
     def search_employees(self, *args):
-        """البحث في الموظفين"""
-        search_term = self.search_var.get().lower()
-        for item in self.emp_tree.get_children():
-            self.emp_tree.delete(item)
-
-        query = """SELECT * FROM employees WHERE 
-                  LOWER(full_name) LIKE ? OR 
-                  LOWER(position) LIKE ? OR 
-                  LOWER(email) LIKE ? OR 
-                  LOWER(phone) LIKE ? OR
-                  LOWER(employee_code) LIKE ?
-                  """
-        params = [f"%{search_term}%"] * 5
-
-        rows = self.execute_db(query, params, fetch=True)
-        if rows:
-            for row in rows:
-                self.emp_tree.insert("", "end", values=row)
-
-    def add_employee(self):
-        """إضافة موظف جديد مع التحقق من البيانات"""
-        # التحقق من البيانات المطلوبة
-        required_fields = ["full_name", "position", "salary", "hire_date"]
-        for field in required_fields:
-            if not self.emp_entries[field].get().strip():
-                messagebox.showerror("خطأ", f"الحقل '{field}' مطلوب")
-                self.emp_entries[field].focus()
-                return
-
-        # التحقق من صحة البريد الإلكتروني
-        email = self.emp_entries["email"].get().strip()
-        if email and not self.validate_email(email):
-            messagebox.showerror("خطأ", "البريد الإلكتروني غير صحيح")
-            self.emp_entries["email"].focus()
+        """البحث في الموظفين بعد توقف الكتابة لحظة بدلاً من كل ضغطة مفتاح"""
+        if self._search_after_id is not None:
+            self.after_cancel(self._search_after_id)
+        self._search_after_id = self.after(EMPLOYEE_SEARCH_DELAY_MS, self._run_employee_search)
+
+    def _run_employee_search(self):
+        self._search_after_id = None
+        search_term = self.search_var.get().strip()
+        previous_term, previous_rows = self._employee_results
+        if search_term == previous_term:
             return
-
-        # التحقق من صحة رقم الهاتف
-        phone = self.emp_entries["phone"].get().strip()
-        if phone and not self.validate_phone(phone):
-            messagebox.showerror("خطأ", "رقم الهاتف غير صحيح")
-            self.emp_entries["phone"].focus()
+        if not search_term:
+            # بدون بحث يعود الجدول إلى التحميل صفحة بصفحة
+            self.refresh_employees()
             return
 
-        # التحقق من صحة الراتب
-        try:
-            salary = float(self.emp_entries["salary"].get())
-            if salary < 0:
-                raise ValueError()
-        except ValueError:
-            messagebox.showerror("خطأ", "الراتب يجب أن يكون رقماً موجباً")
-            self.emp_entries["salary"].focus()
-            return
+        if previous_term and search_term.startswith(previous_term) and database.employee_match_query(previous_term):
+            # المصطلح الجديد امتداد للسابق: تصفية النتيجة السابقة دون استعلام جديد
+            job = lambda: database.narrow_employee_search(previous_rows, search_term)
+        else:
+            # بحث نصي كامل مرتب حسب الصلة (أو LIKE إذا لم يتوفر FTS5)
+            job = lambda: database.search_employees(search_term)
+        # يلغي أي بحث أو تحديث سابق لم تصل نتيجته بعد
+        self.run_in_background(job, lambda rows: self._fill_employee_tree(rows, search_term), key="emp_tree")
 
-        # التحقق من تاريخ التعيين
-        try:
-            hire_date = self.emp_entries["hire_date"].get().strip()
-            datetime.strptime(hire_date, "%Y-%m-%d")
-        except ValueError:
-            messagebox.showerror("خطأ", "تاريخ التعيين يجب أن يكون بالشكل YYYY-MM-DD")
-            self.emp_entries["hire_date"].focus()
+    def _fill_employee_tree(self, rows, search_term=""):
+        """عرض نتائج البحث؛ الجدول يعدل فقط الصفوف التي دخلت أو خرجت أو تغيرت"""
+        self._employee_results = (search_term, rows)
+        self.emp_pages.show_rows(rows)
+
+    def add_employee(self):
+        """إضافة موظف جديد مع التحقق من البيانات"""
+        record = {key: self.emp_entries[key].get().strip() for key in EMPLOYEE_FIELDS}
+        error = self.validate_employee(record)
+        if error:
+            field, message = error
+            messagebox.showerror("خطأ", message)
+            self.emp_entries[field].focus()
             return
 
         # إضافة الموظف
-        values = [self.emp_entries[key].get().strip() for key in
-                  [
-                      "full_name", "position", "salary", "hire_date",
-                      "email", "phone", "address", "employee_code",
-                      "birth_date", "gender", "status", "department",
-                      "location", "profession", "nationality", "religion",
-                      "marital_status", "emp_type", "code_number",
-                      "old_file_number", "working_hours", "payment_type",
-                      "contract_entity"
-                  ]]
+        values = [record[key] for key in EMPLOYEE_FIELDS]
 
         result = self.execute_db(
-            "INSERT INTO employees (full_name, position, salary, hire_date, email, phone, address, employee_code, birth_date, gender, status, department, location, profession, nationality, religion, marital_status, emp_type, code_number, old_file_number, working_hours, payment_type, contract_entity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            values,
+            "INSERT INTO employees (full_name, position, salary, hire_date, email, phone, address, employee_code, birth_date, gender, status, department, location, profession, nationality, religion, marital_status, emp_type, code_number, old_file_number, working_hours, payment_type, contract_entity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id",
+            values, fetch=True
         )
 
-        if result is not None:
+        if result:
             messagebox.showinfo("تم", "تمت إضافة الموظف بنجاح")
             self.clear_employee_entries()
-            self.refresh_employees()
+            self.employee_changed(result[0][0], inserted=True)
             self.refresh_employees_combobox()
             self.update_status("تم إضافة موظف جديد")
 
@@ -829,59 +1304,17 @@ class HRApp(tk.Tk):
             messagebox.showwarning("تنبيه", "يرجى اختيار موظف للتحديث")
             return
 
-        emp_id = self.emp_tree.item(selected[0])["values"][0]  # Get ID from the first element of selected row
-
-        # التحقق من البيانات المطلوبة
-        required_fields = ["full_name", "position", "salary", "hire_date"]
-        for field in required_fields:
-            if not self.emp_entries[field].get().strip():
-                messagebox.showerror("خطأ", f"الحقل '{field}' مطلوب")
-                self.emp_entries[field].focus()
-                return
-
-        # التحقق من صحة البريد الإلكتروني
-        email = self.emp_entries["email"].get().strip()
-        if email and not self.validate_email(email):
-            messagebox.showerror("خطأ", "البريد الإلكتروني غير صحيح")
-            self.emp_entries["email"].focus()
-            return
+        emp_id, emp_data_name = self.emp_tree.item(selected[0])["values"][:2]  # ID and name of the selected row
 
-        # التحقق من صحة رقم الهاتف
-        phone = self.emp_entries["phone"].get().strip()
-        if phone and not self.validate_phone(phone):
-            messagebox.showerror("خطأ", "رقم الهاتف غير صحيح")
-            self.emp_entries["phone"].focus()
+        record = {key: self.emp_entries[key].get().strip() for key in EMPLOYEE_FIELDS}
+        error = self.validate_employee(record)
+        if error:
+            field, message = error
+            messagebox.showerror("خطأ", message)
+            self.emp_entries[field].focus()
             return
 
-        # التحقق من صحة الراتب
-        try:
-            salary = float(self.emp_entries["salary"].get())
-            if salary < 0:
-                raise ValueError()
-        except ValueError:
-            messagebox.showerror("خطأ", "الراتب يجب أن يكون رقماً موجباً")
-            self.emp_entries["salary"].focus()
-            return
-
-        # التحقق من تاريخ التعيين
-        try:
-            hire_date = self.emp_entries["hire_date"].get().strip()
-            datetime.strptime(hire_date, "%Y-%m-%d")
-        except ValueError:
-            messagebox.showerror("خطأ", "تاريخ التعيين يجب أن يكون بالشكل YYYY-MM-DD")
-            self.emp_entries["hire_date"].focus()
-            return
-
-        values = [self.emp_entries[key].get().strip() for key in
-                  [
-                      "full_name", "position", "salary", "hire_date",
-                      "email", "phone", "address", "employee_code",
-                      "birth_date", "gender", "status", "department",
-                      "location", "profession", "nationality", "religion",
-                      "marital_status", "emp_type", "code_number",
-                      "old_file_number", "working_hours", "payment_type",
-                      "contract_entity"
-                  ]]
+        values = [record[key] for key in EMPLOYEE_FIELDS]
         values.append(emp_id)
 
         result = self.execute_db(
@@ -892,7 +1325,7 @@ class HRApp(tk.Tk):
         if result is not None:
             messagebox.showinfo("تم", "تم تحديث بيانات الموظف")
             self.clear_employee_entries()
-            self.refresh_employees()
+            self.employee_changed(emp_id, renamed=record["full_name"] != emp_data_name)
             self.refresh_employees_combobox()
             self.update_status(f"تم تحديث بيانات الموظف ID: {emp_id}")
             # إعادة الزر إلى حالته الأصلية
@@ -915,11 +1348,26 @@ class HRApp(tk.Tk):
 
             if result is not None:
                 messagebox.showinfo("تم", "تم حذف الموظف")
-                self.refresh_employees()
+                self.emp_pages.remove_row(emp_id)
+                # سجلات الموظف تختفي من جداول الحضور والإجازات والرواتب (الربط بالموظف)
+                self.refresh_attendance()
+                self.refresh_leaves()
+                self.refresh_salaries()
                 self.refresh_employees_combobox()
                 self.update_status(f"تم حذف الموظف {emp_name}")
                 self.clear_employee_entries()  # Clear entries after deletion
 
+    def employee_changed(self, emp_id, inserted=False, renamed=False):
+        """تحديث صف الموظف وحده بعد إضافته أو تعديله محلياً"""
+        self.emp_pages.refresh_row(emp_id, inserted=inserted)
+        # نتائج البحث المحفوظة لم تعد صالحة للتصفية: الحرف التالي يعيد البحث كاملاً
+        self._employee_results = ("", [])
+        if renamed:
+            # الاسم يظهر في جداول الحضور والإجازات والرواتب
+            self.refresh_attendance()
+            self.refresh_leaves()
+            self.refresh_salaries()
+
     def clear_employee_entries(self):
         """مسح جميع حقول الموظف وإعادة زر التحديث إلى إضافة"""
         for entry in self.emp_entries.values():
@@ -936,41 +1384,136 @@ class HRApp(tk.Tk):
         if not file_path:
             return
 
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                headers = [
-                    "المعرف", "الاسم الكامل", "الوظيفة", "الراتب", "تاريخ التعيين",
-                    "البريد الإلكتروني", "الهاتف", "العنوان", "الرقم الوظيفي",
-                    "تاريخ الميلاد", "الجنس", "الحالة", "الإدارة", "الموقع",
-                    "المهنة", "الجنسية", "الديانة", "الحالة الاجتماعية", "النوع",
-                    "الرقم الكودي", "رقم الملف القديم", "ساعات العمل", "نوع الصرف",
-                    "جهة التعاقد"
-                ]
-                writer.writerow(headers)
-
-                rows = self.execute_db("SELECT * FROM employees ORDER BY full_name", fetch=True)
-                if rows:
-                    for row in rows:
-                        writer.writerow(row)
+        def export():
+            rows = database.get_manager().execute("SELECT * FROM employees ORDER BY full_name", fetch=True)
+            self.write_csv(file_path, EMPLOYEE_REPORT_HEADERS, rows)
+
+        def done(_):
             messagebox.showinfo("تم", f"تم حفظ تقرير الموظفين في: {file_path}")
             self.update_status("تم إنشاء تقرير الموظفين بنجاح")
-        except Exception as e:
-            messagebox.showerror("خطأ في الطباعة", f"حدث خطأ أثناء حفظ التقرير: {e}")
 
-        return frame
+        self.run_in_background(
+            export, done,
+            on_error=lambda e: messagebox.showerror("خطأ في الطباعة", f"حدث خطأ أثناء حفظ التقرير: {e}"))
 
-    def refresh_employees(self):
-        """تحديث قائمة الموظفين"""
-        for row in self.emp_tree.get_children():
-            self.emp_tree.delete(row)
+    def import_employees_csv(self):
+        """استيراد الموظفين من ملف CSV بنفس ترتيب أعمدة تقرير الموظفين"""
+        file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+                                               title="استيراد الموظفين")
+        if not file_path:
+            return
 
-        rows = self.execute_db("SELECT * FROM employees ORDER BY full_name", fetch=True)
-        if rows:
-            for row in rows:
-                self.emp_tree.insert("", "end", values=row)
+        def done(result):
+            imported, rejected, rejected_path = result
+            # تحديث الجداول مرة واحدة في نهاية الاستيراد
+            self.refresh_employees()
+            self.refresh_employees_combobox()
+            message = f"تم استيراد {imported} موظف."
+            if rejected:
+                message += f"\nتم رفض {rejected} صف، والأسباب محفوظة في:\n{rejected_path}"
+            messagebox.showinfo("استيراد الموظفين", message)
+            self.update_status(f"تم استيراد {imported} موظف ورفض {rejected}")
+
+        self.update_status("جاري استيراد الموظفين...")
+        self.run_in_background(
+            lambda: self._import_employees(file_path), done,
+            on_error=lambda e: messagebox.showerror("خطأ في الاستيراد", f"تعذر استيراد الملف: {e}"))
+
+    def _import_employees(self, file_path):
+        """قراءة الملف على دفعات والتحقق منها وإدراج كل دفعة في معاملة واحدة (يعمل في الخلفية)
 
-        self.update_status(f"تم تحديث قائمة الموظفين ({len(rows) if rows else 0} موظف)")
+        يعيد (عدد المستوردين، عدد المرفوضين، مسار ملف الصفوف المرفوضة).
+        """
+        manager = database.get_manager()
+        # القيم الفريدة الموجودة مسبقاً لاكتشاف التكرار قبل الإدراج
+        emails, codes = set(), set()
+        for email, code in manager.execute("SELECT email, employee_code FROM employees", fetch=True):
+            if email:
+                emails.add(email.lower())
+            if code:
+                codes.add(code)
+
+        insert = (f"INSERT INTO employees ({', '.join(EMPLOYEE_FIELDS)}) "
+                  f"VALUES ({', '.join('?' * len(EMPLOYEE_FIELDS))})")
+        rejected_path = os.path.splitext(file_path)[0] + "_rejected.csv"
+        imported = rejected = 0
+
+        with open(file_path, newline='', encoding='utf-8-sig') as src_file, \
+                open(rejected_path, 'w', newline='', encoding='utf-8') as rejected_file:
+            reader = csv.reader(src_file)
+            rejected_writer = csv.writer(rejected_file)
+            rejected_writer.writerow(["رقم السطر", "السبب"] + EMPLOYEE_REPORT_HEADERS)
+
+            def reject(line_no, reason, row):
+                nonlocal rejected
+                rejected += 1
+                rejected_writer.writerow([line_no, reason] + row)
+
+            def flush(batch):
+                nonlocal imported
+                if not batch:
+                    return
+                with manager.transaction() as conn:
+                    try:
+                        # نقطة حفظ داخلية: فشل الدفعة يلغي صفوفها المدرجة قبل إعادة المحاولة صفاً صفاً
+                        with manager.transaction():
+                            conn.executemany(insert, [values for _, values, _ in batch])
+                        imported += len(batch)
+                    except sqlite3.IntegrityError:
+                        # تعارض مع بيانات أضيفت من جهاز آخر أثناء الاستيراد: تحديد الصفوف المتعارضة
+                        for line_no, values, row in batch:
+                            try:
+                                conn.execute(insert, values)
+                                imported += 1
+                            except sqlite3.IntegrityError as e:
+                                reject(line_no, str(e), row)
+
+            batch = []
+            for line_no, row in enumerate(reader, start=1):
+                if line_no == 1 and row and row[0].strip() == EMPLOYEE_REPORT_HEADERS[0]:
+                    continue  # سطر العناوين
+                if not any(cell.strip() for cell in row):
+                    continue
+                if len(row) != len(EMPLOYEE_REPORT_HEADERS):
+                    reject(line_no, f"عدد الأعمدة {len(row)} بدلاً من {len(EMPLOYEE_REPORT_HEADERS)}", row)
+                    continue
+
+                # العمود الأول هو المعرف في التقرير ويتم تجاهله، فالمعرفات الجديدة تنشئها قاعدة البيانات
+                record = dict(zip(EMPLOYEE_FIELDS, (cell.strip() for cell in row[1:])))
+                error = self.validate_employee(record)
+                if error:
+                    reject(line_no, error[1], row)
+                    continue
+                email, code = record["email"].lower(), record["employee_code"]
+                if email and email in emails:
+                    reject(line_no, "البريد الإلكتروني مكرر", row)
+                    continue
+                if code and code in codes:
+                    reject(line_no, "الرقم الوظيفي مكرر", row)
+                    continue
+                if email:
+                    emails.add(email)
+                if code:
+                    codes.add(code)
+
+                # القيم الفارغة تُحفظ NULL حتى لا تتعارض مع قيود UNIQUE على البريد والرقم الوظيفي
+                values = [record[key] or None for key in EMPLOYEE_FIELDS]
+                values[EMPLOYEE_FIELDS.index("salary")] = float(record["salary"])
+                batch.append((line_no, values, row))
+                if len(batch) >= EMPLOYEE_IMPORT_BATCH_SIZE:
+                    flush(batch)
+                    batch = []
+            flush(batch)
+
+        if not rejected:
+            os.remove(rejected_path)
+        return imported, rejected, rejected_path
+
+    def refresh_employees(self):
+        """تحديث قائمة الموظفين"""
+        self._employee_results = ("", [])
+        self._mark_tables_seen("employees")
+        self.emp_pages.reload(lambda total: self.update_status(f"تم تحديث قائمة الموظفين ({total} موظف)"))
 
     # ---------------- تبويب الحضور والانصراف المحسن -----------------
     def create_attendance_tab(self):
@@ -994,8 +1537,8 @@ class HRApp(tk.Tk):
         tk.Label(fields_frame, text="الموظف:", font=('Arial', 10, 'bold'),
                  bg='white').grid(row=0, column=1, sticky="e", pady=5)
         self.atten_emp_var = tk.StringVar()
-        self.atten_emp = ttk.Combobox(fields_frame, textvariable=self.atten_emp_var,
-                                      state="readonly", width=30, font=('Arial', 10))
+        self.atten_emp = EmployeePicker(fields_frame, self.employee_directory, textvariable=self.atten_emp_var,
+                                        width=30, font=('Arial', 10))
         self.atten_emp.grid(row=0, column=0, pady=5, padx=10, sticky="ew")
 
         # التاريخ
@@ -1030,7 +1573,9 @@ class HRApp(tk.Tk):
             ("🏃 تسجيل انصراف", COLORS['warning'], self.add_check_out),
             ("📝 تسجيل كامل", COLORS['primary'], self.add_attendance),
             ("🔄 تحديث", COLORS['secondary'], self.refresh_attendance),
-            ("📊 تقرير يومي", COLORS['primary'], self.daily_attendance_report)
+            ("📊 تقرير يومي", COLORS['primary'], self.daily_attendance_report),
+            ("📥 سجل البصمة", COLORS['secondary'], self.import_punch_log),
+            ("🕘 الورديات", COLORS['primary'], self.manage_shifts)
         ]
 
         for text, color, command in buttons:
@@ -1089,89 +1634,145 @@ class HRApp(tk.Tk):
         # أشرطة التمرير
         v_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.att_tree.yview)
         h_scrollbar = ttk.Scrollbar(table_frame, orient="horizontal", command=self.att_tree.xview)
-        self.att_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.att_tree.configure(xscrollcommand=h_scrollbar.set)
 
         # تخطيط الجدول
         self.att_tree.grid(row=0, column=0, sticky="nsew")
         v_scrollbar.grid(row=0, column=1, sticky="ns")
         h_scrollbar.grid(row=1, column=0, sticky="ew")
 
+        # تحميل الجدول صفحة بصفحة من الأحدث إلى الأقدم
+        self.att_pages = PagedTable(self, self.att_tree, v_scrollbar, "att_tree", """
+            SELECT a.id, e.full_name, a.date, a.check_in, a.check_out, a.work_minutes, a.late_minutes,
+                   a.early_leave_minutes
+            FROM attendance a
+            JOIN employees e ON a.employee_id = e.id""", ("a.date", "a.id"),
+                                    key_of=lambda row: (row[2], row[0]),
+                                    count_sql="SELECT COUNT(*) FROM attendance a JOIN employees e ON a.employee_id = e.id",
+                                    format_row=self._attendance_display_row)
+        self.att_pages.label.grid(row=2, column=0, sticky="e")
+
         table_frame.grid_rowconfigure(0, weight=1)
         table_frame.grid_columnconfigure(0, weight=1)
 
         self.refresh_attendance()
         self.update_attendance_stats()
 
+    def import_punch_log(self):
+        """استيراد سجل أجهزة البصمة (الرقم الوظيفي، الوقت) إلى الحضور"""
+        file_path = filedialog.askopenfilename(filetypes=[("CSV/Text files", "*.csv *.txt"), ("All files", "*.*")],
+                                               title="استيراد سجل البصمة")
+        if not file_path:
+            return
+
+        def done(stats):
+            self.refresh_attendance()
+            self.update_attendance_stats()
+            message = (f"تمت معالجة {stats['lines']} سطر ({stats['punches']} بصمة) في "
+                       f"{stats['seconds']:.1f} ثانية ({stats['rows_per_second']:.0f} سطر/ثانية).\n"
+                       f"تم تحديث {stats['days']} سجل حضور يومي.")
+            if stats['unknown_codes']:
+                codes = ", ".join(sorted(stats['unknown_codes'])[:10])
+                message += f"\nأرقام وظيفية غير معروفة ({len(stats['unknown_codes'])}): {codes}"
+            if stats['invalid_lines']:
+                lines = ", ".join(str(n) for n in stats['invalid_lines'][:10])
+                message += f"\nأسطر غير صالحة ({len(stats['invalid_lines'])}): {lines}"
+            messagebox.showinfo("استيراد سجل البصمة", message)
+            self.update_status(f"تم استيراد سجل البصمة: {stats['rows_per_second']:.0f} سطر/ثانية")
+
+        self.update_status("جاري استيراد سجل البصمة...")
+        self.run_in_background(
+            lambda: database.import_punch_log(file_path), done,
+            on_error=lambda e: messagebox.showerror("خطأ في الاستيراد", f"تعذر استيراد سجل البصمة: {e}"))
+
     def add_check_in(self):
         """تسجيل الحضور فقط"""
-        name = self.atten_emp_var.get()
-        if name not in self.emp_dict:
+        employee = self.atten_emp.selected_employee()
+        if employee is None:
             messagebox.showwarning("تنبيه", "الرجاء اختيار الموظف")
             return
 
         date = self.attendance_date.get() or datetime.now().strftime("%Y-%m-%d")
         check_in = self.check_in_entry.get() or datetime.now().strftime("%H:%M")
 
-        # التحقق من وجود تسجيل سابق لنفس اليوم
-        existing = self.execute_db(
-            "SELECT * FROM attendance WHERE employee_id=? AND date=?",
-            (self.emp_dict[name], date), fetch=True
-        )
+        # إنشاء سجل اليوم، أو إكمال سجل موجود بلا حضور (مثل سجل مستورد) في المعاملة نفسها.
+        # الاستعلام الذي أعاد الصف هو ما يحدد هل السجل جديد، فلا يُحسب سجل موجود مرتين في العدد
+        try:
+            with database.get_manager().transaction() as conn:
+                result = conn.execute(
+                    """
+                    INSERT INTO attendance (employee_id, date, check_in) VALUES (?, ?, ?)
+                    ON CONFLICT(employee_id, date) DO NOTHING
+                    RETURNING id, check_in
+                    """,
+                    (employee.id, date, check_in)
+                ).fetchall()
+                inserted = bool(result)
+                if not inserted:
+                    result = conn.execute(
+                        """
+                        UPDATE attendance SET check_in = ?
+                        WHERE employee_id = ? AND date = ? AND check_in IS NULL
+                        RETURNING id, check_in
+                        """,
+                        (check_in, employee.id, date)
+                    ).fetchall()
+        except Exception as e:
+            messagebox.showerror("خطأ في قاعدة البيانات", str(e))
+            return
 
-        if existing:
+        if not result:
             messagebox.showwarning("تنبيه", "الموظف مسجل حضوره لهذا اليوم")
             return
 
-        result = self.execute_db(
-            "INSERT INTO attendance (employee_id, check_in, date) VALUES (?, ?, ?)",
-            (self.emp_dict[name], check_in, date)
-        )
-
-        if result is not None:
-            messagebox.showinfo("تم", "تم تسجيل الحضور")
-            self.refresh_attendance()
-            self.update_attendance_stats()
-            self.clear_attendance_entries()
+        messagebox.showinfo("تم", f"تم تسجيل الحضور ({result[0][1]})")
+        self.attendance_changed(result[0][0], inserted=inserted)
+        self.update_attendance_stats()
+        self.clear_attendance_entries()
 
     def add_check_out(self):
         """تسجيل الانصراف فقط"""
-        name = self.atten_emp_var.get()
-        if name not in self.emp_dict:
+        employee = self.atten_emp.selected_employee()
+        if employee is None:
             messagebox.showwarning("تنبيه", "الرجاء اختيار الموظف")
             return
 
         date = self.attendance_date.get() or datetime.now().strftime("%Y-%m-%d")
         check_out = self.check_out_entry.get() or datetime.now().strftime("%H:%M")
 
-        # البحث عن تسجيل الحضور
-        existing = self.execute_db(
-            "SELECT * FROM attendance WHERE employee_id=? AND date=? AND check_in IS NOT NULL",
-            (self.emp_dict[name], date), fetch=True
+        # استعلام واحد: لا يُسجل الانصراف إلا إذا وُجد حضور ولم يُسجل انصراف بعد
+        result = self.execute_db(
+            """
+            UPDATE attendance SET check_out = ?
+            WHERE employee_id = ? AND date = ? AND check_in IS NOT NULL AND check_out IS NULL
+            RETURNING id, check_in, check_out
+            """,
+            (check_out, employee.id, date), fetch=True
         )
 
-        if not existing:
-            messagebox.showwarning("تنبيه", "لم يتم تسجيل حضور الموظف لهذا اليوم")
+        if result is None:
             return
-
-        if existing[0][4]:  # إذا كان الانصراف مسجل مسبقاً
-            messagebox.showwarning("تنبيه", "الموظف مسجل انصرافه لهذا اليوم")
+        if not result:
+            # تحديد سبب الرفض (المسار النادر فقط)
+            existing = self.execute_db(
+                "SELECT check_in, check_out FROM attendance WHERE employee_id=? AND date=?",
+                (employee.id, date), fetch=True
+            )
+            if existing and existing[0][0] and existing[0][1]:
+                messagebox.showwarning("تنبيه", "الموظف مسجل انصرافه لهذا اليوم")
+            else:
+                messagebox.showwarning("تنبيه", "لم يتم تسجيل حضور الموظف لهذا اليوم")
             return
 
-        result = self.execute_db(
-            "UPDATE attendance SET check_out=? WHERE employee_id=? AND date=?",
-            (check_out, self.emp_dict[name], date)
-        )
-
-        if result is not None:
-            messagebox.showinfo("تم", "تم تسجيل الانصراف")
-            self.refresh_attendance()
-            self.update_attendance_stats()
-            self.clear_attendance_entries()
+        messagebox.showinfo("تم", f"تم تسجيل الانصراف ({result[0][2]})")
+        self.attendance_changed(result[0][0])
+        self.update_attendance_stats()
+        self.clear_attendance_entries()
 
     def add_attendance(self):
         """تسجيل الحضور والانصراف معاً"""
-        name = self.atten_emp_var.get()
-        if name not in self.emp_dict:
+        employee = self.atten_emp.selected_employee()
+        if employee is None:
             messagebox.showwarning("تنبيه", "الرجاء اختيار الموظف")
             return
 
@@ -1183,114 +1784,63 @@ class HRApp(tk.Tk):
             messagebox.showerror("خطأ", "يجب إدخال وقتي الحضور والانصراف للتسجيل الكامل")
             return
 
-        # التحقق من وجود تسجيل سابق لنفس اليوم
-        existing = self.execute_db(
-            "SELECT * FROM attendance WHERE employee_id=? AND date=?",
-            (self.emp_dict[name], date), fetch=True
+        # استعلام واحد: لا يُنشأ السجل إذا كان للموظف سجل في نفس اليوم
+        result = self.execute_db(
+            """
+            INSERT INTO attendance (employee_id, check_in, check_out, date) VALUES (?, ?, ?, ?)
+            ON CONFLICT(employee_id, date) DO NOTHING
+            RETURNING id
+            """,
+            (employee.id, check_in, check_out, date), fetch=True
         )
 
-        if existing:
+        if result is None:
+            return
+        if not result:
             messagebox.showwarning("تنبيه", "الموظف لديه تسجيل حضور/انصراف لهذا اليوم بالفعل. يرجى التحديث يدوياً.")
             return
 
-        result = self.execute_db(
-            "INSERT INTO attendance (employee_id, check_in, check_out, date) VALUES (?, ?, ?, ?)",
-            (self.emp_dict[name], check_in, check_out, date)
-        )
+        messagebox.showinfo("تم", "تم تسجيل الحضور والانصراف")
+        self.attendance_changed(result[0][0], inserted=True)
+        self.update_attendance_stats()
+        self.clear_attendance_entries()
 
-        if result is not None:
-            messagebox.showinfo("تم", "تم تسجيل الحضور والانصراف")
-            self.refresh_attendance()
-            self.update_attendance_stats()
-            self.clear_attendance_entries()
+    def attendance_changed(self, attendance_id, inserted=False):
+        """تحديث صف الحضور وحده بعد تعديله محلياً"""
+        self.att_pages.refresh_row(attendance_id, inserted=inserted)
 
-    def calculate_work_hours(self, check_in, check_out):
-        """حساب ساعات العمل"""
+    def format_work_hours(self, check_in, check_out, work_minutes):
+        """نص ساعات العمل من الدقائق المحسوبة في قاعدة البيانات عند كتابة الوقت"""
         if not check_in or not check_out:
             return "غير محدد"
+        if work_minutes is None:
+            return "خطأ في الحساب"  # وقت غير صالح
+        return f"{work_minutes / 60:.2f} ساعة"
 
-        try:
-            in_time = datetime.strptime(check_in, "%H:%M")
-            out_time = datetime.strptime(check_out, "%H:%M")
-
-            # إذا كان الانصراف في اليوم التالي
-            if out_time < in_time:
-                out_time += timedelta(days=1)
-
-            work_duration = out_time - in_time
-            hours = work_duration.total_seconds() / 3600
-            return f"{hours:.2f} ساعة"
-        except:
-            return "خطأ في الحساب"
-
-    def get_attendance_status(self, check_in, check_out):
-        """تحديد حالة الحضور"""
+    def format_attendance_status(self, check_in, check_out, late_minutes, early_leave_minutes=None):
+        """حالة الحضور من دقائق التأخير والانصراف المبكر المحسوبة حسب وردية الموظف عند كتابة الوقت"""
         if not check_in:
             return "غائب"
-
-        try:
-            in_time = datetime.strptime(check_in, "%H:%M")
-            work_start = datetime.strptime("08:00", "%H:%M")  # يمكن جعل هذا إعداداً
-
-            if in_time > work_start:
-                return "متأخر"
-            elif check_out:
-                return "حاضر"
-            else:
-                return "لم ينصرف"
-        except:
-            return "خطأ"
+        if late_minutes is None:
+            return "خطأ"  # وقت حضور غير صالح
+        if late_minutes > 0:
+            return "متأخر"
+        if check_out and early_leave_minutes:
+            return "انصراف مبكر"
+        return "حاضر" if check_out else "لم ينصرف"
 
     def update_attendance_stats(self):
         """تحديث إحصائيات الحضور"""
-        today = datetime.now().strftime("%Y-%m-%d")
-
-        # إحصائيات اليوم
-        stats = self.execute_db(
-            "SELECT check_in, check_out FROM attendance WHERE date=?",
-            (today,), fetch=True
-        )
-
-        present = 0
-        late = 0
-        total_hours = 0
-
-        if stats:
-            for s in stats:
-                if s[0]:  # If check_in exists
-                    present += 1
-                    try:
-                        in_time = datetime.strptime(s[0], "%H:%M")
-                        work_start = datetime.strptime("08:00", "%H:%M")
-                        if in_time > work_start:
-                            late += 1
-                    except ValueError:
-                        pass  # Handle invalid time format
-
-                if s[0] and s[1]:  # If both check_in and check_out exist
-                    try:
-                        in_time = datetime.strptime(s[0], "%H:%M")
-                        out_time = datetime.strptime(s[1], "%H:%M")
-                        if out_time < in_time:
-                            out_time += timedelta(days=1)
-                        total_hours += (out_time - in_time).total_seconds() / 3600
-                    except ValueError:
-                        continue  # Handle invalid time format
-
-            total_employees = len(self.execute_db("SELECT id FROM employees", fetch=True) or [])
-            absent = total_employees - present
-
+        def done(stats):
+            present, late, work_minutes, headcount = stats
             self.stats_labels['present'].config(text=str(present))
             self.stats_labels['late'].config(text=str(late))
-            self.stats_labels['absent'].config(text=str(absent))
-            self.stats_labels['work_hours'].config(text=f"{total_hours:.1f}")
-        else:
-            total_employees = len(self.execute_db("SELECT id FROM employees", fetch=True) or [])
-            for key in self.stats_labels:
-                if key == 'absent':
-                    self.stats_labels[key].config(text=str(total_employees))
-                else:
-                    self.stats_labels[key].config(text="0")
+            self.stats_labels['absent'].config(text=str(max(headcount - present, 0)))
+            self.stats_labels['work_hours'].config(text=f"{work_minutes / 60:.1f}")
+
+        # قراءة صف واحد من ملخص اليوم الذي تحدّثه المشغلات (triggers) مع عدد الموظفين المخزن
+        today = datetime.now().strftime("%Y-%m-%d")
+        self.run_in_background(lambda: database.attendance_day_stats(today), done, key="attendance_stats")
 
     def clear_attendance_entries(self):
         """مسح حقول الحضور"""
@@ -1304,69 +1854,226 @@ class HRApp(tk.Tk):
         """تقرير الحضور اليومي"""
         today = datetime.now().strftime("%Y-%m-%d")
 
-        report_data = self.execute_db(
-            """
-            SELECT e.full_name, a.date, a.check_in, a.check_out
-            FROM attendance a
-            JOIN employees e ON a.employee_id = e.id
-            WHERE a.date = ?
-            ORDER BY e.full_name
-            """,
-            (today,), fetch=True
-        )
+        def load():
+            report_data = database.get_manager().execute(
+                """
+                SELECT e.full_name, a.date, a.check_in, a.check_out, a.work_minutes, a.late_minutes,
+                       a.early_leave_minutes, a.overtime_minutes, sh.name
+                FROM attendance a
+                JOIN employees e ON a.employee_id = e.id
+                LEFT JOIN shifts sh ON a.shift_id = sh.id
+                WHERE a.date = ?
+                ORDER BY e.full_name
+                """,
+                (today,), fetch=True
+            )
+            return [self._attendance_report_row(row) for row in report_data]
 
-        if not report_data:
-            messagebox.showinfo("تقرير الحضور اليومي", f"لا توجد بيانات حضور لليوم {today}")
-            return
+        def done(rows):
+            if not rows:
+                messagebox.showinfo("تقرير الحضور اليومي", f"لا توجد بيانات حضور لليوم {today}")
+                return
 
-        file_path = filedialog.asksaveasfilename(defaultextension=".csv",
-                                                 filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-                                                 title=f"حفظ تقرير حضور {today}")
-        if not file_path:
-            return
+            file_path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                                     filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+                                                     title=f"حفظ تقرير حضور {today}")
+            if not file_path:
+                return
 
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["اسم الموظف", "التاريخ", "وقت الحضور", "وقت الانصراف", "ساعات العمل", "الحالة"])
-
-                for row in report_data:
-                    work_hours = self.calculate_work_hours(row[2], row[3])
-                    status = self.get_attendance_status(row[2], row[3])
-                    writer.writerow([row[0], row[1], row[2] or "غائب", row[3] or "لم ينصرف", work_hours, status])
-            messagebox.showinfo("تم", f"تم حفظ تقرير الحضور اليومي في: {file_path}")
-            self.update_status(f"تم إنشاء تقرير الحضور لليوم {today}")
-        except Exception as e:
-            messagebox.showerror("خطأ في التقرير", f"حدث خطأ أثناء حفظ التقرير: {e}")
+            try:
+                self.write_csv(file_path, ATTENDANCE_REPORT_HEADERS, rows)
+                messagebox.showinfo("تم", f"تم حفظ تقرير الحضور اليومي في: {file_path}")
+                self.update_status(f"تم إنشاء تقرير الحضور لليوم {today}")
+            except Exception as e:
+                messagebox.showerror("خطأ في التقرير", f"حدث خطأ أثناء حفظ التقرير: {e}")
 
-        return frame
+        self.run_in_background(load, done)
+
+    def _attendance_report_row(self, row):
+        """تحويل صف (الاسم، التاريخ، الحضور، الانصراف، دقائق العمل والتأخير والانصراف المبكر والإضافي، الوردية)
+        إلى صف تقرير"""
+        work_hours = self.format_work_hours(row[2], row[3], row[4])
+        status = self.format_attendance_status(row[2], row[3], row[5], row[6])
+        return [row[0], row[1], row[2] or "غائب", row[3] or "لم ينصرف", work_hours, status,
+                row[8] or "", row[5] or 0, row[6] or 0, row[7] or 0]
 
     def refresh_attendance(self):
         """تحديث جدول الحضور"""
-        for row in self.att_tree.get_children():
-            self.att_tree.delete(row)
-
-        # استعلام محسن مع أسماء الموظفين
-        query = """
-        SELECT a.id, e.full_name, a.date, a.check_in, a.check_out
-        FROM attendance a
-        JOIN employees e ON a.employee_id = e.id
-        ORDER BY a.date DESC, a.check_in DESC
-        """
+        self._mark_tables_seen("attendance")
+        self.att_pages.reload(lambda total: self.update_status(f"تم تحديث جدول الحضور ({total} سجل)"))
+        self.update_attendance_stats()  # Update stats when refreshing table
 
-        rows = self.execute_db(query, fetch=True)
-        if rows:
+    def _attendance_display_row(self, row):
+        """تحويل صف (المعرف، الاسم، التاريخ، الحضور، الانصراف، دقائق العمل والتأخير والانصراف المبكر) إلى صف العرض"""
+        work_hours = self.format_work_hours(row[3], row[4], row[5])
+        status = self.format_attendance_status(row[3], row[4], row[6], row[7])
+        return (row[0], row[1], row[2], row[3] or "لم يحضر", row[4] or "لم ينصرف", work_hours, status)
+
+    # ---------------- الورديات -----------------
+    def manage_shifts(self):
+        """نافذة تعريف الورديات وتعيينها للموظفين ابتداءً من تاريخ سريان"""
+        window = tk.Toplevel(self)
+        window.title("الورديات")
+        window.geometry("650x560")
+        window.grab_set()
+
+        # جدول الورديات
+        columns = ("id", "الوردية", "البداية", "النهاية", "السماح (دقيقة)")
+        tree = ttk.Treeview(window, columns=columns, show="headings", height=8)
+        for col, width in zip(columns, (0, 200, 100, 100, 120)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width, anchor='e')
+        tree.configure(displaycolumns=columns[::-1])
+        tree.column("id", width=0, stretch=False)
+        tree.pack(fill='x', padx=10, pady=10)
+
+        # حقول الوردية
+        form = tk.Frame(window)
+        form.pack(fill='x', padx=10)
+        entries = {}
+        for row, (key, text) in enumerate([("name", "اسم الوردية:"), ("start", "البداية (HH:MM):"),
+                                           ("end", "النهاية (HH:MM):"), ("grace", "السماح بالتأخير (دقيقة):")]):
+            tk.Label(form, text=text, font=('Arial', 10, 'bold')).grid(row=row, column=1, sticky="e", pady=3)
+            entries[key] = tk.Entry(form, font=('Arial', 10), justify='right')
+            entries[key].grid(row=row, column=0, sticky="ew", padx=10, pady=3)
+        form.columnconfigure(0, weight=1)
+
+        # تعيين وردية لموظف
+        assign = tk.LabelFrame(window, text="تعيين وردية لموظف", font=('Arial', 10, 'bold'))
+        assign.pack(fill='x', padx=10, pady=10)
+        tk.Label(assign, text="الموظف:").grid(row=0, column=1, sticky="e", pady=3)
+        employee_var = tk.StringVar()
+        employee_picker = EmployeePicker(assign, self.employee_directory, textvariable=employee_var,
+                                         font=('Arial', 10))
+        employee_picker.grid(row=0, column=0, sticky="ew", padx=10, pady=3)
+        tk.Label(assign, text="الوردية:").grid(row=1, column=1, sticky="e", pady=3)
+        shift_var = tk.StringVar()
+        shift_combo = ttk.Combobox(assign, textvariable=shift_var, state='readonly', font=('Arial', 10))
+        shift_combo.grid(row=1, column=0, sticky="ew", padx=10, pady=3)
+        tk.Label(assign, text="اعتباراً من:").grid(row=2, column=1, sticky="e", pady=3)
+        effective_entry = DateEntry(assign, font=('Arial', 10))
+        effective_entry.grid(row=2, column=0, sticky="ew", padx=10, pady=3)
+        effective_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+        assign.columnconfigure(0, weight=1)
+
+        shift_ids = {}
+
+        def load_shifts():
+            tree.delete(*tree.get_children())
+            shift_ids.clear()
+            rows = self.execute_db(
+                "SELECT id, name, start_time, end_time, grace_minutes FROM shifts ORDER BY start_time, name",
+                fetch=True) or []
             for row in rows:
-                work_hours = self.calculate_work_hours(row[3], row[4])
-                status = self.get_attendance_status(row[3], row[4])
-
-                display_row = (
-                    row[0], row[1], row[2], row[3] or "لم يحضر",
-                    row[4] or "لم ينصرف", work_hours, status
-                )
-                self.att_tree.insert("", "end", values=display_row)
-        self.update_attendance_stats()  # Update stats when refreshing table
-        self.update_status(f"تم تحديث جدول الحضور ({len(rows) if rows else 0} سجل)")
+                tree.insert("", "end", iid=str(row[0]), values=row)
+                shift_ids[row[1]] = row[0]
+            shift_combo['values'] = list(shift_ids)
+
+        def on_select(event=None):
+            selected = tree.selection()
+            if not selected:
+                return
+            _, name, start, end, grace = tree.item(selected[0])["values"]
+            for key, value in (("name", name), ("start", start), ("end", end), ("grace", grace)):
+                entries[key].delete(0, tk.END)
+                entries[key].insert(0, value)
+            shift_var.set(name)
+
+        def form_values():
+            name = entries["name"].get().strip()
+            if not name:
+                messagebox.showerror("خطأ", "اسم الوردية مطلوب", parent=window)
+                return None
+            try:
+                start = datetime.strptime(entries["start"].get().strip(), "%H:%M").strftime("%H:%M")
+                end = datetime.strptime(entries["end"].get().strip(), "%H:%M").strftime("%H:%M")
+            except ValueError:
+                messagebox.showerror("خطأ", "أوقات الوردية يجب أن تكون بالتنسيق HH:MM", parent=window)
+                return None
+            try:
+                grace = int(entries["grace"].get().strip() or 0)
+                if grace < 0:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("خطأ", "مدة السماح يجب أن تكون عدداً صحيحاً موجباً", parent=window)
+                return None
+            return name, start, end, grace
+
+        def run(query, params, message):
+            # تعديل الورديات يعيد حساب دقائق سجلات الحضور المتأثرة، لذا ينفذ في الخلفية
+            def done(_):
+                load_shifts()
+                self.refresh_attendance()
+                self.update_status(message)
+
+            self.update_status("جاري إعادة حساب سجلات الحضور...")
+            self.run_in_background(
+                lambda: database.get_manager().execute(query, params), done,
+                on_error=lambda e: messagebox.showerror("خطأ في قاعدة البيانات", str(e), parent=window))
+
+        def add_shift():
+            values = form_values()
+            if values:
+                run("INSERT INTO shifts (name, start_time, end_time, grace_minutes) VALUES (?, ?, ?, ?)",
+                    values, f"تمت إضافة الوردية {values[0]}")
+
+        def update_shift():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showwarning("تنبيه", "اختر وردية للتعديل", parent=window)
+                return
+            values = form_values()
+            if values:
+                run("UPDATE shifts SET name=?, start_time=?, end_time=?, grace_minutes=? WHERE id=?",
+                    values + (int(selected[0]),), f"تم تحديث الوردية {values[0]}")
+
+        def delete_shift():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showwarning("تنبيه", "اختر وردية للحذف", parent=window)
+                return
+            shift_id = int(selected[0])
+            if shift_id == database.DEFAULT_SHIFT_ID:
+                messagebox.showwarning("تنبيه", "لا يمكن حذف الوردية الافتراضية", parent=window)
+                return
+            name = tree.item(selected[0])["values"][1]
+            if messagebox.askyesno("تأكيد الحذف", f"حذف الوردية '{name}'؟\nيعود موظفوها إلى الوردية الافتراضية.",
+                                   parent=window):
+                run("DELETE FROM shifts WHERE id=?", (shift_id,), f"تم حذف الوردية {name}")
+
+        def assign_shift():
+            employee = employee_picker.selected_employee()
+            if employee is None:
+                messagebox.showwarning("تنبيه", "الرجاء اختيار الموظف", parent=window)
+                return
+            shift_id = shift_ids.get(shift_var.get())
+            if shift_id is None:
+                messagebox.showwarning("تنبيه", "الرجاء اختيار الوردية", parent=window)
+                return
+            effective_from = effective_entry.get()
+            try:
+                datetime.strptime(effective_from, "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("خطأ", "تنسيق التاريخ يجب أن يكون YYYY-MM-DD", parent=window)
+                return
+            run("""
+                INSERT INTO employee_shifts (employee_id, shift_id, effective_from) VALUES (?, ?, ?)
+                ON CONFLICT(employee_id, effective_from) DO UPDATE SET shift_id = excluded.shift_id
+                """, (employee.id, shift_id, effective_from),
+                f"تم تعيين وردية {shift_var.get()} للموظف {employee.full_name} من {effective_from}")
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, before=assign)
+        for text, color, command in [("➕ إضافة", COLORS['success'], add_shift),
+                                     ("✔️ تحديث", COLORS['warning'], update_shift),
+                                     ("🗑️ حذف", COLORS['danger'], delete_shift)]:
+            tk.Button(buttons, text=text, bg=color, fg='white', font=('Arial', 10, 'bold'),
+                      cursor='hand2', command=command, width=12).pack(side='right', padx=5, pady=5)
+        tk.Button(assign, text="📌 تعيين الوردية", bg=COLORS['primary'], fg='white', font=('Arial', 10, 'bold'),
+                  cursor='hand2', command=assign_shift).grid(row=3, column=0, columnspan=2, pady=5)
+
+        tree.bind('<<TreeviewSelect>>', on_select)
+        load_shifts()
 
     # ---------------- تبويب الإجازات المحسن -----------------
     def create_leave_tab(self):
@@ -1399,8 +2106,8 @@ class HRApp(tk.Tk):
         tk.Label(left_frame, text="الموظف:", font=('Arial', 10, 'bold'),
                  bg='white').grid(row=0, column=1, sticky='e', pady=5)
         self.leave_emp_var = tk.StringVar()
-        self.leave_emp = ttk.Combobox(left_frame, textvariable=self.leave_emp_var,
-                                      state="readonly", width=25, font=('Arial', 10))
+        self.leave_emp = EmployeePicker(left_frame, self.employee_directory, textvariable=self.leave_emp_var,
+                                        width=25, font=('Arial', 10))
         self.leave_emp.grid(row=0, column=0, pady=5, sticky='ew')
 
         tk.Label(left_frame, text="نوع الإجازة:", font=('Arial', 10, 'bold'),
@@ -1437,9 +2144,16 @@ class HRApp(tk.Tk):
         left_frame.columnconfigure(0, weight=1)
         right_frame.columnconfigure(0, weight=1)
 
+        # رصيد الموظف المختار من جدول الأرصدة
+        self.leave_balance_label = tk.Label(input_frame, text="", font=('Arial', 10, 'bold'),
+                                            bg='white', fg=COLORS['secondary'], anchor='e')
+        self.leave_balance_label.pack(fill='x', padx=30)
+
         # ربط تغيير التاريخ بحساب الأيام
         self.leave_from.bind('<KeyRelease>', self.calculate_leave_days)
         self.leave_to.bind('<KeyRelease>', self.calculate_leave_days)
+        self.leave_emp.bind('<<ComboboxSelected>>', lambda event: self.show_leave_balance())
+        self.leave_emp.bind('<FocusOut>', lambda event: self.show_leave_balance())
 
         # أزرار العمليات
         button_frame = tk.Frame(input_frame, bg='white')
@@ -1450,7 +2164,10 @@ class HRApp(tk.Tk):
             ("✅ اعتماد", COLORS['success'], self.approve_leave),
             ("❌ رفض", COLORS['danger'], self.reject_leave),
             ("🔄 تحديث", COLORS['secondary'], self.refresh_leaves),
-            ("📊 إحصائيات", COLORS['warning'], self.leave_statistics)
+            ("📊 إحصائيات", COLORS['warning'], self.leave_statistics),
+            ("📈 لوحة الإجازات", COLORS['primary'], self.leave_dashboard),
+            ("🔍 تدقيق التداخل", COLORS['secondary'], self.audit_leave_overlaps),
+            ("💼 أرصدة الإجازات", COLORS['success'], self.leave_balances_window)
         ]
 
         for text, color, command in buttons:
@@ -1482,16 +2199,28 @@ class HRApp(tk.Tk):
         # أشرطة التمرير
         v_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.leave_tree.yview)
         h_scrollbar = ttk.Scrollbar(table_frame, orient="horizontal", command=self.leave_tree.xview)
-        self.leave_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.leave_tree.configure(xscrollcommand=h_scrollbar.set)
 
         # تخطيط الجدول
         self.leave_tree.grid(row=0, column=0, sticky="nsew")
         v_scrollbar.grid(row=0, column=1, sticky="ns")
         h_scrollbar.grid(row=1, column=0, sticky="ew")
 
+        # تحميل الجدول صفحة بصفحة من أحدث طلب
+        self.leave_pages = PagedTable(self, self.leave_tree, v_scrollbar, "leave_tree", """
+            SELECT l.id, e.full_name, l.type, l.start_date, l.end_date,
+                   l.days, l.reason, l.status, l.request_date
+            FROM leaves l
+            JOIN employees e ON l.employee_id = e.id""", ("l.request_date", "l.id"),
+                                      key_of=lambda row: (row[8], row[0]),
+                                      count_sql="SELECT COUNT(*) FROM leaves l JOIN employees e ON l.employee_id = e.id")
+        self.leave_pages.label.grid(row=2, column=0, sticky="e")
+
         table_frame.grid_rowconfigure(0, weight=1)
         table_frame.grid_columnconfigure(0, weight=1)
 
+        self.leave_tree.bind('<<TreeviewSelect>>', self.on_leave_select)
+
         self.refresh_leaves()
 
     def calculate_leave_days(self, event=None):
@@ -1528,8 +2257,8 @@ class HRApp(tk.Tk):
 
     def add_leave(self):
         """إضافة طلب إجازة"""
-        name = self.leave_emp_var.get()
-        if name not in self.emp_dict:
+        employee = self.leave_emp.selected_employee()
+        if employee is None:
             messagebox.showwarning("تنبيه", "اختر الموظف")
             return
 
@@ -1554,8 +2283,11 @@ class HRApp(tk.Tk):
         # حساب عدد الأيام
         days = (to_date - from_date).days + 1
 
+        if not self.check_leave_conflicts(employee.id, self.leave_from.get(), self.leave_to.get()):
+            return
+
         data = (
-            self.emp_dict[name],
+            employee.id,
             self.leave_type_var.get(),
             self.leave_from.get(),
             self.leave_to.get(),
@@ -1566,16 +2298,72 @@ class HRApp(tk.Tk):
         )
 
         result = self.execute_db(
-            "INSERT INTO leaves (employee_id, type, start_date, end_date, days, reason, status, request_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            data
+            "INSERT INTO leaves (employee_id, type, start_date, end_date, days, reason, status, request_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id",
+            data, fetch=True
         )
 
-        if result is not None:
+        if result:
             messagebox.showinfo("تم", "تم إرسال طلب الإجازة")
             self.clear_leave_entries()
-            self.refresh_leaves()
+            self.leave_changed(result[0][0], inserted=True)
             self.update_status("تم إضافة طلب إجازة جديد")
 
+    def check_leave_conflicts(self, employee_id, start_date, end_date, exclude_id=None,
+                              statuses=database.ACTIVE_LEAVE_STATUSES, check_attendance=True):
+        """التحقق من تداخل فترة إجازة مع إجازات الموظف الأخرى وسجلات حضوره
+
+        يعيد False إذا وُجد تداخل مع إجازة أخرى، أو مع الحضور ولم يؤكد المستخدم المتابعة.
+        """
+        try:
+            leaves, attendance = database.find_leave_conflicts(employee_id, start_date, end_date,
+                                                               exclude_id=exclude_id, statuses=statuses)
+        except Exception as e:
+            messagebox.showerror("خطأ في قاعدة البيانات", str(e))
+            return False
+
+        if leaves:
+            lines = "\n".join(f"{leave_type}: {start} ← {end} ({status})"
+                              for _, leave_type, start, end, status in leaves[:5])
+            messagebox.showerror("تعارض في الإجازات", f"تتداخل الفترة مع إجازات أخرى للموظف:\n{lines}")
+            return False
+        if check_attendance and attendance:
+            dates = "، ".join(day for day, _, _ in attendance[:5])
+            more = " ..." if len(attendance) > 5 else ""
+            return messagebox.askyesno("تعارض مع الحضور",
+                                       f"للموظف حضور مسجل في {len(attendance)} يوم من أيام الإجازة: {dates}{more}\n"
+                                       "هل تريد المتابعة رغم ذلك؟")
+        return True
+
+    def audit_leave_overlaps(self):
+        """تدقيق جدول الإجازات كاملاً بحثاً عن الإجازات المتداخلة وحفظ النتيجة في ملف CSV"""
+        def done(pairs):
+            if not pairs:
+                messagebox.showinfo("تدقيق التداخل", "لا توجد إجازات متداخلة")
+                return
+            if not messagebox.askyesno("تدقيق التداخل",
+                                       f"وُجد {len(pairs)} زوج من الإجازات المتداخلة. هل تريد حفظ القائمة؟"):
+                return
+            file_path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                                     filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+                                                     title="حفظ الإجازات المتداخلة")
+            if not file_path:
+                return
+
+            def name(employee_id):
+                employee = self.employee_directory.get(employee_id)
+                return employee.full_name if employee else f"#{employee_id}"
+
+            try:
+                self.write_csv(file_path, ["الموظف", "رقم الطلب الأول", "رقم الطلب الثاني", "التداخل من", "التداخل إلى"],
+                               ([name(employee_id), *rest] for employee_id, *rest in pairs))
+                self.update_status(f"تم حفظ {len(pairs)} تداخل في {file_path}")
+            except Exception as e:
+                messagebox.showerror("خطأ", f"تعذر حفظ الملف: {e}")
+
+        self.update_status("جاري تدقيق تداخل الإجازات...")
+        self.run_in_background(database.audit_leave_overlaps, done,
+                               on_error=lambda e: messagebox.showerror("خطأ في قاعدة البيانات", str(e)))
+
     def approve_leave(self):
         """اعتماد الإجازة"""
         self.update_leave_status("معتمد")
@@ -1596,14 +2384,149 @@ class HRApp(tk.Tk):
 
         if messagebox.askyesno("تأكيد", f"هل تريد {status} إجازة الموظف {employee_name}؟"):
             leave_id = leave_data[0]
+            if status == "معتمد":
+                leave = self.execute_db("SELECT employee_id, start_date, end_date FROM leaves WHERE id=?",
+                                        (leave_id,), fetch=True)
+                # لا تُعتمد إجازة تتداخل مع إجازة معتمدة أخرى للموظف نفسه
+                if not leave or not self.check_leave_conflicts(*leave[0], exclude_id=leave_id,
+                                                               statuses=("معتمد",), check_attendance=False):
+                    return
             result = self.execute_db("UPDATE leaves SET status=? WHERE id=?", (status, leave_id))
 
             if result is not None:
                 messagebox.showinfo("تم", f"تم {status} الإجازة")
-                self.refresh_leaves()
+                self.leave_changed(leave_id)
                 self.update_status(f"تم {status} إجازة {employee_name}")
                 self.clear_leave_entries()  # Clear entries after action
 
+    def leave_changed(self, leave_id, inserted=False):
+        """تحديث صف الإجازة وحده بعد تعديله محلياً"""
+        self.leave_pages.refresh_row(leave_id, inserted=inserted)
+        if self._leave_balance_employee is not None:
+            self.show_leave_balance(self._leave_balance_employee)
+
+    def on_leave_select(self, event=None):
+        """عرض رصيد صاحب طلب الإجازة المحدد"""
+        selected = self.leave_tree.selection()
+        if not selected:
+            return
+        leave = self.execute_db("SELECT employee_id FROM leaves WHERE id=?",
+                                (self.leave_tree.item(selected[0])["values"][0],), fetch=True)
+        if leave:
+            self.show_leave_balance(leave[0][0])
+
+    def show_leave_balance(self, employee_id=None):
+        """عرض رصيد إجازات الموظف لسنة تاريخ البداية (أو السنة الحالية) من جدول الأرصدة"""
+        if employee_id is None:
+            employee = self.leave_emp.selected_employee()
+            employee_id = employee.id if employee else None
+        self._leave_balance_employee = employee_id
+        if employee_id is None:
+            self.leave_balance_label.config(text="")
+            return
+        try:
+            year = datetime.strptime(self.leave_from.get(), "%Y-%m-%d").year
+        except ValueError:
+            year = datetime.now().year
+
+        def show(rows):
+            if self._leave_balance_employee != employee_id:
+                return
+            employee = self.employee_directory.get(employee_id)
+            name = employee.full_name if employee else f"#{employee_id}"
+            parts = " | ".join(f"{leave_type}: {balance:g} يوم" for _, _, _, leave_type, _, _, _, balance in rows)
+            self.leave_balance_label.config(text=f"رصيد {name} لعام {year}: {parts or 'لا يوجد رصيد'}")
+
+        self.run_in_background(lambda: database.leave_balances(employee_id, year), show, key="leave_balance")
+
+    def _on_leave_accruals_posted(self, posted):
+        if posted:
+            self.update_status(f"تم ترحيل {posted} استحقاق إجازة شهري")
+            if self._leave_balance_employee is not None:
+                self.show_leave_balance(self._leave_balance_employee)
+
+    def leave_balances_window(self):
+        """أرصدة الإجازات لكل موظف ونوع في سنة محددة، مع ترحيل الاستحقاقات والرصيد المتبقي"""
+        window = tk.Toplevel(self)
+        window.title("أرصدة الإجازات")
+        window.geometry("820x500")
+
+        top = tk.Frame(window)
+        top.pack(fill='x', padx=10, pady=10)
+        tk.Label(top, text="السنة:", font=('Arial', 10, 'bold')).pack(side='right')
+        year_var = tk.StringVar(value=str(datetime.now().year))
+        year_box = ttk.Combobox(top, textvariable=year_var, width=8, font=('Arial', 10))
+        year_box.pack(side='right', padx=5)
+
+        table_frame = tk.Frame(window)
+        table_frame.pack(fill='both', expand=True, padx=10)
+        columns = ("الموظف", "النوع", "المستحق", "المرحّل", "المستخدم", "الرصيد")
+        tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=180 if col == "الموظف" else 100, anchor='e')
+        tree.configure(displaycolumns=columns[::-1])
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='right', fill='both', expand=True)
+        scrollbar.pack(side='left', fill='y')
+
+        def selected_year():
+            try:
+                return int(year_var.get())
+            except ValueError:
+                messagebox.showerror("خطأ", "السنة يجب أن تكون رقماً", parent=window)
+                return None
+
+        def show(rows):
+            tree.delete(*tree.get_children())
+            for _, name, _, leave_type, accrued, carried, used, balance in rows:
+                tree.insert("", "end", values=(name, leave_type, f"{accrued:g}", f"{carried:g}", f"{used:g}",
+                                               f"{balance:g}"))
+            self.update_status(f"أرصدة الإجازات لعام {year_var.get()}: {len(rows)} رصيد")
+
+        def load(event=None):
+            year = selected_year()
+            if year is not None:
+                self.run_in_background(lambda: database.leave_balances(year=year), show, key="leave_balances")
+            self.query_in_background("SELECT DISTINCT year FROM leave_balances ORDER BY year DESC", (),
+                                     lambda rows: year_box.configure(values=[str(y) for y, in rows]),
+                                     key="leave_balance_years")
+
+        def posted(message):
+            def done(count):
+                self.update_status(message.format(count=count))
+                load()
+                if self._leave_balance_employee is not None:
+                    self.show_leave_balance(self._leave_balance_employee)
+            return done
+
+        def on_error(e):
+            messagebox.showerror("خطأ في قاعدة البيانات", str(e), parent=window)
+
+        def post_accruals():
+            self.run_in_background(database.post_leave_accruals, posted("تم ترحيل {count} استحقاق إجازة شهري"),
+                                   on_error=on_error)
+
+        def carry_forward():
+            year = selected_year()
+            if year is None or not messagebox.askyesno(
+                    "ترحيل الرصيد", f"هل تريد ترحيل الرصيد المتبقي من عام {year} إلى عام {year + 1}؟", parent=window):
+                return
+            self.run_in_background(lambda: database.carry_forward_leave(year),
+                                   posted(f"تم ترحيل رصيد {{count}} موظف إلى عام {year + 1}"), on_error=on_error)
+
+        year_box.bind('<<ComboboxSelected>>', load)
+        year_box.bind('<Return>', load)
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, pady=10)
+        for text, color, command in (("🔄 تحديث", COLORS['secondary'], load),
+                                     ("📅 ترحيل الاستحقاقات", COLORS['primary'], post_accruals),
+                                     ("⏭️ ترحيل الرصيد للسنة التالية", COLORS['warning'], carry_forward)):
+            tk.Button(buttons, text=text, bg=color, fg='white', font=('Arial', 10, 'bold'),
+                      command=command).pack(side='right', padx=5)
+        load()
+
     def clear_leave_entries(self):
         """مسح حقول الإجازة"""
         self.leave_emp_var.set('')
@@ -1617,41 +2540,78 @@ class HRApp(tk.Tk):
         self.leave_tree.selection_remove(self.leave_tree.selection())  # Deselect any selected item
 
     def leave_statistics(self):
-        """إحصائيات الإجازات"""
-        approved_leaves = self.execute_db("SELECT COUNT(*) FROM leaves WHERE status = 'معتمد'", fetch=True)
-        pending_leaves = self.execute_db("SELECT COUNT(*) FROM leaves WHERE status = 'معلق'", fetch=True)
-        rejected_leaves = self.execute_db("SELECT COUNT(*) FROM leaves WHERE status = 'مرفوض'", fetch=True)
-
-        approved_count = approved_leaves[0][0] if approved_leaves else 0
-        pending_count = pending_leaves[0][0] if pending_leaves else 0
-        rejected_count = rejected_leaves[0][0] if rejected_leaves else 0
+        """إحصائيات الإجازات من جدول العدادات في استعلام واحد"""
+        try:
+            counts = {status: requests for _, _, status, requests, _ in database.leave_counters(["all"])}
+        except Exception as e:
+            messagebox.showerror("خطأ في قاعدة البيانات", str(e))
+            return
 
         messagebox.showinfo("إحصائيات الإجازات",
-                            f"إجازات معتمدة: {approved_count}\n"
-                            f"إجازات معلقة: {pending_count}\n"
-                            f"إجازات مرفوضة: {rejected_count}")
-
-        return frame
+                            f"إجازات معتمدة: {counts.get('معتمد', 0)}\n"
+                            f"إجازات معلقة: {counts.get('معلق', 0)}\n"
+                            f"إجازات مرفوضة: {counts.get('مرفوض', 0)}")
+
+    def leave_dashboard(self):
+        """لوحة الإجازات حسب النوع والشهر والقسم، مقروءة من جدول العدادات في استعلام واحد"""
+        window = tk.Toplevel(self)
+        window.title("لوحة الإجازات")
+        window.geometry("760x480")
+
+        notebook = ttk.Notebook(window)
+        notebook.pack(fill='both', expand=True, padx=10, pady=10)
+        statuses = LEAVE_STATUSES
+        columns = ("value", *statuses, "الإجمالي", "الأيام المعتمدة")
+        trees = {}
+        for dimension, title in (("type", "حسب النوع"), ("month", "حسب الشهر"), ("department", "حسب القسم")):
+            tab = tk.Frame(notebook)
+            notebook.add(tab, text=title)
+            tree = ttk.Treeview(tab, columns=columns, show="headings")
+            for col in columns:
+                tree.heading(col, text=title.replace("حسب ", "") if col == "value" else col)
+                tree.column(col, width=140 if col == "value" else 100, anchor='e')
+            tree.configure(displaycolumns=columns[::-1])
+            scrollbar = ttk.Scrollbar(tab, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side='right', fill='both', expand=True)
+            scrollbar.pack(side='left', fill='y')
+            trees[dimension] = tree
+
+        def show(rows):
+            table = {}
+            for dimension, value, status, requests, days in rows:
+                cell = table.setdefault(dimension, {}).setdefault(value, {"days": 0})
+                cell[status] = requests
+                if status == "معتمد":
+                    cell["days"] = days
+            for dimension, tree in trees.items():
+                tree.delete(*tree.get_children())
+                values = table.get(dimension, {})
+                # الأشهر من الأحدث، وبقية الأبعاد أبجدياً
+                for value in sorted(values, reverse=dimension == "month"):
+                    cell = values[value]
+                    counts = [cell.get(status, 0) for status in statuses]
+                    tree.insert("", "end", values=(value or "غير محدد", *counts, sum(counts), cell["days"]))
+
+        def load():
+            self.run_in_background(lambda: database.leave_counters(list(trees)), show, key="leave_dashboard")
+
+        def rebuild():
+            self.run_in_background(database.rebuild_leave_counters,
+                                   lambda count: (load(), self.update_status(f"أعيد بناء عدادات الإجازات ({count} خلية)")))
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, pady=(0, 10))
+        tk.Button(buttons, text="🔄 تحديث", bg=COLORS['secondary'], fg='white', font=('Arial', 10, 'bold'),
+                  command=load).pack(side='right', padx=5)
+        tk.Button(buttons, text="🛠️ إعادة بناء العدادات", bg=COLORS['warning'], fg='white',
+                  font=('Arial', 10, 'bold'), command=rebuild).pack(side='right', padx=5)
+        load()
 
     def refresh_leaves(self):
         """تحديث جدول الإجازات"""
-        for row in self.leave_tree.get_children():
-            self.leave_tree.delete(row)
-
-        # استعلام محسن
-        query = """
-        SELECT l.id, e.full_name, l.type, l.start_date, l.end_date, 
-               l.days, l.reason, l.status, l.request_date
-        FROM leaves l
-        JOIN employees e ON l.employee_id = e.id
-        ORDER BY l.request_date DESC
-        """
-
-        rows = self.execute_db(query, fetch=True)
-        if rows:
-            for row in rows:
-                self.leave_tree.insert("", "end", values=row)
-        self.update_status(f"تم تحديث جدول الإجازات ({len(rows) if rows else 0} طلب)")
+        self._mark_tables_seen("leaves")
+        self.leave_pages.reload(lambda total: self.update_status(f"تم تحديث جدول الإجازات ({total} طلب)"))
 
     # ---------------- تبويب الرواتب المحسن -----------------
     def create_salary_tab(self):
@@ -1684,8 +2644,8 @@ class HRApp(tk.Tk):
         tk.Label(left_frame, text="الموظف:", font=('Arial', 10, 'bold'),
                  bg='white').grid(row=0, column=1, sticky='e', pady=5)
         self.salary_emp_var = tk.StringVar()
-        self.salary_emp = ttk.Combobox(left_frame, textvariable=self.salary_emp_var,
-                                       state="readonly", width=25, font=('Arial', 10))
+        self.salary_emp = EmployeePicker(left_frame, self.employee_directory, textvariable=self.salary_emp_var,
+                                         width=25, font=('Arial', 10))
         self.salary_emp.grid(row=0, column=0, pady=5, sticky='ew')
         self.salary_emp.bind("<<ComboboxSelected>>", self.load_employee_salary)
 
@@ -1747,7 +2707,8 @@ class HRApp(tk.Tk):
             ("✏️ تعديل راتب", COLORS['warning'], self.edit_salary),
             ("🗑️ حذف راتب", COLORS['danger'], self.delete_salary),
             ("🔄 تحديث", COLORS['secondary'], self.refresh_salaries),
-            ("📄 طباعة كشوفات", COLORS['primary'], self.print_payslips)
+            ("📄 طباعة كشوفات", COLORS['primary'], self.print_payslips),
+            ("🧾 مسير الرواتب", COLORS['success'], self.payroll_run_window)
         ]
 
         for text, color, command in buttons:
@@ -1780,13 +2741,23 @@ class HRApp(tk.Tk):
         # أشرطة التمرير
         v_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.salary_tree.yview)
         h_scrollbar = ttk.Scrollbar(table_frame, orient="horizontal", command=self.salary_tree.xview)
-        self.salary_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.salary_tree.configure(xscrollcommand=h_scrollbar.set)
 
         # تخطيط الجدول
         self.salary_tree.grid(row=0, column=0, sticky="nsew")
         v_scrollbar.grid(row=0, column=1, sticky="ns")
         h_scrollbar.grid(row=1, column=0, sticky="ew")
 
+        # تحميل الجدول صفحة بصفحة من أحدث شهر
+        self.salary_pages = PagedTable(self, self.salary_tree, v_scrollbar, "salary_tree", """
+            SELECT s.id, e.full_name, s.month, s.year, s.basic_salary,
+                   s.bonuses, s.deductions, s.net_salary, s.payment_date
+            FROM salaries s
+            JOIN employees e ON s.employee_id = e.id""", ("s.year", "s.month", "s.id"),
+                                       key_of=lambda row: (row[3], row[2], row[0]),
+                                       count_sql="SELECT COUNT(*) FROM salaries s JOIN employees e ON s.employee_id = e.id")
+        self.salary_pages.label.grid(row=2, column=0, sticky="e")
+
         table_frame.grid_rowconfigure(0, weight=1)
         table_frame.grid_columnconfigure(0, weight=1)
 
@@ -1796,18 +2767,13 @@ class HRApp(tk.Tk):
 
     def load_employee_salary(self, event=None):
         """تحميل الراتب الأساسي للموظف المحدد"""
-        selected_name = self.salary_emp_var.get()
-        if selected_name:
-            emp_id = self.emp_dict.get(selected_name)
-            if emp_id:
-                employee_data = self.execute_db("SELECT salary FROM employees WHERE id = ?", (emp_id,), fetch=True)
-                if employee_data:
-                    basic_salary = employee_data[0][0]
-                    self.basic_salary_entry.config(state='normal')
-                    self.basic_salary_entry.delete(0, tk.END)
-                    self.basic_salary_entry.insert(0, str(basic_salary))
-                    self.basic_salary_entry.config(state='readonly')
-                    self.calculate_net_salary()  # Recalculate net salary when basic salary changes
+        employee = self.salary_emp.selected_employee()
+        if employee:
+            self.basic_salary_entry.config(state='normal')
+            self.basic_salary_entry.delete(0, tk.END)
+            self.basic_salary_entry.insert(0, str(employee.salary))
+            self.basic_salary_entry.config(state='readonly')
+            self.calculate_net_salary()  # Recalculate net salary when basic salary changes
 
     def calculate_net_salary(self, event=None):
         """حساب صافي الراتب"""
@@ -1823,12 +2789,12 @@ class HRApp(tk.Tk):
 
     def add_salary(self):
         """إضافة سجل راتب جديد"""
-        name = self.salary_emp_var.get()
-        if name not in self.emp_dict:
+        employee = self.salary_emp.selected_employee()
+        if employee is None:
             messagebox.showwarning("تنبيه", "الرجاء اختيار الموظف")
             return
 
-        emp_id = self.emp_dict[name]
+        emp_id = employee.id
         month = self.salary_month.get()
         year = int(self.salary_year.get())
 
@@ -1856,15 +2822,15 @@ class HRApp(tk.Tk):
         data = (emp_id, month, year, basic_salary, bonuses, deductions, net_salary, payment_date)
 
         result = self.execute_db(
-            "INSERT INTO salaries (employee_id, month, year, basic_salary, bonuses, deductions, net_salary, payment_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            data
+            "INSERT INTO salaries (employee_id, month, year, basic_salary, bonuses, deductions, net_salary, payment_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id",
+            data, fetch=True
         )
 
-        if result is not None:
+        if result:
             messagebox.showinfo("تم", "تم إضافة سجل الراتب بنجاح")
+            self.salary_changed(result[0][0], inserted=True)
             self.clear_salary_entries()
-            self.refresh_salaries()
-            self.update_status(f"تم إضافة راتب جديد للموظف {name}")
+            self.update_status(f"تم إضافة راتب جديد للموظف {employee.full_name}")
 
     def load_salary_for_edit(self, event=None):
         """تحميل بيانات الراتب المحددة في الحقول للتعديل"""
@@ -1878,8 +2844,12 @@ class HRApp(tk.Tk):
         # Unpack data
         salary_id, emp_name, month, year, basic_salary, bonuses, deductions, net_salary, payment_date = salary_data
 
-        # Set combobox values
-        self.salary_emp_var.set(emp_name)
+        # Set combobox values; the picker is set by employee id so shared names stay distinct
+        owner = self.execute_db("SELECT employee_id FROM salaries WHERE id = ?", (salary_id,), fetch=True)
+        if owner:
+            self.salary_emp.select(owner[0][0])
+        else:
+            self.salary_emp_var.set(emp_name)
         self.salary_month.set(month)
         self.salary_year.set(str(year))
 
@@ -1908,12 +2878,12 @@ class HRApp(tk.Tk):
 
         salary_id = self.salary_tree.item(selected[0])["values"][0]
 
-        name = self.salary_emp_var.get()
-        if name not in self.emp_dict:
+        employee = self.salary_emp.selected_employee()
+        if employee is None:
             messagebox.showwarning("تنبيه", "الرجاء اختيار الموظف")
             return
 
-        emp_id = self.emp_dict[name]
+        emp_id = employee.id
         month = self.salary_month.get()
         year = int(self.salary_year.get())
 
@@ -1937,9 +2907,9 @@ class HRApp(tk.Tk):
 
         if result is not None:
             messagebox.showinfo("تم", "تم تحديث سجل الراتب بنجاح")
+            self.salary_changed(salary_id)
             self.clear_salary_entries()
-            self.refresh_salaries()
-            self.update_status(f"تم تحديث راتب الموظف {name}")
+            self.update_status(f"تم تحديث راتب الموظف {employee.full_name}")
 
     def delete_salary(self):
         """حذف سجل راتب مع التأكيد"""
@@ -1959,10 +2929,14 @@ class HRApp(tk.Tk):
 
             if result is not None:
                 messagebox.showinfo("تم", "تم حذف سجل الراتب")
-                self.refresh_salaries()
+                self.salary_pages.remove_row(salary_id)
                 self.update_status(f"تم حذف سجل راتب الموظف {emp_name}")
                 self.clear_salary_entries()  # Clear entries after deletion
 
+    def salary_changed(self, salary_id, inserted=False):
+        """تحديث صف الراتب وحده بعد تعديله محلياً"""
+        self.salary_pages.refresh_row(salary_id, inserted=inserted)
+
     def clear_salary_entries(self):
         """مسح حقول الرواتب"""
         self.salary_emp_var.set('')
@@ -1978,32 +2952,132 @@ class HRApp(tk.Tk):
         self.net_salary_label.config(text="0.0")
         self.salary_tree.selection_remove(self.salary_tree.selection())  # Deselect any selected item
 
-        return frame
-
     def print_payslips(self):
         """طباعة كشوفات الرواتب"""
         messagebox.showinfo("طباعة كشوفات الرواتب", "سيتم تنفيذ وظيفة طباعة كشوفات الرواتب قريباً.")
         # هنا يمكن إضافة منطق لإنشاء PDF أو ملفات CSV لكشوفات الرواتب
         # قد يتطلب مكتبات إضافية مثل reportlab أو fpdf لإنشاء PDF
 
-    def refresh_salaries(self):
-        """تحديث جدول الرواتب"""
-        for row in self.salary_tree.get_children():
-            self.salary_tree.delete(row)
+    def payroll_run_window(self):
+        """إنشاء رواتب جميع الموظفين النشطين لشهر كامل في معاملة واحدة، مع المعاينة والتراجع
 
-        query = """
-        SELECT s.id, e.full_name, s.month, s.year, s.basic_salary, 
-               s.bonuses, s.deductions, s.net_salary, s.payment_date
-        FROM salaries s
-        JOIN employees e ON s.employee_id = e.id
-        ORDER BY s.year DESC, s.month DESC, e.full_name ASC
+        الخصومات (الغياب والتأخير) والمكافآت (العمل الإضافي) تُحسب من حضور الشهر.
         """
+        window = tk.Toplevel(self)
+        window.title("مسير الرواتب")
+        window.geometry("1000x620")
+
+        top = tk.Frame(window)
+        top.pack(fill='x', padx=10, pady=10)
+        tk.Label(top, text="الشهر:", font=('Arial', 10, 'bold')).pack(side='right')
+        month_box = ttk.Combobox(top, values=[f"{i:02d}" for i in range(1, 13)], state="readonly", width=5,
+                                 font=('Arial', 10))
+        month_box.pack(side='right', padx=5)
+        month_box.set(self.salary_month.get())
+        tk.Label(top, text="السنة:", font=('Arial', 10, 'bold')).pack(side='right')
+        year_box = ttk.Combobox(top, values=list(self.salary_year['values']), state="readonly", width=7,
+                                font=('Arial', 10))
+        year_box.pack(side='right', padx=5)
+        year_box.set(self.salary_year.get())
+        summary_label = tk.Label(top, text="", font=('Arial', 10, 'bold'), fg=COLORS['primary'])
+        summary_label.pack(side='left')
+
+        def table(parent, columns, height):
+            tree = ttk.Treeview(parent, columns=columns, show="headings", height=height)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=180 if col == "الموظف" else 100, anchor='e')
+            tree.configure(displaycolumns=columns[::-1])
+            scrollbar = ttk.Scrollbar(parent, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side='right', fill='both', expand=True)
+            scrollbar.pack(side='left', fill='y')
+            return tree
+
+        preview_frame = tk.Frame(window)
+        preview_frame.pack(fill='both', expand=True, padx=10)
+        preview = table(preview_frame, ("الموظف", "أيام الغياب", "دقائق التأخير", "دقائق الإضافي", "ساعات العمل",
+                                        "الراتب الأساسي", "المكافآت", "الخصومات", "صافي الراتب"), 12)
+
+        tk.Label(window, text="المسيرات السابقة", font=('Arial', 11, 'bold'),
+                 fg=COLORS['primary']).pack(anchor='e', padx=10, pady=(10, 0))
+        runs_frame = tk.Frame(window)
+        runs_frame.pack(fill='x', padx=10)
+        runs = table(runs_frame, ("رقم المسير", "الشهر", "السنة", "تاريخ التنفيذ", "الموظفون", "إجمالي الصافي",
+                                  "تاريخ التراجع"), 5)
+
+        def load_runs():
+            def show(rows):
+                runs.delete(*runs.get_children())
+                for run_id, month, year, run_date, employees, total_net, rolled_back_at in rows:
+                    runs.insert("", "end", iid=str(run_id),
+                                values=(run_id, month, year, run_date, employees, f"{total_net:.2f}",
+                                        rolled_back_at or ""))
+            self.run_in_background(database.payroll_runs, show, key="payroll_runs")
+
+        def on_error(e):
+            messagebox.showerror("خطأ في قاعدة البيانات", str(e), parent=window)
+
+        def start(dry_run):
+            month, year = month_box.get(), int(year_box.get())
+
+            def done(result):
+                run_id, rows, skipped = result
+                preview.delete(*preview.get_children())
+                for _, name, basic, bonuses, deductions, net, absent, late, overtime, hours in rows:
+                    preview.insert("", "end", values=(name, absent, late, overtime,
+                                                      "-" if hours is None else f"{hours:.2f}", f"{basic:.2f}",
+                                                      f"{bonuses:.2f}", f"{deductions:.2f}", f"{net:.2f}"))
+                total = sum(row[5] for row in rows)
+                summary_label.config(text=f"{len(rows)} موظف، الإجمالي {total:.2f}، {skipped} لديهم راتب مسجل")
+                if run_id is None:
+                    self.update_status(f"معاينة مسير {month}/{year}: {len(rows)} راتب")
+                    return
+                self.update_status(f"تم تنفيذ مسير الرواتب رقم {run_id}: {len(rows)} راتب لشهر {month}/{year}")
+                self.refresh_salaries()
+                load_runs()
 
-        rows = self.execute_db(query, fetch=True)
-        if rows:
-            for row in rows:
-                self.salary_tree.insert("", "end", values=row)
-        self.update_status(f"تم تحديث جدول الرواتب ({len(rows) if rows else 0} سجل)")
+            if not dry_run and not messagebox.askyesno(
+                    "تأكيد", f"هل تريد إنشاء رواتب جميع الموظفين النشطين لشهر {month}/{year}؟", parent=window):
+                return
+            self.update_status("جاري حساب مسير الرواتب...")
+            self.run_in_background(lambda: database.run_payroll(month, year, dry_run=dry_run), done,
+                                   key="payroll_run", on_error=on_error)
+
+        def rollback():
+            selected = runs.selection()
+            if not selected:
+                messagebox.showwarning("تنبيه", "اختر مسيراً للتراجع عنه", parent=window)
+                return
+            run_id, month, year, *_, rolled_back_at = runs.item(selected[0])["values"]
+            if rolled_back_at:
+                messagebox.showinfo("تنبيه", "تم التراجع عن هذا المسير مسبقاً", parent=window)
+                return
+            if not messagebox.askyesno("تأكيد التراجع",
+                                       f"هل تريد حذف جميع الرواتب التي أنشأها المسير رقم {run_id} ({month}/{year})؟",
+                                       parent=window):
+                return
+
+            def done(deleted):
+                self.update_status(f"تم التراجع عن المسير رقم {run_id} وحذف {deleted} راتب")
+                self.refresh_salaries()
+                load_runs()
+
+            self.run_in_background(lambda: database.rollback_payroll_run(run_id), done, on_error=on_error)
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, pady=10)
+        for text, color, command in (("👁️ معاينة", COLORS['secondary'], lambda: start(True)),
+                                     ("✅ تنفيذ المسير", COLORS['success'], lambda: start(False)),
+                                     ("↩️ التراجع عن المسير", COLORS['danger'], rollback)):
+            tk.Button(buttons, text=text, bg=color, fg='white', font=('Arial', 10, 'bold'),
+                      command=command).pack(side='right', padx=5)
+        load_runs()
+
+    def refresh_salaries(self):
+        """تحديث جدول الرواتب"""
+        self._mark_tables_seen("salaries")
+        self.salary_pages.reload(lambda total: self.update_status(f"تم تحديث جدول الرواتب ({total} سجل)"))
 
     # ---------------- تبويب التقارير المحسن -----------------
     def create_report_tab(self):
@@ -2078,31 +3152,38 @@ class HRApp(tk.Tk):
             return
 
         query = """
-        SELECT e.full_name, a.date, a.check_in, a.check_out
+        SELECT e.full_name, a.date, a.check_in, a.check_out, a.work_minutes, a.late_minutes,
+               a.early_leave_minutes, a.overtime_minutes, sh.name
         FROM attendance a
         JOIN employees e ON a.employee_id = e.id
+        LEFT JOIN shifts sh ON a.shift_id = sh.id
         WHERE a.date BETWEEN ? AND ?
         ORDER BY e.full_name, a.date
         """
-        report_data = self.execute_db(query, (from_date, to_date), fetch=True)
 
-        if not report_data:
-            messagebox.showinfo("تقرير الحضور", "لا توجد بيانات حضور للفترة المحددة.")
-            return
+        def export():
+            report_data = database.get_manager().execute(query, (from_date, to_date), fetch=True)
+            if report_data:
+                self.write_csv(file_path, ATTENDANCE_REPORT_HEADERS,
+                               (self._attendance_report_row(row) for row in report_data))
+            return len(report_data)
+
+        self._run_report(export, file_path, "تقرير الحضور", "لا توجد بيانات حضور للفترة المحددة.",
+                         f"تم حفظ تقرير الحضور في: {file_path}",
+                         f"تم إنشاء تقرير حضور للفترة {from_date} - {to_date}")
+
+    def _run_report(self, export, file_path, title, empty_message, saved_message, status_message):
+        """تشغيل دالة تصدير تقرير في الخلفية ثم عرض النتيجة"""
+        def done(count):
+            if not count:
+                messagebox.showinfo(title, empty_message)
+                return
+            messagebox.showinfo("تم", saved_message)
+            self.update_status(status_message)
 
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["اسم الموظف", "التاريخ", "وقت الحضور", "وقت الانصراف", "ساعات العمل", "الحالة"])
-
-                for row in report_data:
-                    work_hours = self.calculate_work_hours(row[2], row[3])
-                    status = self.get_attendance_status(row[2], row[3])
-                    writer.writerow([row[0], row[1], row[2] or "غائب", row[3] or "لم ينصرف", work_hours, status])
-            messagebox.showinfo("تم", f"تم حفظ تقرير الحضور في: {file_path}")
-            self.update_status(f"تم إنشاء تقرير حضور للفترة {from_date} - {to_date}")
-        except Exception as e:
-            messagebox.showerror("خطأ في التقرير", f"حدث خطأ أثناء حفظ التقرير: {e}")
+        self.run_in_background(
+            export, done,
+            on_error=lambda e: messagebox.showerror("خطأ في التقرير", f"حدث خطأ أثناء حفظ التقرير: {e}"))
 
     def generate_leave_report(self):
         """إنشاء تقرير شامل للإجازات"""
@@ -2118,23 +3199,18 @@ class HRApp(tk.Tk):
         JOIN employees e ON l.employee_id = e.id
         ORDER BY l.request_date DESC
         """
-        report_data = self.execute_db(query, fetch=True)
 
-        if not report_data:
-            messagebox.showinfo("تقرير الإجازات", "لا توجد بيانات إجازات.")
-            return
+        def export():
+            report_data = database.get_manager().execute(query, fetch=True)
+            if report_data:
+                self.write_csv(file_path,
+                               ["اسم الموظف", "نوع الإجازة", "من تاريخ", "إلى تاريخ", "عدد الأيام", "السبب",
+                                "الحالة", "تاريخ الطلب"],
+                               report_data)
+            return len(report_data)
 
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["اسم الموظف", "نوع الإجازة", "من تاريخ", "إلى تاريخ", "عدد الأيام", "السبب", "الحالة",
-                                 "تاريخ الطلب"])
-                for row in report_data:
-                    writer.writerow(row)
-            messagebox.showinfo("تم", f"تم حفظ تقرير الإجازات في: {file_path}")
-            self.update_status("تم إنشاء تقرير الإجازات بنجاح")
-        except Exception as e:
-            messagebox.showerror("خطأ في التقرير", f"حدث خطأ أثناء حفظ التقرير: {e}")
+        self._run_report(export, file_path, "تقرير الإجازات", "لا توجد بيانات إجازات.",
+                         f"تم حفظ تقرير الإجازات في: {file_path}", "تم إنشاء تقرير الإجازات بنجاح")
 
     def generate_salary_report(self):
         """إنشاء تقرير شامل للرواتب"""
@@ -2150,26 +3226,18 @@ class HRApp(tk.Tk):
         JOIN employees e ON s.employee_id = e.id
         ORDER BY s.year DESC, s.month DESC, e.full_name ASC
         """
-        report_data = self.execute_db(query, fetch=True)
-
-        if not report_data:
-            messagebox.showinfo("تقرير الرواتب", "لا توجد بيانات رواتب.")
-            return
 
-        try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(
-                    ["اسم الموظف", "الشهر", "السنة", "الراتب الأساسي", "المكافآت", "الخصومات", "صافي الراتب",
-                     "تاريخ الدفع"])
-                for row in report_data:
-                    writer.writerow(row)
-            messagebox.showinfo("تم", f"تم حفظ تقرير الرواتب في: {file_path}")
-            self.update_status("تم إنشاء تقرير الرواتب بنجاح")
-        except Exception as e:
-            messagebox.showerror("خطأ في التقرير", f"حدث خطأ أثناء حفظ التقرير: {e}")
+        def export():
+            report_data = database.get_manager().execute(query, fetch=True)
+            if report_data:
+                self.write_csv(file_path,
+                               ["اسم الموظف", "الشهر", "السنة", "الراتب الأساسي", "المكافآت", "الخصومات",
+                                "صافي الراتب", "تاريخ الدفع"],
+                               report_data)
+            return len(report_data)
 
-        return frame
+        self._run_report(export, file_path, "تقرير الرواتب", "لا توجد بيانات رواتب.",
+                         f"تم حفظ تقرير الرواتب في: {file_path}", "تم إنشاء تقرير الرواتب بنجاح")
 
     # ---------------- تبويب الإعدادات المحسن -----------------
     def create_settings_tab(self):
@@ -2189,6 +3257,9 @@ class HRApp(tk.Tk):
                                   pady=5)
         self.db_name_label = tk.Label(general_settings_frame, text=DB_NAME, font=('Arial', 10), bg='white')
         self.db_name_label.grid(row=0, column=0, sticky='e', pady=5)
+        self.db_profile_label = tk.Label(general_settings_frame, text="", font=('Arial', 10),
+                                         bg='white', fg=COLORS['secondary'])
+        self.db_profile_label.grid(row=0, column=3, sticky='e', padx=10, pady=5)
 
         tk.Button(general_settings_frame, text="فتح مجلد قاعدة البيانات", command=self.open_db_folder,
                   bg=COLORS['secondary'], fg='white', font=('Arial', 10, 'bold')).grid(row=0, column=2, padx=10, pady=5)
@@ -2196,6 +3267,81 @@ class HRApp(tk.Tk):
                   bg=COLORS['danger'], fg='white', font=('Arial', 10, 'bold')).grid(row=1, column=0, columnspan=3,
                                                                                     pady=10)
 
+        # ملف أداء قاعدة البيانات (يحفظ في ملف الإعدادات)
+        tk.Label(general_settings_frame, text="ملف الأداء:", font=('Arial', 10, 'bold'), bg='white').grid(row=2,
+                                                                                                     column=1,
+                                                                                                     sticky='e',
+                                                                                                     pady=5)
+        self.db_profile_var = tk.StringVar()
+        ttk.Combobox(general_settings_frame, textvariable=self.db_profile_var, state="readonly", width=15,
+                     values=list(database.PERFORMANCE_PROFILES)).grid(row=2, column=0, sticky='e', pady=5)
+        tk.Button(general_settings_frame, text="تطبيق ملف الأداء", command=self.change_db_profile,
+                  bg=COLORS['secondary'], fg='white', font=('Arial', 10, 'bold')).grid(row=2, column=2, padx=10,
+                                                                                       pady=5)
+        self.refresh_db_profile_label()
+
+        # سلامة قاعدة البيانات
+        integrity_frame = tk.LabelFrame(frame, text="سلامة قاعدة البيانات", bg='white', relief='raised', bd=1,
+                                        padx=10, pady=10)
+        integrity_frame.pack(fill='x', padx=10, pady=10)
+
+        tk.Label(integrity_frame, text="آخر فحص:", font=('Arial', 10, 'bold'), bg='white').grid(row=0, column=1,
+                                                                                              sticky='e', pady=5)
+        self.integrity_label = tk.Label(integrity_frame, text="", font=('Arial', 10), bg='white')
+        self.integrity_label.grid(row=0, column=0, sticky='e', pady=5)
+        self.integrity_button = tk.Button(integrity_frame, text="فحص كامل الآن",
+                                          command=lambda: self.run_full_integrity_check(manual=True),
+                                          bg=COLORS['secondary'], fg='white', font=('Arial', 10, 'bold'))
+        self.integrity_button.grid(row=0, column=2, padx=10, pady=5)
+        self.refresh_integrity_label()
+
+        # النسخ الاحتياطي والاستعادة
+        backup_frame = tk.LabelFrame(frame, text="النسخ الاحتياطي", bg='white', relief='raised', bd=1,
+                                     padx=10, pady=10)
+        backup_frame.pack(fill='x', padx=10, pady=10)
+
+        tk.Label(backup_frame, text="الحالة:", font=('Arial', 10, 'bold'), bg='white').grid(row=0, column=1,
+                                                                                         sticky='e', pady=5)
+        self.backup_status_label = tk.Label(backup_frame, text="", font=('Arial', 10), bg='white')
+        self.backup_status_label.grid(row=0, column=0, sticky='e', pady=5)
+        self.backup_button = tk.Button(backup_frame, text="نسخة احتياطية الآن",
+                                       command=lambda: self.start_backup(manual=True),
+                                       bg=COLORS['secondary'], fg='white', font=('Arial', 10, 'bold'))
+        self.backup_button.grid(row=0, column=2, padx=10, pady=5)
+
+        self.backup_listbox = tk.Listbox(backup_frame, height=5, font=('Arial', 10))
+        self.backup_listbox.grid(row=1, column=0, columnspan=3, sticky='ew', padx=5, pady=5)
+        backup_frame.columnconfigure(0, weight=1)
+
+        tk.Button(backup_frame, text="استعادة النسخة المحددة", command=self.restore_selected_backup,
+                  bg=COLORS['danger'], fg='white', font=('Arial', 10, 'bold')).grid(row=2, column=0, columnspan=3,
+                                                                                    pady=5)
+        self.backup_paths = []
+        self.refresh_backup_list()
+
+        # أداء الاستعلامات: أكثر الاستعلامات استهلاكاً للوقت منذ بدء التشغيل
+        stats_frame = tk.LabelFrame(frame, text="أداء الاستعلامات", bg='white', relief='raised', bd=1,
+                                    padx=10, pady=10)
+        stats_frame.pack(fill='x', padx=10, pady=10)
+
+        columns = ('المصدر', 'الاستعلام', 'المرات', 'الإجمالي (ms)', 'المتوسط (ms)', 'الأقصى (ms)', 'الصفوف')
+        self.query_stats_tree = ttk.Treeview(stats_frame, columns=columns, show='headings', height=6)
+        widths = (140, 360, 60, 90, 90, 90, 70)
+        for col, width in zip(columns, widths):
+            self.query_stats_tree.heading(col, text=col)
+            self.query_stats_tree.column(col, width=width, anchor='center' if width < 200 else 'w')
+        self.query_stats_tree.grid(row=0, column=0, columnspan=3, sticky='ew', pady=5)
+        stats_frame.columnconfigure(0, weight=1)
+
+        threshold = database.get_query_stats().settings['slow_query_ms']
+        tk.Label(stats_frame, text=f"الاستعلامات الأبطأ من {threshold:g} ms تُسجل في سجل الاستعلامات البطيئة",
+                 font=('Arial', 9), bg='white').grid(row=1, column=0, sticky='e', pady=5)
+        tk.Button(stats_frame, text="تحديث", command=self.refresh_query_stats,
+                  bg=COLORS['primary'], fg='white', font=('Arial', 10, 'bold')).grid(row=1, column=2, padx=5)
+        tk.Button(stats_frame, text="تصفير", command=self.reset_query_stats,
+                  bg=COLORS['warning'], fg='white', font=('Arial', 10, 'bold')).grid(row=1, column=1, padx=5)
+        self.refresh_query_stats()
+
         # إعدادات المستخدمين (المسؤولين)
         admin_settings_frame = tk.LabelFrame(frame, text="إدارة حسابات المسؤولين", bg='white', relief='raised', bd=1,
                                              padx=10, pady=10)
@@ -2251,26 +3397,209 @@ class HRApp(tk.Tk):
         except Exception as e:
             messagebox.showerror("خطأ", f"لا يمكن فتح المجلد: {e}")
 
+    def refresh_db_profile_label(self):
+        """عرض ملف الأداء النشط وإعدادات SQLite الفعلية"""
+        manager = database.get_manager()
+        manager.connection()  # التأكد من تطبيق الإعدادات على الاتصال
+        effective = manager.effective_pragmas
+        journal = str(effective.get('journal_mode', '')).upper()
+        self.db_profile_label.config(text=f"ملف الأداء: {manager.profile_name} ({journal})")
+        self.db_profile_var.set(manager.profile_name)
+
+    def change_db_profile(self):
+        """حفظ ملف الأداء المختار وإعادة فتح الاتصالات لتطبيقه"""
+        profile = self.db_profile_var.get()
+        if not profile:
+            return
+        try:
+            database.save_performance_profile(profile)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("خطأ", f"تعذر حفظ ملف الأداء: {e}")
+            return
+        database.close_connections()
+        self.refresh_db_profile_label()
+        self.update_status(f"تم تطبيق ملف الأداء {profile}")
+
+    def refresh_integrity_label(self):
+        """عرض نتيجة آخر فحص سلامة مسجل"""
+        history = database.integrity_history(limit=1)
+        if not history:
+            self.integrity_label.config(text="لم يتم الفحص بعد", fg=COLORS['dark'])
+            return
+        checked_at, mode, ok, result, duration_ms = history[0]
+        mode_text = "كامل" if mode == "full" else "سريع"
+        status_text = "سليمة" if ok else "يوجد تلف"
+        self.integrity_label.config(text=f"{checked_at} ({mode_text}) - {status_text} - {duration_ms} ms",
+                                    fg=COLORS['success'] if ok else COLORS['danger'])
+
+    def schedule_integrity_check(self):
+        """جدولة الفحص الكامل الدوري لقاعدة البيانات"""
+        interval_ms = int(database.INTEGRITY_CHECK_INTERVAL_HOURS * 3600 * 1000)
+        self.after(interval_ms, self._scheduled_integrity_check)
+
+    def _scheduled_integrity_check(self):
+        self.run_full_integrity_check()
+        self.schedule_integrity_check()
+
+    def run_full_integrity_check(self, manual=False):
+        """تشغيل فحص السلامة الكامل في الخلفية دون إيقاف الاستعلامات العادية"""
+        if self.integrity_job is not None and self.integrity_job.is_alive():
+            if manual:
+                messagebox.showinfo("فحص السلامة", "يوجد فحص قيد التنفيذ بالفعل.")
+            return
+        self.integrity_job = database.IntegrityCheckJob(full=True)
+        self.integrity_job.start()
+        if hasattr(self, 'integrity_button'):
+            self.integrity_button.config(state='disabled')
+        self.update_status("جاري فحص سلامة قاعدة البيانات...")
+        self.after(500, lambda: self._poll_integrity_check(manual))
+
+    def _poll_integrity_check(self, manual):
+        if self.integrity_job.is_alive():
+            self.after(500, lambda: self._poll_integrity_check(manual))
+            return
+        result = self.integrity_job.result
+        if hasattr(self, 'integrity_button'):
+            self.integrity_button.config(state='normal')
+            self.refresh_integrity_label()
+        if result is None:
+            return
+        if not result["ok"]:
+            messagebox.showerror("فحص السلامة",
+                                 f"تم اكتشاف تلف في قاعدة البيانات:\n{result['result'][:500]}")
+        elif manual:
+            messagebox.showinfo("فحص السلامة",
+                                f"قاعدة البيانات سليمة ({result['duration_ms']} ms)")
+        self.update_status("اكتمل فحص سلامة قاعدة البيانات")
+
+    def refresh_backup_list(self):
+        """عرض النسخ الاحتياطية المتوفرة من الأحدث إلى الأقدم"""
+        backups = database.list_backups()
+        self.backup_paths = [path for path, _, _ in backups]
+        self.backup_listbox.delete(0, tk.END)
+        for path, size, modified in backups:
+            self.backup_listbox.insert(
+                tk.END, f"{os.path.basename(path)}  ({size / (1024 * 1024):.1f} MB - {modified:%Y-%m-%d %H:%M})")
+        if backups and not (self.backup_job and self.backup_job.is_alive()):
+            self.backup_status_label.config(text=f"آخر نسخة: {backups[0][2]:%Y-%m-%d %H:%M}")
+
+    def schedule_backup(self):
+        """جدولة النسخ الاحتياطي الدوري أثناء عمل التطبيق"""
+        interval_hours = database.load_backup_settings()["interval_hours"]
+        if interval_hours > 0:
+            self.after(int(interval_hours * 3600 * 1000), self._scheduled_backup)
+
+    def _scheduled_backup(self):
+        self.start_backup()
+        self.schedule_backup()
+
+    def start_backup(self, manual=False):
+        """إنشاء نسخة احتياطية في الخلفية دون منع المستخدمين من العمل"""
+        if self.backup_job is not None and self.backup_job.is_alive():
+            if manual:
+                messagebox.showinfo("النسخ الاحتياطي", "يوجد نسخ احتياطي قيد التنفيذ بالفعل.")
+            return
+        self.backup_progress = (0, 0)
+        self.backup_job = database.BackgroundJob(database.backup_database, progress=self._on_backup_progress)
+        self.backup_job.start()
+        if hasattr(self, 'backup_button'):
+            self.backup_button.config(state='disabled')
+        self.after(500, lambda: self._poll_backup(manual))
+
+    def _on_backup_progress(self, copied, total):
+        # يستدعى من خيط النسخ؛ يخزن التقدم فقط وتعرضه حلقة الواجهة
+        self.backup_progress = (copied, total)
+
+    def _poll_backup(self, manual):
+        copied, total = self.backup_progress
+        if self.backup_job.is_alive():
+            if total and hasattr(self, 'backup_status_label'):
+                self.backup_status_label.config(text=f"جاري النسخ... {copied * 100 // total}%")
+            self.after(500, lambda: self._poll_backup(manual))
+            return
+        if hasattr(self, 'backup_button'):
+            self.backup_button.config(state='normal')
+            self.refresh_backup_list()
+        if self.backup_job.error is not None:
+            messagebox.showerror("النسخ الاحتياطي", f"فشل إنشاء النسخة الاحتياطية: {self.backup_job.error}")
+            return
+        self.update_status(f"تم إنشاء نسخة احتياطية: {os.path.basename(self.backup_job.result)}")
+        if manual:
+            messagebox.showinfo("النسخ الاحتياطي", f"تم إنشاء النسخة الاحتياطية والتحقق منها:\n{self.backup_job.result}")
+
+    def restore_selected_backup(self):
+        """استعادة قاعدة البيانات من النسخة الاحتياطية المحددة"""
+        selection = self.backup_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("تنبيه", "يرجى اختيار نسخة احتياطية للاستعادة.")
+            return
+        if self.backup_job is not None and self.backup_job.is_alive():
+            messagebox.showwarning("تنبيه", "انتظر حتى ينتهي النسخ الاحتياطي الجاري.")
+            return
+        backup_path = self.backup_paths[selection[0]]
+        if not messagebox.askyesno("تأكيد الاستعادة",
+                                   f"سيتم استبدال البيانات الحالية بمحتوى النسخة:\n{os.path.basename(backup_path)}\n"
+                                   "سيتم حفظ نسخة من البيانات الحالية قبل الاستعادة. هل تريد المتابعة؟"):
+            return
+
+        self.shutdown_database()
+        try:
+            database.restore_database(backup_path)
+        except Exception as e:
+            messagebox.showerror("خطأ في الاستعادة", str(e))
+        finally:
+            self.db_worker = database.DatabaseWorker()
+
+        self.refresh_employees()
+        self.refresh_attendance()
+        self.refresh_leaves()
+        self.refresh_salaries()
+        self.refresh_employees_combobox()
+        self.refresh_admin_list()
+        self.refresh_backup_list()
+        self.update_status(f"تمت الاستعادة من {os.path.basename(backup_path)}")
+
+    def refresh_query_stats(self):
+        """عرض أكثر الاستعلامات استهلاكاً للوقت الإجمالي"""
+        self.query_stats_tree.delete(*self.query_stats_tree.get_children())
+        for source, statement, calls, total_ms, max_ms, rows, plan in database.get_query_stats().top(20):
+            self.query_stats_tree.insert('', tk.END, values=(
+                source, statement if plan is None else f"{statement}  [{plan}]", calls,
+                f"{total_ms:.1f}", f"{total_ms / calls:.2f}", f"{max_ms:.1f}", rows))
+
+    def reset_query_stats(self):
+        """تصفير إحصاءات الاستعلامات لقياس أثر تعديل ما من جديد"""
+        database.get_query_stats().reset()
+        self.refresh_query_stats()
+
     def reset_database(self):
         """إعادة ضبط قاعدة البيانات (حذف وإعادة إنشاء الجداول)"""
         if messagebox.askyesno("تأكيد إعادة الضبط",
                                "هل أنت متأكد من رغبتك في إعادة ضبط قاعدة البيانات؟\nسيؤدي هذا إلى حذف جميع البيانات الحالية ولا يمكن التراجع عنه!"):
             try:
-                conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-                c = conn.cursor()
-
-                # Drop all tables
-                c.execute("DROP TABLE IF EXISTS employees")
-                c.execute("DROP TABLE IF EXISTS attendance")
-                c.execute("DROP TABLE IF EXISTS leaves")
-                c.execute("DROP TABLE IF EXISTS salaries")
-                c.execute("DROP TABLE IF EXISTS admin")
-                conn.commit()
-                conn.close()
+                with database.get_manager().transaction() as conn:
+                    c = conn.cursor()
+
+                    # Drop all tables
+                    c.execute("DROP TABLE IF EXISTS employees_fts")
+                    c.execute("DROP TABLE IF EXISTS employee_changes")
+                    c.execute("DROP TABLE IF EXISTS table_versions")
+                    c.execute("DROP TABLE IF EXISTS daily_attendance_summary")
+                    c.execute("DROP TABLE IF EXISTS employee_shifts")
+                    c.execute("DROP TABLE IF EXISTS leave_counters")
+                    c.execute("DROP TABLE IF EXISTS leave_balances")
+                    c.execute("DROP TABLE IF EXISTS leave_ledger")
+                    c.execute("DROP TABLE IF EXISTS shifts")
+                    c.execute("DROP TABLE IF EXISTS employees")
+                    c.execute("DROP TABLE IF EXISTS attendance")
+                    c.execute("DROP TABLE IF EXISTS leaves")
+                    c.execute("DROP TABLE IF EXISTS salaries")
+                    c.execute("DROP TABLE IF EXISTS payroll_runs")
+                    c.execute("DROP TABLE IF EXISTS admin")
+                    c.execute("PRAGMA user_version = 0")
 
                 # Re-initialize database (creates tables and default admin)
-                self.init_database()
-                self.create_default_admin()  # Recreate default admin after dropping tables
+                database.init_db()
 
                 messagebox.showinfo("تم", "تمت إعادة ضبط قاعدة البيانات بنجاح.")
                 self.refresh_employees()
@@ -2310,24 +3639,24 @@ class HRApp(tk.Tk):
         password_hash = hashlib.sha256(password.encode()).hexdigest()
 
         try:
-            conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-            c = conn.cursor()
+            with database.get_manager().transaction() as conn:
+                c = conn.cursor()
+
+                # Check if admin exists
+                c.execute("SELECT id FROM admin WHERE username = ?", (username,))
+                existing_admin = c.fetchone()
 
-            # Check if admin exists
-            c.execute("SELECT id FROM admin WHERE username = ?", (username,))
-            existing_admin = c.fetchone()
+                if existing_admin:
+                    # Update existing admin
+                    c.execute("UPDATE admin SET password = ? WHERE id = ?", (password_hash, existing_admin[0]))
+                else:
+                    # Add new admin
+                    c.execute("INSERT INTO admin (username, password) VALUES (?, ?)", (username, password_hash))
 
             if existing_admin:
-                # Update existing admin
-                c.execute("UPDATE admin SET password = ? WHERE id = ?", (password_hash, existing_admin[0]))
                 messagebox.showinfo("تم", f"تم تحديث كلمة مرور المسؤول '{username}' بنجاح.")
             else:
-                # Add new admin
-                c.execute("INSERT INTO admin (username, password) VALUES (?, ?)", (username, password_hash))
                 messagebox.showinfo("تم", f"تم إضافة المسؤول '{username}' بنجاح.")
-
-            conn.commit()
-            conn.close()
             self.admin_username_entry.delete(0, tk.END)
             self.admin_password_entry.delete(0, tk.END)
             self.admin_confirm_password_entry.delete(0, tk.END)
@@ -2358,75 +3687,19 @@ class HRApp(tk.Tk):
 
 
 if __name__ == '__main__':
-    # تهيئة قاعدة البيانات عند بدء تشغيل التطبيق
-    # (هذا سيتم استدعاؤه أيضاً في HRApp.__init__ ولكن يمكن أن يكون هنا لتشغيل مستقل للتحقق)
-    try:
-        conn = database.safe_connect() if hasattr(database, 'safe_connect') else sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS admin (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL
-            )
-        """)
-        # Create other tables if running without HRApp (e.g., for direct DB management)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                position TEXT,
-                salary REAL,
-                hire_date TEXT,
-                email TEXT UNIQUE,
-                phone TEXT,
-                address TEXT,
-                employee_code TEXT UNIQUE
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                check_in TEXT,
-                check_out TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS leaves (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                days INTEGER NOT NULL,
-                reason TEXT,
-                status TEXT NOT NULL DEFAULT 'معلق',
-                request_date TEXT NOT NULL,
-                FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS salaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                month TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                basic_salary REAL NOT NULL,
-                bonuses REAL DEFAULT 0,
-                deductions REAL DEFAULT 0,
-                net_salary REAL NOT NULL,
-                payment_date TEXT NOT NULL,
-                FOREIGN KEY (employee_id) REFERENCES employees(id) ON DELETE CASCADE,
-                UNIQUE(employee_id, month, year)
-            )
-        """)
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error creating tables on startup: {e}")
+    # فحص سريع لسلامة قاعدة البيانات عند بدء التشغيل
+    startup_result = database.startup_check()
+
+    # تهيئة قاعدة البيانات وتطبيق الترقيات عند بدء تشغيل التطبيق
+    database.init_db()
 
     login_app = LoginWindow()
+    recovery = startup_result.get("recovery")
+    if recovery:
+        # إبلاغ المستخدم بنتيجة استرجاع البيانات من الملف التالف
+        login_app.after(100, lambda: messagebox.showwarning(
+            "استرجاع قاعدة البيانات",
+            f"تم اكتشاف تلف في قاعدة البيانات.\n"
+            f"تم استرجاع {recovery['recovered']} سجل من الملف التالف.\n"
+            f"التقرير: {recovery['source']}.recovery.txt"))
     login_app.mainloop()
\ No newline at end of file